@@ -2,7 +2,13 @@
 from __future__ import unicode_literals
 
 import abc
-from file_scraper.utils import metadata, is_metadata
+import os
+from bisect import bisect_right
+from io import open as io_open
+
+from file_scraper.exceptions import SkipElementException
+from file_scraper.utils import (checkpoint_matches, is_metadata,
+                                make_checkpoint, metadata)
 
 
 class BaseScraper(object):
@@ -32,6 +38,7 @@ class BaseScraper(object):
         self._errors = []
         self._tools = []
         self._params = params if params is not None else {}
+        self.checkpoint = None
 
     @property
     def well_formed(self):
@@ -68,6 +75,63 @@ class BaseScraper(object):
         return any([x.is_supported(mimetype, version) for x in
                     cls._supported_metadata])
 
+    @classmethod
+    def preload_batch(cls, filenames):  # pylint: disable=unused-argument
+        """
+        Run the tool of the scraper once for several files.
+
+        Scrapers using a command line tool which accepts several files per
+        run override this. The output of the run is split back to the
+        results of the files, which are preloaded to Shell, so that
+        scrape_file does not need to run the tool again. Files with output
+        that can not be split are left to be run one by one.
+
+        :filenames: List of file paths
+        """
+        return
+
+    def _checkpoint_offset(self, boundary=None):
+        """
+        Return the offset from which the validation can be resumed.
+
+        Scrapers of append-only formats with record boundaries validate
+        only the data appended after the checkpoint parameter, if it
+        matches the file, see file_scraper.utils.make_checkpoint(). The
+        validated prefix must also end at a record boundary.
+
+        :boundary: Bytes ending a record, None if not checked
+        :returns: Offset of the checkpoint, or 0 to validate the whole file
+        """
+        checkpoint = self._params.get("checkpoint", None)
+        if checkpoint is None:
+            return 0
+        if checkpoint_matches(self.filename, checkpoint):
+            offset = int(checkpoint["offset"])
+            ends_to_boundary = boundary is None
+            if not ends_to_boundary and offset >= len(boundary):
+                with io_open(self.filename, "rb") as infile:
+                    infile.seek(offset - len(boundary))
+                    ends_to_boundary = infile.read(len(boundary)) == boundary
+            if ends_to_boundary:
+                self._messages.append("Validation is resumed from the "
+                                      "checkpoint at offset %s." % offset)
+                return offset
+        self._messages.append("Checkpoint does not match the file, the "
+                              "whole file is validated.")
+        return 0
+
+    def _update_checkpoint(self, offset=None):
+        """
+        Set a new checkpoint for the file, if it is well-formed.
+
+        :offset: Offset up to which the file was validated, None for the
+                 file size
+        """
+        if self.well_formed:
+            if offset is None:
+                offset = os.path.getsize(self.filename)
+            self.checkpoint = make_checkpoint(self.filename, offset)
+
     def _check_supported(self, allow_unav_mime=False,
                          allow_unav_version=False,
                          allow_unap_version=False):
@@ -250,6 +314,179 @@ class BaseMeta(object):
         """Return the dict containing supported mimetypes and versions."""
         return cls._supported
 
+    def frame_count(self):
+        """
+        Return the number of consecutive streams represented by the model.
+
+        :returns: 1
+        """
+        return 1
+
+
+class FrameMeta(object):
+    """
+    Metadata of a run of consecutive frames with identical metadata.
+
+    The metadata values of a frame are collected from its metadata model
+    when the frame is read, so the frame itself can be released right after
+    that. Following frames with identical metadata only extend the run.
+    """
+
+    def __init__(self, md_object, frame_count=1):
+        """
+        Collect the metadata values of the given metadata model.
+
+        :md_object: Metadata model of the first frame of the run
+        :frame_count: Number of frames in the run
+        """
+        self._md_class = md_object.__class__
+        self._frame_index = md_object.index()
+        self._frame_count = frame_count
+        self._methods = {}
+        for method in md_object.iterate_metadata_methods():
+            if method.__name__ == "index":
+                continue
+            try:
+                self._methods[method.__name__] = _metadata_value(
+                    method, method())
+            except SkipElementException:
+                continue
+        self._values = sorted((name, method()) for name, method
+                              in self._methods.items())
+
+    def __getattr__(self, name):
+        """Return metadata method of the given name."""
+        try:
+            return self.__dict__["_methods"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @metadata()
+    def index(self):
+        """Return the index of the first frame of the run."""
+        return self._frame_index
+
+    def frame_count(self):
+        """Return the number of frames in the run."""
+        return self._frame_count
+
+    def iterate_metadata_methods(self):
+        """Iterate through all metadata methods."""
+        yield self.index
+        for name in sorted(self._methods):
+            yield self._methods[name]
+
+    def extend(self, run):
+        """
+        Extend the run with the given run, if the runs are identical.
+
+        :run: FrameMeta instance following this run
+        :returns: True if the run was extended, False otherwise
+        """
+        if run._md_class is not self._md_class or \
+                run._values != self._values or \
+                run.index() != self._frame_index + self._frame_count:
+            return False
+        self._frame_count += run.frame_count()
+        return True
+
+    def frame(self, index):
+        """
+        Return the metadata of a single frame of the run.
+
+        :index: Index of the frame
+        :returns: FrameMeta instance for the frame
+        """
+        frame = FrameMeta.__new__(FrameMeta)
+        frame.__dict__.update(self.__dict__)
+        frame._frame_index = index
+        frame._frame_count = 1
+        return frame
+
+
+class FrameStreams(object):
+    """
+    Metadata models of image frames, collapsed to runs of identical frames.
+
+    The frames behave like a list of metadata models, one for each frame.
+    The runs are expanded to frames only when the frames are accessed.
+    """
+
+    def __init__(self):
+        """Initialize empty frame streams."""
+        self._runs = []
+        self._positions = []
+        self._length = 0
+
+    def append(self, md_object, frame_count=1):
+        """
+        Add metadata model of the next frame or frames.
+
+        :md_object: Metadata model of the frame
+        :frame_count: Number of identical frames represented by the model
+        """
+        run = FrameMeta(md_object, frame_count)
+        if not self._runs or not self._runs[-1].extend(run):
+            self._runs.append(run)
+            self._positions.append(self._length)
+        self._length += frame_count
+
+    def runs(self):
+        """
+        Return the runs of identical frames.
+
+        :returns: List of FrameMeta instances
+        """
+        return self._runs[:]
+
+    def __len__(self):
+        """Return the number of frames."""
+        return self._length
+
+    def __bool__(self):
+        """Return True if there are frames, False otherwise."""
+        return self._length > 0
+
+    __nonzero__ = __bool__
+
+    def __getitem__(self, position):
+        """
+        Return the metadata model of the frame in the given position.
+
+        :position: Position of the frame
+        :returns: FrameMeta instance for the frame
+        :raises: IndexError if there is no frame in the position
+        """
+        if position < 0:
+            position += self._length
+        if position < 0 or position >= self._length:
+            raise IndexError("Frame position out of range.")
+        run_index = bisect_right(self._positions, position) - 1
+        run = self._runs[run_index]
+        return run.frame(
+            run.index() + position - self._positions[run_index])
+
+    def __iter__(self):
+        """Iterate the metadata models of all frames."""
+        for run in self._runs:
+            for index in range(run.index(), run.index() + run.frame_count()):
+                yield run.frame(index)
+
+
+def _metadata_value(method, value):
+    """
+    Create a metadata method returning the given value.
+
+    :method: Original metadata method
+    :value: Value returned by the original method
+    :returns: Metadata method with the name and importance of the original
+    """
+    def _value():
+        """Return the collected metadata value."""
+        return value
+    _value.__name__ = method.__name__
+    return metadata(important=method.is_important)(_value)
+
 
 class BaseDetector(object):
     """Class to identify file format."""
@@ -8,6 +8,7 @@ import json
 import click
 
 from file_scraper.scraper import Scraper
+from file_scraper.schematron.schematron_scraper import warm_cache
 
 
 @click.group()
@@ -85,6 +86,36 @@ def scrape_file(ctx, filename, check_wellformed, tool_info, mimetype, version):
     click.echo(json.dumps(results, indent=4))
 
 
+@cli.command("warm-cache")
+@click.argument("schematrons", nargs=-1, required=True,
+                type=click.Path(exists=True))
+@click.option("--verbose", default=False, is_flag=True,
+              help="Compile the schematrons for verbose output")
+@click.option("--extra-hash", default=None,
+              help="Hash of the files called by the schematrons")
+@click.option("--cache-path", default=None,
+              help="Directory of the compiled schematrons")
+def warm_schematron_cache(schematrons, verbose, extra_hash, cache_path):
+    """
+    Compile schematron files to the cache before scraping files.
+    \f
+
+    :schematrons: Paths to the schematron files
+    :verbose: Flag whether the schematrons are compiled for verbose output
+    :extra_hash: Hash of the files called by the schematrons
+    :cache_path: Directory of the compiled schematrons
+    """
+    try:
+        xslt_filenames = warm_cache(schematrons, verbose=verbose,
+                                    extra_hash=extra_hash,
+                                    cache_path=cache_path)
+    except Exception as exception:
+        raise click.ClickException(str(exception))
+
+    for xslt_filename in xslt_filenames:
+        click.echo(xslt_filename)
+
+
 def _extra_options_to_dict(args):
     """
     Create a dict from the extra options and return it.
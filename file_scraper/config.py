@@ -13,3 +13,12 @@ PSPP_PATH = "/usr/bin/pspp-convert"
 SCHEMATRON_DIRNAME = "/usr/share/iso_schematron_xslt1"
 VERAPDF_PATH = "/usr/share/java/verapdf/verapdf"
 VNU_PATH = "/usr/share/java/vnu/vnu.jar"
+XML_CATALOG_PATH = "/etc/xml/catalog"
+
+# Resource limits in bytes for ImageMagick used through Wand. Pixel cache
+# exceeding the memory limit is moved to memory mapped files and then to the
+# disk. Exceeding the disk limit fails the scraping instead of exhausting
+# the resources of the host.
+WAND_RESOURCE_LIMITS = {"memory": 2 * 1024**3,
+                        "map": 4 * 1024**3,
+                        "disk": 16 * 1024**3}
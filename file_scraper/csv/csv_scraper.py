@@ -2,22 +2,34 @@
 from __future__ import unicode_literals
 
 import csv
+import io
+import locale
+import os
 from io import open as io_open
 
 import six
 
 from file_scraper.base import BaseScraper
 from file_scraper.csv.csv_model import CsvMeta
+from file_scraper.utils import map_in_processes
 
 
 class CsvScraper(BaseScraper):
     """Scraper for CSV files."""
 
     _supported_metadata = [CsvMeta]
+    _parallel_size = 1024**3  # Validate larger files in parallel
+    _chunksize = 64*1024**2  # Approximate size of a range in parallel
+    _processes = None  # Number of processes, None = CPU count
 
     # pylint: disable=too-many-branches
     def scrape_file(self):
-        """Scrape CSV file."""
+        """
+        Scrape CSV file.
+
+        The dialect is sniffed from the first block of the file. Without
+        well-formed check, only the first record is read.
+        """
 
         fields = self._params.get("fields", [])
         charset = self._params.get("charset", None)
@@ -31,6 +43,7 @@ class CsvScraper(BaseScraper):
 
         try:
             csvfile = self._open_csv_file(charset)
+            size = os.fstat(csvfile.fileno()).st_size
 
             delimiter = self._params.get("delimiter", None)
             separator = self._params.get("separator", None)
@@ -64,31 +77,46 @@ class CsvScraper(BaseScraper):
             else:
                 first_line = first_row
 
-            if fields and len(fields) != len(first_line):
-                self._errors.append(
-                    "CSV not well-formed: field counts in the given "
-                    "header parameter and the CSV header don't match."
-                )
+            # Only the first record is needed for metadata, the rest of the
+            # file is read in well-formed check
+            if self._params.get("check_wellformed", True):
+                if fields and len(fields) != len(first_line):
+                    self._errors.append(
+                        "CSV not well-formed: field counts in the given "
+                        "header parameter and the CSV header don't match."
+                    )
 
-            # Read the whole file in case it contains errors. If there
-            # are any, an exception will be raised, triggering
-            # recording an error
-            for _ in reader:
-                pass
+                # Read the whole file in case it contains errors. If there
+                # are any, an exception will be raised, triggering
+                # recording an error
+                start = 0
+                if self._ascii_compatible(charset):
+                    start = self._checkpoint_offset(b"\n")
+                if start:
+                    self._validate_appended(start, size, charset, delimiter,
+                                            separator)
+                elif self._parallel(charset):
+                    self._validate_parallel(charset, delimiter, separator)
+                else:
+                    for _ in reader:
+                        pass
 
         except IOError as err:
             self._errors.append("Error when reading the file: " +
                                 six.text_type(err))
         except csv.Error as exception:
             if reader is not None:
-                self._errors.append("CSV error on line %s: %s" %
-                                    (reader.line_num, exception))
+                self._errors.append("CSV error on line %s: %s" % (
+                    getattr(exception, "line_num", reader.line_num),
+                    exception))
             else:
                 self._errors.append("CSV error: %s" % exception)
         except (UnicodeError, UnicodeDecodeError, StopIteration) as exception:
             self._errors.append("Error reading file as CSV: %s" % exception)
         else:
             self._messages.append("CSV file was checked successfully.")
+            if self._params.get("check_wellformed", True):
+                self._update_checkpoint(size)
         finally:
             if csvfile:
                 csvfile.close()
@@ -111,3 +139,213 @@ class CsvScraper(BaseScraper):
         if six.PY2:
             return io_open(self.filename, "rb")
         return io_open(self.filename, "rt", encoding=charset)
+
+    def _parallel(self, charset):
+        """
+        Return True if the file should be validated in parallel.
+
+        Large files are validated in parallel, if the record boundaries can
+        be found from the bytes, i.e. the character encoding is compatible
+        with ASCII.
+
+        :charset: File encoding
+        :returns: True for parallel validation, False otherwise
+        """
+        if os.path.getsize(self.filename) <= self._parallel_size:
+            return False
+        return self._ascii_compatible(charset)
+
+    @staticmethod
+    def _ascii_compatible(charset):
+        """
+        Return True if the record boundaries can be found from the bytes.
+
+        :charset: File encoding
+        :returns: True if the encoding is compatible with ASCII
+        """
+        if charset is None:
+            charset = locale.getpreferredencoding(False)
+        return charset.upper().replace("_", "-") in [
+            "UTF-8", "UTF8", "ASCII", "US-ASCII", "ISO-8859-15",
+            "ISO8859-15", "LATIN-9", "ISO-8859-1", "ISO8859-1", "LATIN-1"]
+
+    def _validate_appended(self, start, end, charset, delimiter, separator):
+        """
+        Validate the records appended after a checkpoint.
+
+        The appended data is streamed through the reader, see
+        validate_range().
+
+        :start: Offset of the checkpoint
+        :end: End of the appended data
+        :charset: File encoding
+        :delimiter: Field delimiter
+        :separator: Record separator
+        :raises: csv.Error with the line number counted from the checkpoint
+        """
+        (error, line_num) = validate_range(self.filename, start, end,
+                                           charset, delimiter, separator)
+        if error is not None:
+            raise CsvRangeError(
+                "%s (line number counted from the checkpoint)" % error,
+                line_num)
+
+    def _validate_parallel(self, charset, delimiter, separator):
+        """
+        Validate the file in byte ranges in parallel processes.
+
+        The ranges end to record boundaries, so that each range can be
+        validated separately with the same dialect.
+
+        :charset: File encoding
+        :delimiter: Field delimiter
+        :separator: Record separator
+        :raises: csv.Error with the global line number of the first error
+        """
+        ranges = find_record_ranges(self.filename, self._chunksize)
+        arguments = [(self.filename, start, end, charset, delimiter,
+                      separator) for (start, end, _) in ranges]
+        results = map_in_processes(validate_range, arguments,
+                                   self._processes)
+
+        for ((_, _, lines_before), (error, line_num)) in zip(ranges,
+                                                             results):
+            if error is not None:
+                raise CsvRangeError(error, lines_before + line_num)
+
+
+class CsvRangeError(csv.Error):
+    """CSV error found in parallel validation of a range."""
+
+    def __init__(self, message, line_num):
+        """
+        Initialize the error.
+
+        :message: Error message
+        :line_num: Line number of the error in the file
+        """
+        super(CsvRangeError, self).__init__(message)
+        self.line_num = line_num
+
+
+def find_record_ranges(filename, chunksize, blocksize=1024**2):
+    """
+    Split a CSV file to byte ranges ending at record boundaries.
+
+    The record boundaries are the line feeds outside quoted fields. These
+    are found by keeping track of the parity of the quote characters in
+    the file, as the escaped quote characters are doubled.
+
+    :filename: File name
+    :chunksize: Approximate size of a range
+    :blocksize: Size of the block to read at once
+    :returns: List of (start, end, lines before start) tuples
+    """
+    ranges = []
+    start = 0
+    lines = 0
+    start_lines = 0
+    target = chunksize
+    parity = 0
+    block_start = 0
+    with io_open(filename, "rb") as infile:
+        while True:
+            block = infile.read(blocksize)
+            if not block:
+                break
+            index = 0
+            while index < len(block):
+                if block_start + len(block) <= target:
+                    parity ^= block.count(b'"', index) & 1
+                    lines += block.count(b"\n", index)
+                    break
+                if block_start + index < target:
+                    skip_to = target - block_start
+                    parity ^= block.count(b'"', index, skip_to) & 1
+                    lines += block.count(b"\n", index, skip_to)
+                    index = skip_to
+                newline = block.find(b"\n", index)
+                if newline < 0:
+                    parity ^= block.count(b'"', index) & 1
+                    break
+                parity ^= block.count(b'"', index, newline) & 1
+                lines += 1
+                index = newline + 1
+                if parity == 0:
+                    end = block_start + index
+                    ranges.append((start, end, start_lines))
+                    start = end
+                    start_lines = lines
+                    target = end + chunksize
+            block_start += len(block)
+    if start < block_start or not ranges:
+        ranges.append((start, block_start, start_lines))
+    return ranges
+
+
+def validate_range(filename, start, end, charset, delimiter, separator):
+    """
+    Validate a byte range of a CSV file.
+
+    :filename: File name
+    :start: Start of the range
+    :end: End of the range
+    :charset: File encoding
+    :delimiter: Field delimiter
+    :separator: Record separator
+    :returns: Tuple (error, line number in the range), where error is None
+              if the range is valid
+    :raises: UnicodeError if the range can not be decoded
+    """
+    with io_open(filename, "rb") as infile:
+        infile.seek(start)
+        rangefile = io.BufferedReader(_RangeFile(infile, end))
+        if not six.PY2:
+            rangefile = io.TextIOWrapper(rangefile, encoding=charset)
+        reader = csv.reader(rangefile, delimiter=str(delimiter),
+                            lineterminator=separator, strict=True,
+                            doublequote=True)
+        try:
+            for _ in reader:
+                pass
+        except csv.Error as exception:
+            return (six.text_type(exception), reader.line_num)
+    return (None, reader.line_num)
+
+
+class _RangeFile(io.RawIOBase):
+    """
+    Raw file reading an open file up to the end of a byte range.
+
+    The range is read in buffered blocks and decoded incrementally, so
+    that a range of any size is validated with bounded memory use.
+    """
+
+    def __init__(self, infile, end):
+        """
+        Initialize the range.
+
+        :infile: Binary file positioned to the start of the range
+        :end: End of the range
+        """
+        super(_RangeFile, self).__init__()
+        self._infile = infile
+        self._end = end
+
+    def readable(self):
+        """Return True, as the range can be read."""
+        return True
+
+    def readinto(self, buffer):
+        """
+        Read data of the range into a buffer.
+
+        :buffer: Writable buffer
+        :returns: Number of bytes read, 0 at the end of the range
+        """
+        size = min(len(buffer), self._end - self._infile.tell())
+        if size <= 0:
+            return 0
+        data = self._infile.read(size)
+        buffer[:len(data)] = data
+        return len(data)
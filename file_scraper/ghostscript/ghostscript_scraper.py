@@ -7,9 +7,16 @@ versions 1.7, A-2a, A-2b, A-2u, A-3a, A-3b and A-3u.
 from __future__ import unicode_literals
 
 from file_scraper.base import BaseScraper
-from file_scraper.shell import Shell
+from file_scraper.shell import Shell, preload
 from file_scraper.ghostscript.ghostscript_model import GhostscriptMeta
-from file_scraper.utils import ensure_text, encode_path
+from file_scraper.utils import ensure_text, encode_path, iter_batches
+
+GS_COMMAND = ["gs", "-o", "/dev/null", "-sDEVICE=nullpage"]
+BATCH_MARKER = b"@@file-scraper-batch %d@@\n"
+
+# PostScript writing the batch marker to both stdout and stderr
+BATCH_MARKER_PS = "(%%stdout) (w) file dup (%s) writestring flushfile " \
+                  "(%%stderr) (w) file dup (%s) writestring flushfile"
 
 
 class GhostscriptScraper(BaseScraper):
@@ -18,12 +25,11 @@ class GhostscriptScraper(BaseScraper):
     # Supported mimetype and versions
     _supported_metadata = [GhostscriptMeta]
     _only_wellformed = True   # Only well-formed check
+    _batch_size = 20  # Maximum number of files in one Ghostscript run
 
     def scrape_file(self):
         """Scrape file."""
-        shell = Shell([
-            "gs", "-o", "/dev/null", "-sDEVICE=nullpage",
-            encode_path(self.filename)])
+        shell = Shell(GS_COMMAND + [encode_path(self.filename)])
 
         # Ghostscript may print characters which cannot be converted to UTF-8
         stdout_message = ensure_text(shell.stdout_raw, errors='replace')
@@ -63,3 +69,49 @@ class GhostscriptScraper(BaseScraper):
                     "**** warning" in message.lower()):
                 return False
         return super(GhostscriptScraper, self).well_formed
+
+    @classmethod
+    def preload_batch(cls, filenames):
+        """
+        Run Ghostscript once for several files.
+
+        A marker is written to stdout and stderr before each file and after
+        the last one, and the output is split by the markers. The output
+        given before the first file, such as the banner, is included in the
+        output of every file. If Ghostscript fails, the files of the batch
+        are left to be run one by one.
+
+        :filenames: List of file paths
+        """
+        for batch in iter_batches(filenames, cls._batch_size):
+            paths = [encode_path(filename) for filename in batch]
+            command = list(GS_COMMAND)
+            for index, path in enumerate(paths):
+                command += ["-c", _marker_ps(index), "-f", path]
+            command += ["-c", _marker_ps(len(paths))]
+            shell = Shell(command)
+            if shell.returncode != 0:
+                continue
+            stdout = shell.stdout_raw.split(BATCH_MARKER % 0, 1)
+            stderr = shell.stderr_raw.split(BATCH_MARKER % 0, 1)
+            if len(stdout) < 2 or len(stderr) < 2:
+                continue
+            for index, path in enumerate(paths):
+                marker = BATCH_MARKER % (index + 1)
+                if marker not in stdout[1] or marker not in stderr[1]:
+                    break
+                file_stdout, stdout[1] = stdout[1].split(marker, 1)
+                file_stderr, stderr[1] = stderr[1].split(marker, 1)
+                preload(GS_COMMAND + [path], 0, stdout[0] + file_stdout,
+                        stderr[0] + file_stderr)
+
+
+def _marker_ps(index):
+    """
+    Return PostScript code writing the batch marker of the given index.
+
+    :index: Index of the marker
+    :returns: PostScript code as byte string
+    """
+    marker = (BATCH_MARKER % index).decode("ascii").replace("\n", "\\n")
+    return (BATCH_MARKER_PS % (marker, marker)).encode("ascii")
@@ -22,7 +22,7 @@ from file_scraper.magic_scraper.magic_scraper import (MagicTextScraper,
                                                       MagicBinaryScraper)
 from file_scraper.mediainfo.mediainfo_scraper import MediainfoScraper
 from file_scraper.office.office_scraper import OfficeScraper
-from file_scraper.pil.pil_scraper import PilScraper
+from file_scraper.pil.pil_scraper import PilDecodeScraper, PilScraper
 from file_scraper.pngcheck.pngcheck_scraper import PngcheckScraper
 from file_scraper.pspp.pspp_scraper import PsppScraper
 from file_scraper.schematron.schematron_scraper import SchematronScraper
@@ -69,10 +69,10 @@ def iter_scrapers(mimetype, version, check_wellformed=True, params=None):
         GhostscriptScraper, JHoveGifScraper, JHoveHtmlScraper,
         JHoveJpegScraper, JHovePdfScraper, JHoveTiffScraper,
         JHoveWavScraper, LxmlScraper, MagicTextScraper, MagicBinaryScraper,
-        MediainfoScraper, OfficeScraper, PilScraper, PngcheckScraper,
-        PsppScraper, SchematronScraper, TextfileScraper, TextEncodingScraper,
-        TextEncodingMetaScraper, VerapdfScraper, VnuScraper, WandScraper,
-        XmllintScraper]
+        MediainfoScraper, OfficeScraper, PilScraper, PilDecodeScraper,
+        PngcheckScraper, PsppScraper, SchematronScraper, TextfileScraper,
+        TextEncodingScraper, TextEncodingMetaScraper, VerapdfScraper,
+        VnuScraper, WandScraper, XmllintScraper]
 
     for scraper in scrapers:
         if scraper.is_supported(mimetype, version, check_wellformed, params):
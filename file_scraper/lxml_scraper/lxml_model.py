@@ -11,27 +11,27 @@ class LxmlMeta(BaseMeta):
     # We use JHOVE for XHTML files.
     _supported = {"text/xml": ["1.0"], "text/html": ["4.01", "5.0"]}
 
-    def __init__(self, tree):
+    def __init__(self, docinfo):
         """
         Initialize the metadata class.
 
-        :tree: etree parsed from the file that is being scraped
+        :docinfo: Document information of the file that is being scraped
         """
-        self._tree = tree
+        self._docinfo = docinfo
 
     @metadata()
     def version(self):
         """Return version."""
-        if "<!DOCTYPE html>" in self._tree.docinfo.doctype:
+        if "<!DOCTYPE html>" in self._docinfo.doctype:
             return "5.0"
-        if "HTML 4.01" in self._tree.docinfo.doctype:
+        if "HTML 4.01" in self._docinfo.doctype:
             return "4.01"
         return "(:unav)"
 
     @metadata()
     def charset(self):
         """Return charset."""
-        return self._tree.docinfo.encoding
+        return self._docinfo.encoding
 
     # pylint: disable=no-self-use
     @metadata()
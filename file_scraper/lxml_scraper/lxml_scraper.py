@@ -1,6 +1,8 @@
 """Class for XML and HTML5 header encoding check with lxml. """
 from __future__ import unicode_literals
 
+import re
+
 try:
     from lxml import etree
 except ImportError:
@@ -8,6 +10,10 @@ except ImportError:
 
 from file_scraper.base import BaseScraper
 from file_scraper.lxml_scraper.lxml_model import LxmlMeta
+from file_scraper.utils import iter_xml_events
+
+XML_DECLARATION = re.compile(br"^(\xef\xbb\xbf)?<\?xml\s")
+META_CHARSET = re.compile(r"charset\s*=\s*[\"']?([^\s\"';]+)", re.I)
 
 
 class LxmlScraper(BaseScraper):
@@ -16,6 +22,7 @@ class LxmlScraper(BaseScraper):
     # We use JHOVE for HTML4 and XHTML files.
     _supported_metadata = [LxmlMeta]
     _only_wellformed = True  # Only well-formed check
+    _prolog_size = 4096  # Size of the beginning of the file to parse
 
     @classmethod
     def is_supported(cls, mimetype, version=None,
@@ -42,13 +49,18 @@ class LxmlScraper(BaseScraper):
                                                     check_wellformed, params)
 
     def scrape_file(self):
-        """Scrape file."""
-        parser = etree.XMLParser(dtd_validation=False, no_network=True,
-                                 recover=True)
-        with open(self.filename, "rb") as file_:
-            tree = etree.parse(file_, parser)
+        """
+        Scrape file.
+
+        The document information is taken from the prolog in the beginning
+        of the file. Only if the root element is not found from there, the
+        whole file is scanned with a streaming parser.
+        """
+        docinfo = self._prolog_docinfo()
+        if docinfo is None:
+            docinfo = self._scan_docinfo()
 
-        self.streams = list(self.iterate_models(tree=tree))
+        self.streams = list(self.iterate_models(docinfo=docinfo))
 
         # Only log success message if at least one metadata model was added to
         # streams. Check that it corresponds to given charset.
@@ -67,12 +79,86 @@ class LxmlScraper(BaseScraper):
 
         self._check_supported(allow_unav_mime=True, allow_unav_version=True)
 
+    def _prolog_docinfo(self):
+        """
+        Return the document information from the beginning of the file.
+
+        The beginning of the file is parsed with a recovering parser. For
+        HTML files without XML declaration, the character encoding is taken
+        from a meta element, if there is one.
+
+        :returns: Document information, None if the root element does not
+                  start in the beginning of the file
+        """
+        with open(self.filename, "rb") as file_:
+            prolog = file_.read(self._prolog_size)
+        parser = etree.XMLParser(dtd_validation=False, no_network=True,
+                                 recover=True)
+        try:
+            parser.feed(prolog)
+            root = parser.close()
+        except etree.XMLSyntaxError:
+            return None
+        if root is None:
+            return None
+        docinfo = root.getroottree().docinfo
+        encoding = docinfo.encoding
+        if self._meta_allowed(prolog):
+            encoding = _meta_charset(root.iter(tag=etree.Element)) or \
+                encoding
+        return _Docinfo(docinfo.xml_version, encoding, docinfo.doctype)
+
+    def _scan_docinfo(self):
+        """
+        Return the document information scanned from the whole file.
+
+        The file is parsed with a recovering streaming parser, as the
+        prolog, so that the memory use stays bounded. For HTML files without
+        XML declaration, the character encoding is taken from the first meta
+        element giving it.
+
+        :returns: Document information, None if the root element is not
+                  found
+        """
+        with open(self.filename, "rb") as file_:
+            meta_allowed = self._meta_allowed(file_.read(64))
+        parser = etree.XMLPullParser(
+            events=("start", "end"), dtd_validation=False, no_network=True,
+            recover=True, huge_tree=True)
+        root = None
+        meta_encoding = None
+        try:
+            for event, element in iter_xml_events(parser, self.filename):
+                if event != "start":
+                    continue
+                if root is None:
+                    root = element
+                if meta_allowed and meta_encoding is None:
+                    meta_encoding = _meta_charset([element])
+        except etree.XMLSyntaxError:
+            pass
+        if root is None:
+            return None
+        docinfo = root.getroottree().docinfo
+        return _Docinfo(docinfo.xml_version,
+                        meta_encoding or docinfo.encoding, docinfo.doctype)
+
+    def _meta_allowed(self, prolog):
+        """
+        Return True if the encoding may be given in HTML meta element.
+
+        :prolog: Beginning of the file
+        :returns: True for HTML files without XML declaration
+        """
+        return self._predefined_mimetype == "text/html" and \
+            not XML_DECLARATION.match(prolog)
+
     def iterate_models(self, **kwargs):
         """
         Iterate metadata models.
 
         It is possible that for files that are not well-formed, trying
-        to use tree.docinfo causes an AssertionError. In that case we
+        to use docinfo causes an AssertionError. In that case we
         shouldn't add a stream at all, but instead log an error. Only if
         all metadata methods work normally, should the stream be added.
 
@@ -97,3 +183,40 @@ class LxmlScraper(BaseScraper):
                                         "information could not be gathered.")
                 else:
                     yield md_model
+
+
+class _Docinfo(object):
+    """Document information read from the prolog."""
+
+    def __init__(self, xml_version, encoding, doctype):
+        """
+        Initialize the document information.
+
+        :xml_version: XML version
+        :encoding: Character encoding
+        :doctype: Document type declaration
+        """
+        self.xml_version = xml_version
+        self.encoding = encoding
+        self.doctype = doctype
+
+
+def _meta_charset(elements):
+    """
+    Return the character encoding given in HTML meta element.
+
+    :elements: Iterable of the elements of the HTML document
+    :returns: Character encoding, None if not found
+    """
+    for element in elements:
+        if etree.QName(element).localname.lower() != "meta":
+            continue
+        attributes = dict((key.lower(), value)
+                          for (key, value) in element.attrib.items())
+        if "charset" in attributes:
+            return attributes["charset"].strip()
+        if attributes.get("http-equiv", "").lower() == "content-type":
+            match = META_CHARSET.search(attributes.get("content", ""))
+            if match:
+                return match.group(1)
+    return None
@@ -27,6 +27,67 @@ def pcm_mimetype(codec_name, bits_per_sample):
     raise ValueError("Not a PCM stream.")
 
 
+class MediainfoTracks(object):
+    """
+    Track information of a single file, shared by all metadata models.
+
+    MediaInfo returns the tracks of a file as a list, where the first track
+    is the general track. The metadata models need the same information of
+    the track list repeatedly, so it is resolved once here.
+    """
+
+    def __init__(self, tracks):
+        """
+        Initialize track information.
+
+        :tracks: list of tracks from MediaInfo
+        """
+        self.tracks = tracks
+        self.general = tracks[0]
+        self.codec_names = [track.format for track in tracks]
+        self.track_types = {}
+        for index, track in enumerate(tracks):
+            self.track_types.setdefault(track.track_type, []).append(index)
+        self._containers = {}
+
+    def __len__(self):
+        """Return the number of tracks."""
+        return len(self.tracks)
+
+    def __getitem__(self, index):
+        """Return track with the given index."""
+        return self.tracks[index]
+
+    def __iter__(self):
+        """Iterate tracks."""
+        return iter(self.tracks)
+
+    def hascontainer(self, containers):
+        """
+        Find out if file is a video container.
+
+        The result is cached for each set of container formats.
+
+        :containers: Container formats of the metadata model
+        :returns: True if the file is a video container, False otherwise
+        """
+        key = tuple(containers)
+        if key not in self._containers:
+            self._containers[key] = (self.codec_names[0] in containers or
+                                     len(self.tracks) >= 3)
+        return self._containers[key]
+
+    def tracks_of_type(self, track_type):
+        """
+        Return tracks of the given type.
+
+        :track_type: Track type, e.g. "Video" or "Audio"
+        :returns: List of tracks
+        """
+        return [self.tracks[index] for index in
+                self.track_types.get(track_type, [])]
+
+
 class BaseMediainfoMeta(BaseMeta):
     """Metadata models for files scraped using MediainfoScraper"""
     # pylint: disable=too-many-public-methods
@@ -39,26 +100,26 @@ class BaseMediainfoMeta(BaseMeta):
         """
         Initialize the metadata model.
 
-        :tracks: list of tracks containing all tracks in the file
+        :tracks: MediainfoTracks instance or list of tracks containing all
+                 tracks in the file
         :index: index of the track represented by this metadata model
         """
         # pylint: disable=too-many-arguments
+        if not isinstance(tracks, MediainfoTracks):
+            tracks = MediainfoTracks(tracks)
         self._stream = tracks[index]
         self._tracks = tracks
-        if self.hascontainer():
+        self._track_index = index
+        self._hascontainer = tracks.hascontainer(self._containers)
+        if self._hascontainer:
             self._index = index
-            self.container_stream = tracks[0]
+            self.container_stream = tracks.general
         else:
             self._index = index - 1
 
     def hascontainer(self):
         """Find out if file is a video container."""
-        if self._tracks[0].format in self._containers:
-            return True
-        if len(self._tracks) < 3:
-            return False
-
-        return True
+        return self._hascontainer
 
     @metadata()
     def mimetype(self):
@@ -81,7 +142,7 @@ class BaseMediainfoMeta(BaseMeta):
     def stream_type(self):
         """Return stream type."""
         if self._stream.track_type == "General":
-            if self.hascontainer():
+            if self._hascontainer:
                 return "videocontainer"
         return self._stream.track_type.lower()
 
@@ -191,11 +252,11 @@ class BaseMediainfoMeta(BaseMeta):
         """Return "Yes" if sound channels are present, otherwise "No"."""
         if self.stream_type() not in ["video"]:
             raise SkipElementException()
-        if (self._tracks[0].count_of_audio_streams is not None and
-                int(self._tracks[0].count_of_audio_streams) > 0):
+        if (self._tracks.general.count_of_audio_streams is not None and
+                int(self._tracks.general.count_of_audio_streams) > 0):
             return "Yes"
-        if (self._tracks[0].audio_count is not None and
-                int(self._tracks[0].audio_count) > 0):
+        if (self._tracks.general.audio_count is not None and
+                int(self._tracks.general.audio_count) > 0):
             return "Yes"
         return "No"
 
@@ -262,8 +323,8 @@ class BaseMediainfoMeta(BaseMeta):
         """Returns creator application."""
         if self.stream_type() not in ["video", "audio", "videocontainer"]:
             raise SkipElementException()
-        if self._tracks[0].writing_application is not None:
-            return self._tracks[0].writing_application
+        if self._tracks.general.writing_application is not None:
+            return self._tracks.general.writing_application
         return "(:unav)"
 
     @metadata()
@@ -271,9 +332,9 @@ class BaseMediainfoMeta(BaseMeta):
         """Returns creator application version."""
         if self.stream_type() not in ["video", "audio", "videocontainer"]:
             raise SkipElementException()
-        if self._tracks[0].writing_application is not None:
+        if self._tracks.general.writing_application is not None:
             reg = re.search(r"([\d.]+)$",
-                            self._tracks[0].writing_application)
+                            self._tracks.general.writing_application)
             if reg is not None:
                 return reg.group(1)
         return "(:unav)"
@@ -283,8 +344,8 @@ class BaseMediainfoMeta(BaseMeta):
         """Returns codec name."""
         if self.stream_type() not in ["video", "audio", "videocontainer"]:
             raise SkipElementException()
-        if self._stream.format is not None:
-            return self._stream.format
+        if self._tracks.codec_names[self._track_index] is not None:
+            return self._tracks.codec_names[self._track_index]
         return "(:unav)"
 
     @metadata()
@@ -456,15 +517,15 @@ class WavMediainfoMeta(BaseMediainfoMeta):
 
     @metadata()
     def mimetype(self):
-        if self._tracks[0].format == "Wave":
+        if self._tracks.codec_names[0] == "Wave":
             return "audio/x-wav"
         return "(:unav)"
 
     @metadata()
     def version(self):
         """Returns version."""
-        if self._tracks[0].bext_present is not None \
-                and self._tracks[0].bext_present == "Yes":
+        if self._tracks.general.bext_present is not None \
+                and self._tracks.general.bext_present == "Yes":
             return "2"
         return "(:unap)"
 
@@ -525,19 +586,16 @@ class MpegMediainfoMeta(BaseMediainfoMeta):
         except SkipElementException:
             pass
         except KeyError:
-            for track in self._tracks:
-                try:
-                    if track.track_type == "Video":
-                        if self.codec_name() == "MPEG-TS":
-                            if track.format_version == "Version 2":
-                                return "video/MP2T"
-                        if self.codec_name() == "MPEG-PS":
-                            if track.format_version == "Version 2":
-                                return "video/MP2P"
-                            if track.format_version == "Version 1":
-                                return "video/MP1S"
-                except SkipElementException:
-                    pass
+            codec_name = self.codec_name()
+            for track in self._tracks.tracks_of_type("Video"):
+                if codec_name == "MPEG-TS":
+                    if track.format_version == "Version 2":
+                        return "video/MP2T"
+                if codec_name == "MPEG-PS":
+                    if track.format_version == "Version 2":
+                        return "video/MP2P"
+                    if track.format_version == "Version 1":
+                        return "video/MP1S"
 
         return "(:unav)"
 
@@ -5,6 +5,8 @@ import six
 
 from file_scraper.base import BaseScraper
 from file_scraper.mediainfo.mediainfo_model import (
+    BaseMediainfoMeta,
+    MediainfoTracks,
     MkvMediainfoMeta,
     MovMediainfoMeta,
     MpegMediainfoMeta,
@@ -47,9 +49,11 @@ class MediainfoScraper(BaseScraper):
         else:
             self._messages.append("The file was analyzed successfully.")
 
-        for index in range(len(mediainfo.tracks)):
+        # Track information is resolved once and shared by all models
+        tracks = MediainfoTracks(mediainfo.tracks)
+        for index in range(len(tracks)):
             self.streams += list(self.iterate_models(
-                tracks=mediainfo.tracks, index=index))
+                tracks=tracks, index=index))
 
         # Files scraped with SimpleMediainfoMeta will have (:unav) MIME type,
         # but for other scrapes the tests need to be performed without allowing
@@ -63,9 +67,19 @@ class MediainfoScraper(BaseScraper):
     def iterate_models(self, **kwargs):
         """
         Iterate metadata models.
+
+        The general track is represented by a model only if the file is a
+        container. This is known from the shared track information, so the
+        models are not created needlessly.
         """
+        # pylint: disable=protected-access
         for md_class in self._supported_metadata:
             if md_class.is_supported(self._predefined_mimetype):
+                if kwargs["index"] == 0 and \
+                        issubclass(md_class, BaseMediainfoMeta) and \
+                        not kwargs["tracks"].hascontainer(
+                            md_class._containers):
+                    continue
                 md_object = md_class(**kwargs)
                 if md_object.hascontainer() or kwargs["index"] > 0:
                     yield md_object
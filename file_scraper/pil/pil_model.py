@@ -217,3 +217,16 @@ class JpegPilMeta(BasePilMeta):
         if exif_info and SAMPLES_PER_PIXEL_TAG in exif_info.keys():
             return six.text_type(exif_info[SAMPLES_PER_PIXEL_TAG])
         return super(JpegPilMeta, self).samples_per_pixel()
+
+
+class PilDecodeMeta(BaseMeta):
+    """Metadata model for the decode check of tiff and png images."""
+
+    _supported = {"image/tiff": [], "image/png": []}
+    _allow_versions = True
+
+    # pylint: disable=no-self-use
+    @metadata()
+    def stream_type(self):
+        """We do not need to resolve stream type."""
+        return "(:unav)"
@@ -1,17 +1,35 @@
 """Metadata scraper for image file formats."""
 from __future__ import unicode_literals
 
+import os
+import struct
+import zlib
+from io import open as io_open
+
 import six
 
-from file_scraper.base import BaseScraper
+from file_scraper.base import BaseScraper, FrameStreams
 from file_scraper.pil.pil_model import ImagePilMeta, JpegPilMeta, \
-    TiffPilMeta, Jp2PilMeta
+    TiffPilMeta, Jp2PilMeta, PilDecodeMeta
 
 try:
     import PIL.Image
 except ImportError:
     pass
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Start column, start row, column step and row step of Adam7 passes
+ADAM7_PASSES = [(0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4),
+                (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2)]
+TIFF_UNCOMPRESSED = 1
+TIFF_LZW = 5
+TIFF_DEFLATE = [8, 32946]
+TIFF_PACKBITS = 32773
+LZW_CLEAR = 256
+LZW_END = 257
+LZW_MAX_BITS = 12
+
 
 class PilScraper(BaseScraper):
     """Scraper that uses PIL to scrape tiff, png, jpeg and gif images."""
@@ -22,10 +40,7 @@ class PilScraper(BaseScraper):
     def scrape_file(self):
         """Scrape data from file."""
         try:
-            # Raise the size limit to around a gigabyte for a 3 bpp image
-            PIL.Image.MAX_IMAGE_PIXELS = int(1024 * 1024 * 1024 // 3)
-
-            pil = PIL.Image.open(self.filename)
+            pil = open_headers(self.filename)
         except Exception as e:  # pylint: disable=invalid-name, broad-except
             self._errors.append("Error in analyzing file.")
             self._errors.append(six.text_type(e))
@@ -40,8 +55,459 @@ class PilScraper(BaseScraper):
             # the tile tries to extend outside of image.
             n_frames = 1
 
-        for pil_index in range(0, n_frames):
-            self.streams += list(
-                self.iterate_models(pil=pil, index=pil_index))
+        # The metadata is read from the image as it was opened, so it is
+        # identical for all the frames, which are collapsed to a single run.
+        self.streams = FrameStreams()
+        for md_object in self.iterate_models(pil=pil, index=0):
+            self.streams.append(md_object, frame_count=n_frames)
 
         self._check_supported(allow_unav_version=True)
+
+
+class PilDecodeScraper(BaseScraper):
+    """
+    Scraper that checks that tiff and png image data can be decoded.
+
+    The image data is walked through strip by strip, tile by tile or row by
+    row, so that truncated or broken data is found also in very large images
+    without keeping the whole raster in memory. The image headers are read
+    with PIL. Uncompressed and Deflate compressed image data is decoded.
+    LZW and PackBits compressed image data is decoded in pure Python, which
+    is slow for large images, and only if decode_check parameter is "full".
+    For other compression methods it is only checked that the data is found
+    in the file, and this is told in the messages. The scraper is used only
+    if decode_check parameter is given.
+    """
+
+    _supported_metadata = [PilDecodeMeta]
+    _only_wellformed = True
+    _chunksize = 1024**2  # Maximum size of data to read or decompress
+
+    @classmethod
+    def is_supported(cls, mimetype, version=None,
+                     check_wellformed=True, params=None):
+        """
+        Return True if the MIME type and version are supported.
+
+        We use this scraper only if decode check is requested.
+
+        :mimetype: Identified mimetype
+        :version: Identified version (if needed)
+        :check_wellformed: True for the full well-formed check, False for just
+                           detection and metadata scraping
+        :params: Extra parameters needed for the scraper
+        :returns: True if scraper is supported
+        """
+        if params is None:
+            params = {}
+        if not params.get("decode_check", False):
+            return False
+        return super(PilDecodeScraper, cls).is_supported(
+            mimetype, version, check_wellformed, params)
+
+    def scrape_file(self):
+        """Decode the image data."""
+        try:
+            pil = open_headers(self.filename)
+            try:
+                if pil.format == "PNG":
+                    self._check_png()
+                else:
+                    self._check_tiff(pil)
+            finally:
+                pil.close()
+        except Exception as e:  # pylint: disable=invalid-name, broad-except
+            self._errors.append("Error in decoding image data.")
+            self._errors.append(six.text_type(e))
+        else:
+            self._messages.append("The image data was decoded successfully.")
+
+        self.streams = list(self.iterate_models())
+        self._check_supported(allow_unav_mime=True, allow_unav_version=True)
+
+    def _check_png(self):
+        """
+        Decode png image data row by row.
+
+        :raises: ValueError if the image data can not be decoded
+        """
+        rows = None
+        with io_open(self.filename, "rb") as infile:
+            if infile.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                raise ValueError("PNG signature not found.")
+            while True:
+                header = infile.read(8)
+                if len(header) < 8:
+                    _truncated(rows)
+                length, chunk_type = struct.unpack(">I4s", header)
+                if rows is None and chunk_type != b"IHDR":
+                    raise ValueError("IHDR chunk not found.")
+                crc = zlib.crc32(chunk_type)
+                try:
+                    for data in _iter_data(infile, infile.tell(), length,
+                                           self._chunksize):
+                        crc = zlib.crc32(data, crc)
+                        if chunk_type == b"IHDR":
+                            rows = _PngRows(data, self._chunksize)
+                        elif chunk_type == b"IDAT":
+                            rows.feed(data)
+                except EOFError:
+                    _truncated(rows)
+                stored_crc = infile.read(4)
+                if len(stored_crc) < 4 or \
+                        struct.unpack(">I", stored_crc)[0] != \
+                        crc & 0xffffffff:
+                    raise ValueError(
+                        "CRC error in %s chunk." %
+                        chunk_type.decode("ascii", "replace"))
+                if chunk_type == b"IEND":
+                    break
+        rows.finish()
+
+    def _check_tiff(self, pil):
+        """
+        Decode tiff image data strip by strip or tile by tile.
+
+        :pil: PIL image
+        :raises: ValueError if the image data can not be decoded
+        """
+        filesize = os.path.getsize(self.filename)
+        full = self._params.get("decode_check") == "full"
+        unsupported = set()
+        with io_open(self.filename, "rb") as infile:
+            for frame in range(getattr(pil, "n_frames", 1)):
+                pil.seek(frame)
+                compression = pil.tag_v2.get(259, TIFF_UNCOMPRESSED)
+                for index, (offset, count, size) in enumerate(
+                        _iter_tiff_strips(pil.tag_v2)):
+                    try:
+                        if offset + count > filesize:
+                            raise ValueError("Data is truncated.")
+                        chunks = _iter_data(infile, offset, count,
+                                            self._chunksize)
+                        if compression == TIFF_UNCOMPRESSED:
+                            decoded = count
+                        elif compression in TIFF_DEFLATE:
+                            decoded = _inflated_size(chunks, self._chunksize)
+                        elif compression == TIFF_LZW and full:
+                            decoded = _lzw_size(chunks)
+                        elif compression == TIFF_PACKBITS and full:
+                            decoded = _packbits_size(chunks)
+                        else:
+                            unsupported.add(compression)
+                            continue
+                        if decoded < size:
+                            raise ValueError(
+                                "Expected %s bytes of image data, found %s."
+                                % (size, decoded))
+                    except (ValueError, EOFError, zlib.error) as error:
+                        raise ValueError(
+                            "Decoding failed in strip or tile %s of frame "
+                            "%s: %s" % (index, frame, error))
+        for compression in sorted(unsupported):
+            if compression in [TIFF_LZW, TIFF_PACKBITS]:
+                self._messages.append(
+                    "Image data with compression %s is decoded only in full "
+                    "decode check, only the presence of the image data was "
+                    "checked." % compression)
+            else:
+                self._messages.append(
+                    "Decode check is not supported for compression %s, "
+                    "only the presence of the image data was checked."
+                    % compression)
+
+
+def open_headers(filename):
+    """
+    Open an image with PIL for reading its headers.
+
+    The scrapers never let PIL decode the pixel data, so the decompression
+    bomb check of PIL is not needed when opening very large images. The
+    limit is lifted only for this call and restored afterwards, so that
+    the check still applies to the other users of PIL.
+
+    :filename: Image file path
+    :returns: PIL image
+    """
+    limit = PIL.Image.MAX_IMAGE_PIXELS
+    PIL.Image.MAX_IMAGE_PIXELS = None
+    try:
+        return PIL.Image.open(filename)
+    finally:
+        PIL.Image.MAX_IMAGE_PIXELS = limit
+
+
+class _PngRows(object):
+    """Track the rows of png image data while it is decompressed."""
+
+    def __init__(self, header, chunksize):
+        """
+        Initialize the row tracking.
+
+        :header: Data of IHDR chunk
+        :chunksize: Maximum size of decompressed data at a time
+        """
+        if len(header) < 13:
+            raise ValueError("IHDR chunk is too short.")
+        (width, height, depth, color_type, _, _,
+         interlace) = struct.unpack(">IIBBBBB", header[:13])
+        if color_type not in PNG_CHANNELS:
+            raise ValueError("Unknown color type %s." % color_type)
+        bits = depth * PNG_CHANNELS[color_type]
+        if interlace:
+            sizes = [((width - x_start + x_step - 1) // x_step,
+                      (height - y_start + y_step - 1) // y_step)
+                     for (x_start, y_start, x_step, y_step) in ADAM7_PASSES]
+        else:
+            sizes = [(width, height)]
+        # Number of rows and bytes per row (with the filter type byte)
+        self._passes = [(rows, 1 + (columns * bits + 7) // 8)
+                        for (columns, rows) in sizes if columns and rows]
+        self._interlace = interlace
+        self._chunksize = chunksize
+        self._decompressor = zlib.decompressobj()
+        self._pass = 0
+        self._row = 0
+        self._offset = 0
+
+    def feed(self, data):
+        """
+        Decompress data and check the rows in it.
+
+        :data: Compressed image data
+        :raises: ValueError if the data can not be decoded
+        """
+        try:
+            while data:
+                self._count(self._decompressor.decompress(
+                    data, self._chunksize))
+                data = self._decompressor.unconsumed_tail
+        except zlib.error as error:
+            raise ValueError("Decoding failed in %s: %s"
+                             % (self._location(), error))
+
+    def finish(self):
+        """
+        Check that all the rows were found and the compressed data ended.
+
+        :raises: ValueError if image data ended too early
+        """
+        if self._pass < len(self._passes):
+            raise ValueError("Image data ends in %s." % self._location())
+        if not getattr(self._decompressor, "eof",
+                       bool(self._decompressor.unused_data)):
+            raise ValueError("Compressed image data does not end after the "
+                             "last row.")
+
+    def _count(self, data):
+        """
+        Count the rows in decompressed data.
+
+        :data: Decompressed image data
+        :raises: ValueError if the rows are broken
+        """
+        position = 0
+        while position < len(data):
+            if self._pass >= len(self._passes):
+                raise ValueError("Too much image data.")
+            rows, row_bytes = self._passes[self._pass]
+            if self._offset == 0 and six.indexbytes(data, position) > 4:
+                raise ValueError("Unknown filter type in %s."
+                                 % self._location())
+            step = min(row_bytes - self._offset, len(data) - position)
+            position += step
+            self._offset += step
+            if self._offset == row_bytes:
+                self._offset = 0
+                self._row += 1
+                if self._row == rows:
+                    self._pass += 1
+                    self._row = 0
+
+    def _location(self):
+        """Return description of the current row."""
+        if self._interlace:
+            return "row %s of interlace pass %s" % (self._row, self._pass)
+        return "row %s" % self._row
+
+
+def _iter_data(infile, offset, count, chunksize):
+    """
+    Iterate data of given size from a file in chunks.
+
+    :infile: File object
+    :offset: Start position of the data
+    :count: Size of the data
+    :chunksize: Maximum size of a chunk
+    :returns: Generator of data chunks
+    :raises: EOFError if the file ends too early
+    """
+    infile.seek(offset)
+    while count > 0:
+        data = infile.read(min(count, chunksize))
+        if not data:
+            raise EOFError("Data is truncated.")
+        count -= len(data)
+        yield data
+
+
+def _truncated(rows):
+    """
+    Report truncated png file.
+
+    :rows: Row tracking of the image data, None if not yet started
+    :raises: ValueError telling the row where the image data ends
+    """
+    if rows is not None:
+        rows.finish()
+    raise ValueError("File is truncated, IEND chunk not found.")
+
+
+def _inflated_size(chunks, chunksize):
+    """
+    Return the size of deflate compressed data when decompressed.
+
+    :chunks: Iterable of compressed data
+    :chunksize: Maximum size of decompressed data at a time
+    :returns: Size of the decompressed data
+    """
+    decompressor = zlib.decompressobj()
+    size = 0
+    for data in chunks:
+        while data:
+            size += len(decompressor.decompress(data, chunksize))
+            data = decompressor.unconsumed_tail
+    return size
+
+
+def _lzw_size(chunks):
+    """
+    Return the size of TIFF LZW compressed data when decompressed.
+
+    Only the lengths of the code table entries are tracked, since the size
+    of the decompressed data is enough to check the strip or tile.
+
+    :chunks: Iterable of compressed data
+    :returns: Size of the decompressed data
+    :raises: ValueError if an invalid code is found
+    """
+    lengths = [1] * 258
+    size = 0
+    previous = None
+    width = 9
+    buffered = 0
+    bits = 0
+    for data in chunks:
+        for byte in six.iterbytes(data):
+            buffered = (buffered << 8) | byte
+            bits += 8
+            while bits >= width:
+                bits -= width
+                code = buffered >> bits
+                buffered &= (1 << bits) - 1
+                if code == LZW_CLEAR:
+                    del lengths[258:]
+                    previous = None
+                    width = 9
+                    continue
+                if code == LZW_END:
+                    return size
+                if previous is None:
+                    if code > 255:
+                        raise ValueError("Invalid LZW code %s." % code)
+                    length = 1
+                elif code < len(lengths):
+                    length = lengths[code]
+                elif code == len(lengths):
+                    length = previous + 1
+                else:
+                    raise ValueError("Invalid LZW code %s." % code)
+                if previous is not None and \
+                        len(lengths) < 1 << LZW_MAX_BITS:
+                    lengths.append(previous + 1)
+                    if len(lengths) == (1 << width) - 1 and \
+                            width < LZW_MAX_BITS:
+                        width += 1
+                size += length
+                previous = length
+    return size
+
+
+def _packbits_size(chunks):
+    """
+    Return the size of PackBits compressed data when decompressed.
+
+    :chunks: Iterable of compressed data
+    :returns: Size of the decompressed data
+    """
+    size = 0
+    literal = 0  # Number of literal bytes still to skip
+    repeat = 0  # Number of repeats of the next byte
+    for data in chunks:
+        position = 0
+        while position < len(data):
+            if literal:
+                step = min(literal, len(data) - position)
+                literal -= step
+                position += step
+                size += step
+                continue
+            if repeat:
+                size += repeat
+                repeat = 0
+                position += 1
+                continue
+            header = six.indexbytes(data, position)
+            position += 1
+            if header < 128:
+                literal = header + 1
+            elif header > 128:
+                repeat = 257 - header
+    return size
+
+
+def _iter_tiff_strips(tags):
+    """
+    Iterate the strips or tiles of a tiff image.
+
+    :tags: TIFF tags of an image
+    :returns: Generator of (offset, byte count, decoded size) tuples
+    :raises: ValueError if the strip or tile tags are broken
+    """
+    width = tags[256]
+    height = tags[257]
+    bits = _tag_tuple(tags.get(258, 1))[0]
+    samples = tags.get(277, 1)
+    if tags.get(284, 1) == 2:  # Planar configuration, separate planes
+        pixel_bits = bits
+        planes = samples
+    else:
+        pixel_bits = bits * samples
+        planes = 1
+    if 324 in tags:
+        tile_width = tags[322]
+        tile_length = tags[323]
+        offsets = _tag_tuple(tags[324])
+        counts = _tag_tuple(tags.get(325, ()))
+        sizes = [tile_length * ((tile_width * pixel_bits + 7) // 8)] * \
+            len(offsets)
+    else:
+        rows_per_strip = min(tags.get(278, height), height)
+        offsets = _tag_tuple(tags.get(273, ()))
+        counts = _tag_tuple(tags.get(279, ()))
+        strips = (height + rows_per_strip - 1) // rows_per_strip
+        row_bytes = (width * pixel_bits + 7) // 8
+        sizes = [min(rows_per_strip, height - strip * rows_per_strip) *
+                 row_bytes for strip in range(strips)] * planes
+    if not offsets or len(offsets) != len(counts) or \
+            len(offsets) != len(sizes):
+        raise ValueError("Strip or tile offsets and byte counts do not "
+                         "match the image size.")
+    return zip(offsets, counts, sizes)
+
+
+def _tag_tuple(value):
+    """Return TIFF tag value as a tuple."""
+    if isinstance(value, tuple):
+        return value
+    return (value,)
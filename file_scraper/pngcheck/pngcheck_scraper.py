@@ -2,9 +2,9 @@
 from __future__ import unicode_literals
 
 from file_scraper.base import BaseScraper
-from file_scraper.shell import Shell
+from file_scraper.shell import Shell, preload
 from file_scraper.pngcheck.pngcheck_model import PngcheckMeta
-from file_scraper.utils import encode_path
+from file_scraper.utils import encode_path, iter_batches
 
 
 class PngcheckScraper(BaseScraper):
@@ -16,6 +16,7 @@ class PngcheckScraper(BaseScraper):
 
     _supported_metadata = [PngcheckMeta]
     _only_wellformed = True              # Only well-formed check
+    _batch_size = 100  # Maximum number of files in one pngcheck run
 
     def scrape_file(self):
         """Scrape file."""
@@ -32,3 +33,42 @@ class PngcheckScraper(BaseScraper):
         self.streams = list(self.iterate_models())
 
         self._check_supported(allow_unav_mime=True, allow_unav_version=True)
+
+    @classmethod
+    def preload_batch(cls, filenames):
+        """
+        Run pngcheck once for several files.
+
+        The output of pngcheck ends with "OK: <filename>" or
+        "ERROR: <filename>" line for each file, and the output of each file
+        is preloaded for the scraper of that file. The output can not be
+        split, if pngcheck writes anything to stderr, so then none of the
+        files in the batch are preloaded. If the result line of a file is
+        not found, that file and the following files are not preloaded.
+        The return code is common for the whole run, so the files with OK
+        result are preloaded only if the run succeeded. The files which are
+        not preloaded are run separately by their scrapers.
+
+        :filenames: List of file paths
+        """
+        for batch in iter_batches(filenames, cls._batch_size):
+            paths = [encode_path(filename) for filename in batch]
+            shell = Shell(["pngcheck"] + paths)
+            if shell.stderr_raw:
+                continue
+            lines = shell.stdout_raw.splitlines(True)
+            start = 0
+            for path in paths:
+                for end in range(start, len(lines)):
+                    if lines[end].startswith(b"OK: " + path + b" ") or \
+                            lines[end].rstrip(b"\r\n") == b"ERROR: " + path:
+                        break
+                else:
+                    break
+                if lines[end].startswith(b"ERROR: "):
+                    preload(["pngcheck", path], 2,
+                            b"".join(lines[start:end + 1]), b"")
+                elif shell.returncode == 0:
+                    preload(["pngcheck", path], 0,
+                            b"".join(lines[start:end + 1]), b"")
+                start = end + 1
@@ -1,9 +1,14 @@
 """Schematron scraper."""
 from __future__ import unicode_literals
 
+import fcntl
 import os
 import shutil
 import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import six
 
 import lxml.etree as etree
 from file_scraper.base import BaseScraper
@@ -12,12 +17,17 @@ from file_scraper.config import SCHEMATRON_DIRNAME
 from file_scraper.schematron.schematron_model import SchematronMeta
 from file_scraper.utils import encode_path, hexdigest, ensure_text
 
+SVRL = "{http://purl.oclc.org/dsdl/svrl}"
+TRANSFORM_CACHE_SIZE = 16  # Number of compiled validators kept in memory
+_TRANSFORMS = OrderedDict()
+
 
 class SchematronScraper(BaseScraper):
     """Schematron scraper."""
 
     _supported_metadata = [SchematronMeta]
     _only_wellformed = True
+    _cache_bytes = 256 * 1024**2  # Maximum size of the compiled files
 
     def __init__(self, filename, mimetype, version=None, params=None):
         """
@@ -30,10 +40,14 @@ class SchematronScraper(BaseScraper):
                  verbose: Verbose output, False by default
                  cache: Use a Cache of compiled schematron files, True by
                         default
-                 schematron: Schematron file name
+                 schematron: Schematron file name, or a list of them
                  extra_hash: Extra hash to determine if recompilation is
                              required. This can be a hash of files which are
                              called by the schematron file.
+                 cache_path: Directory of the compiled schematron files,
+                             ~/.file-scraper/schematron-cache by default
+                 svrl_path: File to write the SVRL report to, instead of
+                            keeping it in the messages, None by default
         """
         super(SchematronScraper, self).__init__(
             filename=filename, mimetype=mimetype, version=version,
@@ -42,11 +56,12 @@ class SchematronScraper(BaseScraper):
             params = {}
         self._verbose = params.get("verbose", False)
         self._cache = params.get("cache", True)
-        self._cachepath = os.path.expanduser(
-            "~/.file-scraper/schematron-cache")
-        self._returncode = None
+        self._cachepath = os.path.expanduser(params.get(
+            "cache_path", "~/.file-scraper/schematron-cache"))
         self._schematron_file = params.get("schematron", None)
         self._extra_hash = params.get("extra_hash", None)
+        self._svrl_path = params.get("svrl_path", None)
+        self._failed = False
 
     @classmethod
     def is_supported(cls, mimetype, version=None,
@@ -73,61 +88,161 @@ class SchematronScraper(BaseScraper):
     @property
     def well_formed(self):
         """Check if document resulted errors."""
-        if not self.errors() and self.messages():
+        if not self.errors() and self.messages() and not self._failed:
             if not any("<svrl:failed-assert " in message
-                       for message in self.messages()) \
-                    and self._returncode == 0:
+                       for message in self.messages()):
                 return True
         return False
 
     def scrape_file(self):
-        """Do the Schematron check."""
-        if self._schematron_file is None:
+        """
+        Do the Schematron check.
+
+        The document is transformed in-process with the compiled validator
+        XSLT, which is kept in memory for the following files. If several
+        schematron files are given, the document is parsed once and all the
+        validators are applied to it. The messages and runtime errors of
+        the transforms are added to the errors, as xsltproc would print
+        them to stderr.
+        """
+        if not self._schematron_file:
             self._errors.append("Schematron file missing from parameters.")
             return
 
-        xslt_filename = self._compile_schematron()
-
-        shell = self._compile_phase(
-            stylesheet=xslt_filename,
-            inputfile=self.filename, allowed_codes=[0, 6])
-
-        self._returncode = shell.returncode
-        if shell.stderr:
-            self._errors.append(shell.stderr)
+        if isinstance(self._schematron_file, (list, tuple)):
+            schematron_files = self._schematron_file
+        else:
+            schematron_files = [self._schematron_file]
+        transforms = [
+            self._transform(self._compile_schematron(schematron_file))
+            for schematron_file in schematron_files]
 
-        if not self._verbose and shell.returncode == 0:
-            self._messages.append(ensure_text(
-                self._filter_duplicate_elements(shell.stdout_raw)))
+        results = []
+        try:
+            document = etree.parse(encode_path(self.filename),
+                                   parser=etree.XMLParser(huge_tree=True))
+            for transform in transforms:
+                try:
+                    results.append(transform(document))
+                finally:
+                    self._errors += [entry.message
+                                     for entry in transform.error_log]
+        except (etree.XMLSyntaxError, etree.XSLTApplyError) as exception:
+            if six.text_type(exception) not in self._errors:
+                self._errors.append(six.text_type(exception))
         else:
-            self._messages.append(shell.stdout)
+            if len(results) == 1:
+                self._report(results[0])
+            else:
+                self._report(self._merge_results(schematron_files, results),
+                             filtered=True)
 
         self.streams = list(self.iterate_models(well_formed=self.well_formed))
 
         self._check_supported(allow_unav_mime=True, allow_unav_version=True)
 
+    def _report(self, result, filtered=False):
+        """
+        Report the SVRL result of the transform.
+
+        The report is added to the messages, or written directly to the
+        file given in svrl_path parameter without serializing it in memory.
+
+        :result: Result tree of the transform
+        :filtered: True if the duplicate elements are already filtered
+        """
+        root = result.getroot()
+        self._failed = root is not None and \
+            next(root.iter(SVRL + "failed-assert"), None) is not None
+        if self._svrl_path is None:
+            if self._verbose or root is None:
+                self._messages.append(ensure_text(bytes(result)))
+            elif filtered:
+                self._messages.append(ensure_text(etree.tostring(
+                    root, pretty_print=True, xml_declaration=False,
+                    encoding="UTF-8", with_comments=True)))
+            else:
+                self._messages.append(ensure_text(
+                    self._filter_duplicate_elements(root)))
+            return
+        if not self._verbose and not filtered and root is not None:
+            _remove_duplicate_elements(root)
+        result.write(self._svrl_path, pretty_print=not self._verbose,
+                     xml_declaration=False, encoding="UTF-8",
+                     with_comments=True)
+        self._messages.append("Schematron report written to %s."
+                              % self._svrl_path)
+
+    def _merge_results(self, schematron_files, results):
+        """
+        Merge the SVRL results of several rule sets.
+
+        The contents of the reports are moved to the first non-empty report
+        in the order of the schematron files, and a comment with the
+        schematron file name is added before the contents of each rule set.
+        Empty reports are skipped. Duplicate elements are filtered for each
+        rule set separately.
+
+        :schematron_files: List of schematron files
+        :results: List of result trees of the transforms
+        :returns: Result tree of the merged report
+        """
+        base = next((result for result in results
+                     if result.getroot() is not None), results[0])
+        merged = base.getroot()
+        for schematron_file, result in zip(schematron_files, results):
+            root = result.getroot()
+            if root is None:
+                continue
+            if not self._verbose:
+                _remove_duplicate_elements(root)
+            comment = etree.Comment(" Rule set: %s " % schematron_file)
+            if result is base:
+                merged.insert(0, comment)
+                continue
+            merged.append(comment)
+            for child in list(root):
+                merged.append(child)
+        return base
+
+    def _transform(self, xslt_filename):
+        """
+        Return the compiled validator XSLT as a transform.
+
+        The transforms are kept in memory keyed by the XSLT filename, which
+        contains the digest of the schematron file. At most
+        TRANSFORM_CACHE_SIZE transforms are kept, and the least recently used
+        one is removed when the cache is full. The cache is not used, if
+        the cache parameter is False.
+
+        :xslt_filename: XSLT file name
+        :returns: XSLT transform
+        """
+        if not self._cache:
+            return etree.XSLT(etree.parse(xslt_filename))
+        key = os.path.basename(xslt_filename)
+        if key in _TRANSFORMS:
+            transform = _TRANSFORMS.pop(key)
+        else:
+            transform = etree.XSLT(etree.parse(xslt_filename))
+            while len(_TRANSFORMS) >= TRANSFORM_CACHE_SIZE:
+                _TRANSFORMS.popitem(last=False)
+        _TRANSFORMS[key] = transform
+        return transform
+
     # pylint: disable=no-self-use
     def _filter_duplicate_elements(self, result):
         """
         Filter duplicate elements from the result.
 
-        :result: Result as string
+        :result: Result as string, or the root element of the result
+        :returns: Filtered result as string
         """
-        svrl = {"svrl": "http://purl.oclc.org/dsdl/svrl"}
-        root = etree.fromstring(result)
-        patterns = root.xpath("./svrl:active-pattern", namespaces=svrl)
-        for pattern in patterns:
-            prev = pattern.xpath("preceding-sibling::svrl:active-pattern[1]",
-                                 namespaces=svrl)
-            if prev and pattern.get("id") == prev[0].get("id"):
-                pattern.getparent().remove(pattern)
-
-        rules = root.xpath("svrl:fired-rule", namespaces=svrl)
-        for rule in rules:
-            prev = rule.xpath("preceding-sibling::svrl:fired-rule[1]",
-                              namespaces=svrl)
-            if prev and rule.get("context") == prev[0].get("context"):
-                rule.getparent().remove(rule)
+        if isinstance(result, six.binary_type):
+            root = etree.fromstring(result)
+        else:
+            root = result
+        _remove_duplicate_elements(root)
 
         return etree.tostring(
             root, pretty_print=True, xml_declaration=False,
@@ -161,56 +276,101 @@ class SchematronScraper(BaseScraper):
             )
         return shell
 
-    def _compile_schematron(self):
+    def _compile_schematron(self, schematron_file=None):
         """
         Compile a schematron file.
 
+        A cached XSLT file is used as such. Otherwise the schematron file is
+        compiled while holding the lock of the cache directory, so that
+        parallel processes compile the same schematron only once. After the
+        compilation, the least recently used XSLT files are removed when
+        the cache exceeds _cache_bytes.
+
+        :schematron_file: Schematron file, the one given in parameters by
+                          default
         :returns: XSLT file name
         """
-        xslt_filename = self._generate_xslt_filename()
-        tempdir = tempfile.mkdtemp()
+        if schematron_file is None:
+            schematron_file = self._schematron_file
+        xslt_filename = self._generate_xslt_filename(schematron_file)
 
-        if self._cache:
-            if os.path.isfile(xslt_filename):
+        if self._cache and _touch(xslt_filename):
+            return xslt_filename
+
+        with _locked(os.path.join(self._cachepath, ".lock")):
+            if self._cache and _touch(xslt_filename):
                 return xslt_filename
 
-        try:
-            self._compile_phase(
-                stylesheet="iso_dsdl_include.xsl",
-                inputfile=self._schematron_file,
-                outputfile=os.path.join(tempdir, "step1.xsl"),
-                allowed_codes=[0])
-            self._compile_phase(
-                stylesheet="iso_abstract_expand.xsl",
-                inputfile=os.path.join(tempdir, "step1.xsl"),
-                outputfile=os.path.join(tempdir, "step2.xsl"),
-                allowed_codes=[0])
-            self._compile_phase(
-                stylesheet="optimize_schematron.xsl",
-                inputfile=os.path.join(tempdir, "step2.xsl"),
-                outputfile=os.path.join(tempdir, "step3.xsl"),
-                allowed_codes=[0])
-            self._compile_phase(
-                stylesheet="iso_svrl_for_xslt1.xsl",
-                inputfile=os.path.join(tempdir, "step3.xsl"),
-                outputfile=os.path.join(tempdir, "validator.xsl"),
-                outputfilter=not (self._verbose),
-                allowed_codes=[0])
-
-            shutil.move(os.path.join(tempdir, "validator.xsl"),
-                        xslt_filename)
-
-        finally:
-            shutil.rmtree(tempdir)
+            tempdir = tempfile.mkdtemp(prefix="tmp-", dir=self._cachepath)
+            try:
+                self._compile_phase(
+                    stylesheet="iso_dsdl_include.xsl",
+                    inputfile=schematron_file,
+                    outputfile=os.path.join(tempdir, "step1.xsl"),
+                    allowed_codes=[0])
+                self._compile_phase(
+                    stylesheet="iso_abstract_expand.xsl",
+                    inputfile=os.path.join(tempdir, "step1.xsl"),
+                    outputfile=os.path.join(tempdir, "step2.xsl"),
+                    allowed_codes=[0])
+                self._compile_phase(
+                    stylesheet="optimize_schematron.xsl",
+                    inputfile=os.path.join(tempdir, "step2.xsl"),
+                    outputfile=os.path.join(tempdir, "step3.xsl"),
+                    allowed_codes=[0])
+                self._compile_phase(
+                    stylesheet="iso_svrl_for_xslt1.xsl",
+                    inputfile=os.path.join(tempdir, "step3.xsl"),
+                    outputfile=os.path.join(tempdir, "validator.xsl"),
+                    outputfilter=not (self._verbose),
+                    allowed_codes=[0])
+
+                os.rename(os.path.join(tempdir, "validator.xsl"),
+                          xslt_filename)
+
+            finally:
+                shutil.rmtree(tempdir)
+
+            self._evict(keep=xslt_filename)
 
         return xslt_filename
 
-    def _generate_xslt_filename(self):
+    def _evict(self, keep):
+        """
+        Remove the least recently used XSLT files from the cache.
+
+        :keep: XSLT file name which is never removed
+        """
+        xslt_files = []
+        for name in os.listdir(self._cachepath):
+            path = os.path.join(self._cachepath, name)
+            if name.endswith(".validator.xsl") and path != keep:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                xslt_files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for (_, size, _) in xslt_files) + \
+            os.path.getsize(keep)
+        for _, size, path in sorted(xslt_files):
+            if total <= self._cache_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _generate_xslt_filename(self, schematron_file=None):
         """
         Generate XSLT filename from schematron file.
 
+        :schematron_file: Schematron file, the one given in parameters by
+                          default
         :returns: XSLT filename
         """
+        if schematron_file is None:
+            schematron_file = self._schematron_file
         try:
             os.makedirs(self._cachepath)
         except OSError:
@@ -221,13 +381,88 @@ class SchematronScraper(BaseScraper):
             extra = "verbose"
         if self._extra_hash is not None:
             extra = "%s%s" % (extra, self._extra_hash)
-        schema_digest = hexdigest(self._schematron_file, extra_hash=extra)
-        schema_basename = os.path.basename(self._schematron_file)
+        schema_digest = hexdigest(schematron_file, extra_hash=extra)
+        schema_basename = os.path.basename(schematron_file)
 
         return os.path.join(self._cachepath, "%s.%s.validator.xsl" % (
             schema_basename, schema_digest))
 
 
+def _remove_duplicate_elements(root):
+    """
+    Remove repeated active patterns and fired rules in a single pass.
+
+    An active pattern is removed if the previous active pattern has the same
+    id, and a fired rule is removed if the previous fired rule has the same
+    context, even if there are other elements between them.
+
+    :root: Root element of the SVRL report
+    """
+    keys = {SVRL + "active-pattern": "id", SVRL + "fired-rule": "context"}
+    previous = {}
+    duplicates = []
+    for element in root.iterchildren(*keys):
+        value = element.get(keys[element.tag])
+        if element.tag in previous and previous[element.tag] == value:
+            duplicates.append(element)
+        previous[element.tag] = value
+    for element in duplicates:
+        root.remove(element)
+
+
+def warm_cache(schematron_files, verbose=False, extra_hash=None,
+               cache_path=None):
+    """
+    Compile the given schematron files to the cache.
+
+    :schematron_files: List of schematron file paths
+    :verbose: True to compile the files for verbose output
+    :extra_hash: Extra hash of the files called by the schematron files
+    :cache_path: Cache directory, None for the default
+    :returns: List of compiled XSLT file names
+    """
+    xslt_filenames = []
+    for schematron_file in schematron_files:
+        params = {"schematron": schematron_file, "verbose": verbose,
+                  "extra_hash": extra_hash}
+        if cache_path is not None:
+            params["cache_path"] = cache_path
+        scraper = SchematronScraper(filename=schematron_file,
+                                    mimetype="text/xml", params=params)
+        # pylint: disable=protected-access
+        xslt_filenames.append(scraper._compile_schematron())
+    return xslt_filenames
+
+
+@contextmanager
+def _locked(lock_filename):
+    """
+    Hold an exclusive lock of the given file.
+
+    :lock_filename: Lock file path, created if missing
+    """
+    with open(lock_filename, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _touch(filename):
+    """
+    Mark the file as recently used.
+
+    :filename: File path
+    :returns: True if the file exists, False otherwise
+    """
+    try:
+        os.utime(filename, None)
+    except OSError:
+        return False
+    return True
+
+
 class SchematronValidatorError(Exception):
     """Throw error in case of a compilation failure."""
 
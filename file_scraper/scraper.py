@@ -5,6 +5,7 @@ from file_scraper.detectors import VerapdfDetector, MagicCharset
 from file_scraper.dummy.dummy_scraper import FileExists, MimeMatchScraper
 from file_scraper.iterator import iter_detectors, iter_scrapers
 from file_scraper.jhove.jhove_scraper import JHoveUtf8Scraper
+from file_scraper.shell import clear_preloaded
 from file_scraper.textfile.textfile_scraper import TextfileScraper
 from file_scraper.utils import encode_path, generate_metadata_dict, hexdigest
 
@@ -29,6 +30,7 @@ class Scraper(object):
         self.streams = None
         self.well_formed = None
         self.info = None
+        self.checkpoint = None
         self._params = kwargs
         self._scraper_results = []
         self._predefined_mimetype = None
@@ -105,6 +107,8 @@ class Scraper(object):
         :check_wellformed: True for well-formed checking, False otherwise
         """
         scraper.scrape_file()
+        if scraper.checkpoint is not None:
+            self.checkpoint = scraper.checkpoint
         if scraper.streams:
             self._scraper_results.append(scraper.streams)
         self.info[len(self.info)] = scraper.info()
@@ -151,16 +155,35 @@ class Scraper(object):
         :check_wellformed: True, full scraping; False, skip well-formed check.
         """
         self.detect_filetype()
+        self._scrape_detected(check_wellformed)
 
+    def _iter_scraper_classes(self, check_wellformed):
+        """
+        Iterate the scraper classes for the detected file type.
+
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :returns: Generator of scraper classes
+        """
+        # Scrapers may skip costly work needed only in well-formed check
+        self._params["check_wellformed"] = check_wellformed
+        return iter_scrapers(
+            mimetype=self._predefined_mimetype,
+            version=self._predefined_version,
+            check_wellformed=check_wellformed, params=self._params)
+
+    def _scrape_detected(self, check_wellformed):
+        """
+        Scrape the file, after its file type has been detected.
+
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        """
+        self.checkpoint = None
         # File not found or MIME type could not be determined
         if not self._predefined_mimetype:
             self.streams = {}
             return
 
-        for scraper_class in iter_scrapers(
-                mimetype=self._predefined_mimetype,
-                version=self._predefined_version,
-                check_wellformed=check_wellformed, params=self._params):
+        for scraper_class in self._iter_scraper_classes(check_wellformed):
             scraper = scraper_class(
                 filename=self.filename,
                 mimetype=self._predefined_mimetype,
@@ -173,6 +196,8 @@ class Scraper(object):
         self.mimetype = self.streams[0]["mimetype"]
         self.version = self.streams[0]["version"]
         self._check_mime(check_wellformed)
+        if not self.well_formed:
+            self.checkpoint = None
 
     def detect_filetype(self):
         """
@@ -225,3 +250,39 @@ class Scraper(object):
         :returns: Calculated checksum
         """
         return hexdigest(self.filename, algorithm)
+
+
+def scrape_batch(filenames, check_wellformed=True, **kwargs):
+    """
+    Scrape several files, running the batch capable tools once per batch.
+
+    The file types are detected first. Then the files are grouped by the
+    scrapers used for them, and the scrapers run their command line tools
+    once for a batch of files, see BaseScraper.preload_batch. The results
+    are the same as scraping the files one by one.
+
+    :filenames: List of file paths
+    :check_wellformed: True, full scraping; False, skip well-formed check.
+    :kwargs: Extra arguments for certain scrapers, as for Scraper.
+    :returns: List of Scraper instances with the results, in the order of
+              the file paths
+    """
+    # pylint: disable=protected-access
+    scrapers = [Scraper(filename, **dict(kwargs)) for filename in filenames]
+    batches = {}
+    for scraper in scrapers:
+        scraper.detect_filetype()
+        if not scraper._predefined_mimetype:
+            continue
+        for scraper_class in scraper._iter_scraper_classes(check_wellformed):
+            batches.setdefault(scraper_class, []).append(scraper.filename)
+
+    try:
+        for scraper_class, batch_filenames in batches.items():
+            scraper_class.preload_batch(batch_filenames)
+        for scraper in scrapers:
+            scraper._scrape_detected(check_wellformed)
+    finally:
+        clear_preloaded()
+
+    return scrapers
@@ -6,9 +6,17 @@ import subprocess
 import six
 from file_scraper.utils import ensure_text
 
+_PRELOADED = {}
+
 
 class Shell(object):
-    """Shell command handler for non-Python 3rd party software."""
+    """
+    Shell command handler for non-Python 3rd party software.
+
+    The results of commands can be preloaded, e.g. from a single run of a
+    tool for several files. The preloaded result is then used, instead of
+    running the command again.
+    """
 
     def __init__(self, command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                  env=None):
@@ -29,6 +37,10 @@ class Shell(object):
         self.stderr_file = stderr
 
         self._env = os.environ.copy()
+        # Preloaded results are used only for commands with piped output
+        self._key = None
+        if stdout == subprocess.PIPE and stderr == subprocess.PIPE:
+            self._key = _command_key(command, env)
 
         if env:
             for key, value in six.iteritems(env):
@@ -90,6 +102,10 @@ class Shell(object):
         :returns: Returncode, stdout, stderr as dictionary
         """
 
+        if self._returncode is None and self._key in _PRELOADED:
+            (self._returncode, self._stdout, self._stderr) = \
+                _PRELOADED.pop(self._key)
+
         if self._returncode is None:
 
             proc = subprocess.Popen(
@@ -107,3 +123,35 @@ class Shell(object):
             "stderr": self._stderr,
             "stdout": self._stdout
             }
+
+
+def preload(command, returncode, stdout, stderr, env=None):
+    """
+    Preload the result of a command.
+
+    The result is used once by the Shell instance with the same command and
+    environment variables.
+
+    :command: Command as list
+    :returncode: Returncode of the command
+    :stdout: Stdout of the command as byte string
+    :stderr: Stderr of the command as byte string
+    :env: Environment variables
+    """
+    _PRELOADED[_command_key(command, env)] = (returncode, stdout, stderr)
+
+
+def clear_preloaded():
+    """Remove the preloaded results, which were not used."""
+    _PRELOADED.clear()
+
+
+def _command_key(command, env):
+    """
+    Return a key of the command for the preloaded results.
+
+    :command: Command as list
+    :env: Environment variables
+    :returns: Hashable key
+    """
+    return (tuple(command), tuple(sorted(six.iteritems(env or {}))))
@@ -1,14 +1,22 @@
 """Module for checking if the file is uitable as text file or not."""
 from __future__ import unicode_literals
 
+import codecs
 import io
+import os
+import re
+import sys
 import six
 from file_scraper.base import BaseScraper
 from file_scraper.magiclib import file_command
-from file_scraper.utils import iter_utf_bytes
+from file_scraper.utils import iter_chunk_views, map_in_processes
 from file_scraper.textfile.textfile_model import (TextFileMeta,
                                                   TextEncodingMeta)
 
+# ASCII control characters, in exception of horizontal tab, carriage return,
+# and line feed, which are allowed
+FORBIDDEN_CHARACTERS = re.compile("[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]")
+
 
 class TextfileScraper(BaseScraper):
     """
@@ -136,7 +144,9 @@ class TextEncodingScraper(BaseScraper):
     _only_wellformed = True
     _chunksize = 20*1024**2  # chunk size
     _limit = 100*1024**2  # Limit file read in MB, 0 = unlimited
-                          # _limit must be divisible with _chunksize
+    _sample_windows = 3  # Number of evenly spaced windows between head and
+                         # tail windows, if file is larger than _limit
+    _processes = None  # Number of processes in full mode, None = CPU count
 
     def __init__(self, filename, mimetype, version=None, params=None):
         """
@@ -147,54 +157,90 @@ class TextEncodingScraper(BaseScraper):
         :version: File format version
         :params: Extra parameters as dict, the following is required:
                  charset: File character encoding
+                 and the following is optional:
+                 sampling: "sample" (default) to validate a sample of
+                           files larger than the limit, "full" to validate
+                           the whole file in parallel processes
         """
         super(TextEncodingScraper, self).__init__(
             filename=filename, mimetype=mimetype, version=version,
             params=params)
         self._charset = self._params.get("charset", "(:unav)")
+        self._full = self._params.get("sampling", "sample") == "full"
 
     def scrape_file(self):
         """
         Validate the file with decoding it with given character encoding.
+
+        Files larger than the limit are validated from a head window, evenly
+        spaced windows and a tail window, unless full validation is
+        requested. A checkpoint is given only if all the data after the
+        previous checkpoint was validated.
         """
         if self._charset in [None, "(:unav)"]:
             self._errors.append("Character encoding not defined.")
             return
         try:
             with io.open(self.filename, "rb") as infile:
-                position = 0
-                probably_utf8 = None  # Not suggesting UTF-8 if empty file
-
-                charset = self._predetect_charset(infile)
-                for chunk in iter_utf_bytes(infile, self._chunksize,
-                                            self._charset):
-
-                    self._decode_chunk(chunk, charset, position)
-
-                    # If all of the chucks result True here, we most
-                    # likely have UTF-8. Or in other words, if any of the
-                    # chuncks result False, then we don't have UTF-8.
-                    if probably_utf8 in [True, None]:
-                        # Will remain False, if once got such value
-                        probably_utf8 = self._utf8_contradiction(
-                            chunk, position)
-
-                    position = position + len(chunk)
-                    if position >= self._limit and self._limit > 0:
-                        self._messages.append(
-                            "First %s bytes read, we skip the remainder." % (
-                                self._limit))
-                        break
-
-                if probably_utf8:
-                    self._errors.append(
-                        "Character decoding error: The character encoding "
-                        "passed with UTF-8 and it contains characters "
-                        "colliding with the given encoding %s. Most likely "
-                        "the file is UTF-8 file." % self._charset.upper())
-                else:
-                    self._messages.append(
-                        "Character encoding validated successfully.")
+                (charset, body_charset) = self._predetect_charset(infile)
+                size = os.fstat(infile.fileno()).st_size
+
+            start = self._checkpoint_offset("\n".encode(body_charset))
+            windows = self._windows(size, start)
+            candidates = self._utf8_candidates()
+
+            def _arguments():
+                """Yield validation arguments for each window."""
+                for (offset, length) in windows:
+                    yield (self.filename,
+                           charset if offset == 0 else body_charset,
+                           list(candidates), offset, length, self._chunksize)
+
+            if self._full and len(windows) > 1:
+                results = map_in_processes(validate_window,
+                                           list(_arguments()),
+                                           self._processes)
+            else:
+                results = (validate_window(*arguments)
+                           for arguments in _arguments())
+
+            decoded = 0
+            for (error, survived, length) in results:
+                if error:
+                    raise ValueError(error)
+                candidates = [candidate for candidate in candidates
+                              if candidate in survived]
+                decoded = decoded + length
+
+            validated = sum(length for (_, length) in windows)
+            if validated < size - start:
+                self._messages.append(
+                    "Validated %s of %s bytes (%s%%) in head window, %s "
+                    "evenly spaced windows and tail window, we skip the "
+                    "remainder." % (validated, size, validated * 100 // size,
+                                    len(windows) - 2))
+            elif len(windows) > 1:
+                self._messages.append(
+                    "Validated all %s bytes in %s parallel chunks." % (
+                        size, len(windows)))
+
+            # Not suggesting UTF-8 if empty file
+            probably_utf8 = decoded > 0 and "UTF-8" in candidates and \
+                "ASCII" not in candidates
+
+            if probably_utf8:
+                self._errors.append(
+                    "Character decoding error: The character encoding "
+                    "passed with UTF-8 and it contains characters "
+                    "colliding with the given encoding %s. Most likely "
+                    "the file is UTF-8 file." % self._charset.upper())
+            else:
+                self._messages.append(
+                    "Character encoding validated successfully.")
+                # A sampled file gets no checkpoint, as the data between
+                # the windows was not validated
+                if validated == size - start:
+                    self._update_checkpoint(size)
 
         except IOError as err:
             self._errors.append("Error when reading the file: " +
@@ -214,20 +260,76 @@ class TextEncodingScraper(BaseScraper):
         In some cases, more accurate encoding information may be needed
         to do the decoding. Currently, this applies to UTF-32, which
         does not work, if the file is UTF-32BE and does not have BOM.
+        The incremental decoders of UTF-16 and UTF-32 require a BOM, so
+        the native byte order is given for files without BOM, as it is
+        used when decoding the whole file at once.
+
+        The windows in the middle of the file do not have a BOM, so the byte
+        order given in the BOM is used for them.
+
+        :infile: File handle
+        :returns: Tuple (x, y) where x is charset for the beginning of the
+                  file and y is charset for the windows
         """
         chunk = infile.read(1024)
         infile.seek(0)
         if self._charset == "UTF-32":
             try:
                 self._decode_chunk(chunk, "UTF-32BE", 0)
-                return "UTF-32BE"
+                return ("UTF-32BE", "UTF-32BE")
             except (ValueError, UnicodeError):
                 pass
-        return self._charset
+        boms = {"UTF-16": (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE),
+                "UTF-32": (codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)}
+        if self._charset.upper() not in boms:
+            return (self._charset, self._charset)
+        (little_endian, big_endian) = boms[self._charset.upper()]
+        if chunk.startswith(big_endian):
+            return (self._charset, self._charset + "BE")
+        if chunk.startswith(little_endian):
+            return (self._charset, self._charset + "LE")
+        charset = self._charset + (
+            "LE" if sys.byteorder == "little" else "BE")
+        return (charset, charset)
+
+    def _windows(self, size, start=0):
+        """
+        Return the windows of the file to validate.
+
+        The whole file is validated in one window, if it is not larger than
+        the limit. In full mode, the file is split to chunks validated in
+        parallel. Otherwise, the windows are the head and the tail of the
+        file and evenly spaced windows between them, the total size of the
+        windows being the limit. The window offsets are divisible by 4 to be
+        aligned to the code units of UTF-16 and UTF-32.
+
+        If the validation is resumed from a checkpoint, the data after it is
+        validated in whole.
 
-    def _utf8_contradiction(self, chunk, position):
+        :size: File size
+        :start: Offset of the checkpoint, 0 to validate the whole file
+        :returns: List of (offset, length) tuples
         """
-        Check that UTF-8 does not make a contradiction.
+        if self._full:
+            step = max(self._chunksize - self._chunksize % 4, 4)
+            return [(offset, min(step, size - offset))
+                    for offset in range(start, size, step)] or [(start, 0)]
+        if start or self._limit <= 0 or size <= self._limit:
+            return [(start, size - start)]
+        count = self._sample_windows + 2
+        length = self._limit // count
+        windows = []
+        for index in range(count):
+            offset = (size - length) * index // (count - 1)
+            offset = offset - offset % 4
+            if index == count - 1:
+                length = size - offset
+            windows.append((offset, length))
+        return windows
+
+    def _utf8_candidates(self):
+        """
+        Return the candidate charsets to check UTF-8 contradiction.
 
         With file passed with given decodings UTF-16 or ISO-8859-15 there is
         a chance that the file is actually UTF-8.
@@ -236,59 +338,232 @@ class TextEncodingScraper(BaseScraper):
 
         If the file is ASCII file, then it can be accepted with ISO-8859-15
         and there is no contradiction with UTF-8. If ASCII decoding fails
-        then UTF-8 decoding should fail too. Otherwise, we do probably have
-        UTF-8 file.
+        but UTF-8 decoding works, then we do probably have UTF-8 file.
 
-        :chunk: Byte chunk from a file
-        :position: Chunk position in file
-        :returns: True if there is UTF-8 contradiction, otherwise False
+        :returns: List of candidate charsets
         """
         if self._charset.upper() in ["UTF-8", "UTF-32"]:
-            return False
-
+            return []
         if self._charset.upper() == "ISO-8859-15":
-            try:
-                # If ASCII works, then also ISO-8859-15 is OK
-                self._decode_chunk(chunk, "ASCII", position)
-                return False
-            except (ValueError, UnicodeError):
-                # If ASCII did not work, then charset can be (almost) anything
-                pass
-
-        # If ASCII did not work, but UTF-8 works, then we quite probably have
-        # UTF-8.
-        try:
-            self._decode_chunk(chunk, "UTF-8", position)
-        except (ValueError, UnicodeDecodeError):
-            # If it was not UTF-8, then we have to believe the given charset
-            return False
-        return True
+            return ["ASCII", "UTF-8"]
+        return ["UTF-8"]
 
     # pylint: disable=no-self-use
     def _decode_chunk(self, chunk, charset, position):
         """
         Decode given chunk and check forbidden characters.
 
-        The forbidden characters are the ASCII control characters, in
-        exception of horizontal tab, carriage return, and line feed, which are
-        allowed.
-
         :chunk: Byte chunk from a file
         :charset: Decoding charset
         :position: Chunk position in a file
         :raises: UnicodeError or ValueError when decoding was unsuccessful or
                  a forbidden character was found.
         """
-        decoded_chunk = chunk.decode(charset)
-
-        forbidden = ["\x00", "\x01", "\x02", "\x03", "\x04", "\x05", "\x06",
-                     "\x07", "\x08", "\x0B", "\x0C", "\x0E", "\x0F", "\x10",
-                     "\x11", "\x12", "\x13", "\x14", "\x15", "\x16", "\x17",
-                     "\x18", "\x19", "\x1A", "\x1B", "\x1C", "\x1D", "\x1E",
-                     "\x1F", "\x7F"]
-        for forb_char in forbidden:
-            index = decoded_chunk.find(forb_char)
-            if index > -1:
-                raise ValueError(
-                    "Illegal character '%s' in position %s" % (
-                        forb_char, (position+index)))
+        check_characters(codecs.decode(chunk, charset),
+                         position + len(chunk), charset)
+
+
+class CharsetValidator(object):
+    """
+    Validate text with the given charset and candidate charsets at once.
+
+    Each chunk is fed once to the incremental decoders of the given charset
+    and of the candidate charsets. Decoding with the given charset must
+    succeed, whereas a candidate charset is dropped when its decoding fails
+    or a forbidden character is found.
+    """
+
+    def __init__(self, charset, candidates, position=0, skips=None):
+        """
+        Initialize the decoders.
+
+        :charset: Given charset
+        :candidates: List of candidate charsets
+        :position: Byte offset of the first chunk in a file
+        :skips: Dict of the number of bytes to skip in the beginning for
+                the candidate charsets, to start from their own character
+                boundaries
+        """
+        self._decoder = codecs.getincrementaldecoder(charset)()
+        self._charset = charset
+        self._candidates = dict(
+            (candidate, codecs.getincrementaldecoder(candidate)())
+            for candidate in candidates)
+        self._skips = dict(skips or {})
+        self.position = position
+
+    def feed(self, chunk, final=False):
+        """
+        Decode a chunk with all decoders.
+
+        :chunk: Byte chunk from a file
+        :final: True for the last chunk of the file
+        :raises: UnicodeError or ValueError when decoding with the given
+                 charset was unsuccessful or a forbidden character was found.
+        """
+        pending = len(self._decoder.getstate()[0])
+        decoded_chunk = self._decoder.decode(chunk, final)
+        # Byte offset of the end of the decoded text in the file
+        self.position = self.position + pending + len(chunk) - \
+            len(self._decoder.getstate()[0])
+        check_characters(decoded_chunk, self.position, self._charset)
+
+        for candidate, decoder in list(self._candidates.items()):
+            data = chunk
+            skip = self._skips.get(candidate, 0)
+            if skip:
+                data = chunk[skip:]
+                self._skips[candidate] = max(0, skip - len(chunk))
+            try:
+                check_characters(decoder.decode(data, final))
+            except (ValueError, UnicodeError):
+                del self._candidates[candidate]
+
+    def survived(self, candidate):
+        """
+        Return True if the text so far is valid with the candidate charset.
+
+        :candidate: Candidate charset
+        :returns: True if the candidate is still valid, False otherwise
+        """
+        return candidate in self._candidates
+
+    def candidates(self):
+        """Return the list of still valid candidate charsets."""
+        return list(self._candidates)
+
+    def pending(self):
+        """Return True if an incomplete character is left undecoded."""
+        return bool(self._decoder.getstate()[0])
+
+
+def validate_window(filename, charset, candidates, offset, length,
+                    chunksize):
+    """
+    Validate a window of a text file.
+
+    A window not in the beginning of the file starts from the next character
+    boundary, and a character split by the end of the window is decoded to
+    the end, so that adjacent windows validate every character once. The
+    candidate charsets start from their own next character boundaries.
+    The positions in errors are byte offsets in the file.
+
+    :filename: File name
+    :charset: Decoding charset
+    :candidates: List of candidate charsets
+    :offset: Byte offset of the window
+    :length: Length of the window in bytes
+    :chunksize: Size of the chunk to decode at once
+    :returns: Tuple (error, survived candidates, number of decoded
+              bytes), where error is None for valid window
+    """
+    with io.open(filename, "rb") as infile:
+        size = os.fstat(infile.fileno()).st_size
+        infile.seek(offset)
+        skip = 0
+        skips = {}
+        if offset > 0:
+            head = infile.read(4)
+            skip = _boundary_skip(head, charset)
+            # The candidates may have other character boundaries
+            skips = dict((candidate,
+                          max(0, _boundary_skip(head, candidate) - skip))
+                         for candidate in candidates)
+        validator = CharsetValidator(charset, candidates, offset + skip,
+                                     skips)
+        try:
+            infile.seek(offset + skip)
+            remaining = length - skip
+            if remaining > 0:
+                for chunk in iter_chunk_views(infile,
+                                              min(chunksize, remaining)):
+                    validator.feed(chunk[:remaining])
+                    remaining = remaining - len(chunk)
+                    if remaining <= 0:
+                        break
+
+            # Decode the character split by the end of the window
+            infile.seek(offset + length)
+            for _ in range(3):
+                if not validator.pending():
+                    break
+                byte = infile.read(1)
+                if not byte:
+                    break
+                validator.feed(byte)
+            if offset + length >= size:
+                # Incomplete character in the end of the file
+                validator.feed(b"", final=True)
+        except (ValueError, UnicodeError) as exception:
+            return (six.text_type(exception), [], 0)
+    return (None, validator.candidates(),
+            validator.position - offset - skip)
+
+
+def _boundary_skip(data, charset):
+    """
+    Return the number of bytes to skip to the next character boundary.
+
+    The data is assumed to start at a code unit boundary. In UTF-8,
+    continuation bytes are skipped, and in UTF-16, a low surrogate is
+    skipped.
+
+    :data: Bytes in the beginning of a window
+    :charset: Decoding charset
+    :returns: Number of bytes to skip
+    """
+    data = bytearray(data)
+    charset = charset.upper().replace("_", "-")
+    if charset in ["UTF-8", "UTF8"]:
+        skip = 0
+        while skip < min(len(data), 3) and 0x80 <= data[skip] <= 0xbf:
+            skip = skip + 1
+        return skip
+    if charset in ["UTF-16LE", "UTF-16BE"] and len(data) >= 2:
+        high = data[1] if charset == "UTF-16LE" else data[0]
+        if 0xdc <= high <= 0xdf:
+            return 2
+    return 0
+
+
+def check_characters(decoded_chunk, end=0, charset="ASCII"):
+    """
+    Check forbidden characters in decoded chunk.
+
+    The forbidden characters are the ASCII control characters, in
+    exception of horizontal tab, carriage return, and line feed, which are
+    allowed. The chunk is scanned once, and the first forbidden character
+    is reported with its byte offset in the file. The offset is counted
+    back from the end of the chunk, so that a byte order mark or bytes of
+    a character split from the previous chunk do not change it.
+
+    :decoded_chunk: Decoded chunk from a file
+    :end: Byte offset of the end of the chunk in a file
+    :charset: Charset of the chunk
+    :raises: ValueError when a forbidden character was found.
+    """
+    match = FORBIDDEN_CHARACTERS.search(decoded_chunk)
+    if match:
+        raise ValueError(
+            "Illegal character '%s' in position %s" % (
+                match.group(),
+                end - _encoded_length(decoded_chunk[match.start():],
+                                      charset)))
+
+
+def _encoded_length(text, charset):
+    """
+    Return the length of text in bytes when encoded with charset.
+
+    The byte order and the byte order mark of UTF-16 and UTF-32 do not
+    change the length of the characters, so they are encoded without them.
+
+    :text: Decoded text
+    :charset: Charset of the text
+    :returns: Number of bytes
+    """
+    charset = charset.upper().replace("_", "-")
+    for unicode_charset in ["UTF-16", "UTF-32"]:
+        if charset.startswith(unicode_charset):
+            charset = unicode_charset + "-LE"
+    return len(text.encode(charset))
@@ -2,15 +2,29 @@
 from __future__ import unicode_literals
 
 import hashlib
+import io
+import multiprocessing
+import os
 import string
 import sys
 import unicodedata
+from bisect import bisect_left
+from functools import partial
 from itertools import chain
 
 import six
 
 from file_scraper.exceptions import SkipElementException
 
+try:
+    from lxml import etree
+except ImportError:
+    pass
+
+XSI = "{http://www.w3.org/2001/XMLSchema-instance}"
+
+_XML_SCANS = {}
+
 
 def metadata(important=False):
     """
@@ -82,6 +96,61 @@ def hexdigest(filename, algorithm="sha1", extra_hash=None):
     return checksum.hexdigest()
 
 
+def make_checkpoint(filename, offset, window=1024**2):
+    """
+    Return a checkpoint of a file validated up to the given offset.
+
+    The checkpoint identifies the validated prefix of the file with a
+    digest. Append-only files change only after the prefix, so the digest
+    is calculated only from the size of the prefix and its head and tail
+    windows, which reveals a truncated or replaced file without reading
+    the whole prefix again. This is a heuristic: a change in the middle of
+    a prefix longer than two windows is not detected, and the changed data
+    is not validated again.
+
+    :filename: File path
+    :offset: Offset of the first byte not validated
+    :window: Size of the head and tail windows
+    :returns: Checkpoint as dict with keys "offset" and "digest"
+    """
+    return {"offset": offset,
+            "digest": _prefix_digest(filename, offset, window)}
+
+
+def checkpoint_matches(filename, checkpoint, window=1024**2):
+    """
+    Return True if the checkpoint matches the prefix of a file.
+
+    :filename: File path
+    :checkpoint: Checkpoint as returned by make_checkpoint()
+    :window: Size of the head and tail windows
+    :returns: True if the file has the checkpointed prefix, False otherwise
+    """
+    try:
+        offset = int(checkpoint["offset"])
+        return 0 < offset <= os.path.getsize(filename) and \
+            checkpoint["digest"] == _prefix_digest(filename, offset, window)
+    except (KeyError, TypeError, ValueError, EnvironmentError):
+        return False
+
+
+def _prefix_digest(filename, offset, window):
+    """
+    Calculate SHA-256 digest of the size, head and tail of a file prefix.
+
+    :filename: File path
+    :offset: Size of the prefix
+    :window: Size of the head and tail windows
+    :returns: Digest as hex string
+    """
+    checksum = hashlib.sha256(six.text_type(offset).encode("ascii"))
+    with io.open(filename, "rb") as input_file:
+        for start in sorted(set([0, max(0, offset - window)])):
+            input_file.seek(start)
+            checksum.update(input_file.read(min(window, offset - start)))
+    return checksum.hexdigest()
+
+
 def sanitize_string(dirty_string):
     """
     Strip non-printable control characters from unicode string.
@@ -298,7 +367,7 @@ def _fill_importants(scraper_results, lose):
     :raises: ValueError if two different important values collide in a method.
     """
     importants = {}
-    for model in chain.from_iterable(scraper_results):
+    for model in _iter_models(scraper_results):
         for method in model.iterate_metadata_methods():
             try:
                 method_name = method.__name__
@@ -345,21 +414,62 @@ def generate_metadata_dict(scraper_results, lose):
     streams = {}
     importants = _fill_importants(scraper_results, lose)
 
-    for model in chain.from_iterable(scraper_results):
-        stream_index = model.index()
+    # A model may represent a run of consecutive identical streams, e.g.
+    # frames of a multi-page image. The streams are merged in segments
+    # within which all streams are represented by the same models, and the
+    # segments are expanded to streams after merging.
+    spans = [(model.index(), model.frame_count(), model)
+             for model in _iter_models(scraper_results)]
+    bounds = sorted(set(chain.from_iterable(
+        (first, first + count) for first, count, _ in spans)))
+
+    for first, count, model in spans:
+        for stream_index in bounds[bisect_left(bounds, first):
+                                   bisect_left(bounds, first + count)]:
+            if stream_index not in streams:
+                streams[stream_index] = {}
+            current_stream = streams[stream_index]
+
+            segment_model = model
+            if stream_index != first:
+                segment_model = model.frame(stream_index)
+
+            for method in segment_model.iterate_metadata_methods():
+                try:
+                    _merge_to_stream(current_stream, method, lose,
+                                     importants)
+                except SkipElementException:
+                    # happens when the method is not to be indexed
+                    continue
+
+    for start, end in zip(bounds, bounds[1:]):
+        if start not in streams:
+            continue
+        for stream_index in range(start + 1, end):
+            streams[stream_index] = streams[start].copy()
+            streams[stream_index]["index"] = stream_index
 
-        if stream_index not in streams:
-            streams[stream_index] = {}
-        current_stream = streams[stream_index]
+    return streams
 
-        for method in model.iterate_metadata_methods():
-            try:
-                _merge_to_stream(current_stream, method, lose, importants)
-            except SkipElementException:
-                # happens when the method is not to be indexed
-                continue
 
-    return streams
+def _iter_models(scraper_results):
+    """
+    Iterate the metadata models of the given scraper results.
+
+    Frame streams of images are iterated as runs of identical frames instead
+    of single frames.
+
+    :scraper_results: A list containing lists of metadata models or frame
+                      streams.
+    :returns: Metadata model
+    """
+    for streams in scraper_results:
+        if hasattr(streams, "runs"):
+            for run in streams.runs():
+                yield run
+        else:
+            for model in streams:
+                yield model
 
 
 def concat(lines, prefix=""):
@@ -454,3 +564,194 @@ def iter_utf_bytes(file_handle, chunksize, charset):
                          "indexes": [1, 2]}], True)
 
         yield chunk
+
+
+def iter_chunk_views(file_handle, chunksize):
+    """
+    Iterate given file in chunks read into a single reused buffer.
+
+    A chunk is a memoryview to the buffer, and it is valid only until the
+    next chunk is read. In Python 2, the codecs do not accept memoryviews, so
+    a copy of the chunk is returned instead.
+
+    :file_handle: File handle to read
+    :chunksize: Size of the chunk to read
+    :returns: Sequence from the file
+    """
+    chunk_buffer = bytearray(chunksize)
+    view = memoryview(chunk_buffer)
+    while True:
+        size = file_handle.readinto(chunk_buffer)
+        if not size:
+            return
+        if six.PY2:
+            yield bytes(chunk_buffer[:size])
+        else:
+            yield view[:size]
+
+
+def iter_batches(items, batch_size):
+    """
+    Iterate the items in batches.
+
+    :items: List of items
+    :batch_size: Maximum number of items in a batch
+    :returns: Generator of item lists
+    """
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def map_in_processes(function, arguments, processes):
+    """
+    Call a function with each argument tuple in a process pool.
+
+    The function must be defined on module level, so that it can be
+    pickled to the worker processes.
+
+    :function: Function to call
+    :arguments: List of argument tuples for the function
+    :processes: Number of worker processes, None for the number of CPUs
+    :returns: List of the results in the order of the arguments
+    """
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(partial(_call_with_arguments, function), arguments)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _call_with_arguments(function, arguments):
+    """
+    Call a function with a tuple of arguments in a process pool.
+
+    :function: Function to call
+    :arguments: Tuple of arguments for the function
+    :returns: Result of the function
+    """
+    return function(*arguments)
+
+
+def iter_xml_events(parser, filename, chunksize=1024**2):
+    """
+    Feed an XML file to a pull parser and iterate the parse events.
+
+    Each element is cleared after its end event, and the already handled
+    preceding siblings are removed, so that the memory use stays bounded
+    also for huge files. The elements must not be used after their end
+    event.
+
+    :parser: lxml XMLPullParser
+    :filename: File path
+    :chunksize: Size of the chunk to feed to the parser at a time
+    :returns: Generator of (event, element) tuples
+    :raises: XMLSyntaxError if the file is not well-formed or not valid
+             for the parser
+    """
+    with io.open(filename, "rb") as infile:
+        while True:
+            chunk = infile.read(chunksize)
+            parser.feed(chunk)
+            if not chunk:
+                parser.close()
+            for event, element in parser.read_events():
+                yield event, element
+                if event == "end":
+                    element.clear()
+                    parent = element.getparent()
+                    while parent is not None and \
+                            element.getprevious() is not None:
+                        del parent[0]
+            if not chunk:
+                return
+
+
+class XmlScan(object):
+    """
+    Streaming well-formed check of an XML file.
+
+    The document information and the schema locations are collected with
+    bounded memory use, while the document is parsed once.
+
+    The attributes are:
+        error -- XMLSyntaxError if the file is not well-formed, else None
+        xml_version, encoding, doctype, system_url -- Document information
+            as in lxml docinfo, None if the prolog could not be parsed
+        internal_dtd -- True if the document has an internal DTD subset
+        schema_locations -- Sorted list of xsi:schemaLocation values
+        no_namespace_schema_locations -- Sorted list of
+            xsi:noNamespaceSchemaLocation values
+    """
+
+    def __init__(self, filename, chunksize=1024**2):
+        """
+        Scan the file.
+
+        :filename: File path
+        :chunksize: Size of the chunk to feed to the parser at a time
+        :raises: IOError if the file can not be read
+        """
+        self.error = None
+        self.xml_version = None
+        self.encoding = None
+        self.doctype = None
+        self.system_url = None
+        self.internal_dtd = False
+        schema_locations = set()
+        no_namespace_schema_locations = set()
+        parser = etree.XMLPullParser(
+            events=("start", "end"), dtd_validation=False, no_network=True,
+            huge_tree=True, base_url=decode_path(os.path.abspath(filename)))
+        root = None
+        try:
+            for event, element in iter_xml_events(parser, filename,
+                                                  chunksize):
+                if event != "start":
+                    continue
+                if root is None:
+                    root = element
+                if XSI + "schemaLocation" in element.attrib:
+                    schema_locations.add(
+                        element.attrib[XSI + "schemaLocation"])
+                if XSI + "noNamespaceSchemaLocation" in element.attrib:
+                    no_namespace_schema_locations.add(
+                        element.attrib[XSI + "noNamespaceSchemaLocation"])
+        except etree.XMLSyntaxError as exception:
+            self.error = exception
+            if root is None:
+                for _, element in parser.read_events():
+                    root = element
+                    break
+        self.schema_locations = sorted(schema_locations)
+        self.no_namespace_schema_locations = sorted(
+            no_namespace_schema_locations)
+        if root is not None:
+            docinfo = root.getroottree().docinfo
+            self.xml_version = docinfo.xml_version
+            self.encoding = docinfo.encoding
+            self.doctype = docinfo.doctype
+            self.system_url = docinfo.system_url
+            internal = docinfo.internalDTD
+            self.internal_dtd = internal is not None and (
+                any(True for _ in internal.iterelements()) or
+                any(True for _ in internal.iterentities()))
+
+
+def scan_xml(filename):
+    """
+    Return the streaming well-formed check of an XML file.
+
+    The result of the latest file is kept, so that the scrapers of the same
+    file do not need to parse it again.
+
+    :filename: File path
+    :returns: XmlScan instance
+    :raises: IOError if the file can not be read
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    if key not in _XML_SCANS:
+        _XML_SCANS.clear()
+        _XML_SCANS[key] = XmlScan(filename)
+    return _XML_SCANS[key]
@@ -8,19 +8,27 @@ Collects metadata from JPEG, PNG, JPEG2000, GIF and TIFF files.
 
 Checks well-formedess by testing if ImageMagick can open and read then
 file. More complete well-formedness test is required by specific validator
-tool.
+tool. The metadata is read from the headers by pinging the image, and the
+pixel data is decoded only when well-formedness is checked. Very large JPEG
+and JPEG 2000 images are decoded in reduced resolution, unless full decoding
+is requested.
 
 """
 from __future__ import unicode_literals
 
+import struct
+from io import open as io_open
+
 import six
 
-from file_scraper.base import BaseScraper
+from file_scraper.base import BaseScraper, FrameStreams
+from file_scraper.config import WAND_RESOURCE_LIMITS
 from file_scraper.wand.wand_model import (WandImageMeta, WandTiffMeta,
                                           WandExifMeta)
 
 try:
     import wand.image
+    import wand.resource
 except ImportError:
     pass
 
@@ -29,6 +37,8 @@ class WandScraper(BaseScraper):
     """Scraper for the Wand/ImageMagick library."""
 
     _supported_metadata = [WandExifMeta, WandTiffMeta, WandImageMeta]
+    _reduce_pixels = 64*1024**2  # Decode larger images in reduced size
+    _jp2_reduce_factor = 3  # Number of JPEG 2000 resolution levels to skip
 
     def __init__(self, *args, **kwargs):
         """
@@ -39,34 +49,128 @@ class WandScraper(BaseScraper):
 
         The _wandresults are needed to be initialized to be able to
         properly close them after the class has been executed.
+
+        The params may contain:
+            check_wellformed: True (default) to decode the image, False to
+                              read only the image headers.
+            full_decode: True to decode large images in full resolution,
+                         False (default) to decode them in reduced resolution.
         """
         super(WandScraper, self).__init__(*args, **kwargs)
         self._wandresults = None
+        self._decode = self._params.get("check_wellformed", True)
+        self._full_decode = self._params.get("full_decode", False)
 
     def scrape_file(self):
         """
         Populate streams with supported metadata objects.
+
+        The metadata is read from the image headers. The pixel data is
+        decoded only if well-formedness is checked.
         """
         try:
-            self._wandresults = wand.image.Image(filename=self.filename)
+            _set_resource_limits()
+            self._wandresults = wand.image.Image.ping(filename=self.filename)
+            if self._decode:
+                self._decode_image()
         except Exception as e:  # pylint: disable=broad-except, invalid-name
             self._errors.append("Error in analyzing file")
             self._errors.append(six.text_type(e))
         else:
-            for md_class in self._supported_metadata:
-                for image in self._wandresults.sequence:
-                    if md_class.is_supported(image.container.mimetype):
-                        self.streams.append(md_class(image=image))
+            # The frames are read one at a time and released as soon as
+            # their metadata has been collected.
+            self.streams = FrameStreams()
+            sequence = self._wandresults.sequence
+            for index in range(len(sequence)):
+                image = sequence[index]
+                try:
+                    for md_class in self._supported_metadata:
+                        if md_class.is_supported(image.container.mimetype):
+                            self.streams.append(md_class(image=image))
+                finally:
+                    image.destroy()
             self._check_supported(allow_unav_version=True)
             self._messages.append("The file was analyzed successfully.")
 
+    def _decode_image(self):
+        """
+        Decode the pixel data to check that the image can be read.
+
+        :raises: Wand exception if the image can not be decoded
+        """
+        with wand.image.Image() as image:
+            for key, value in six.iteritems(self._reduce_options()):
+                image.options[key] = value
+            image.read(filename=self.filename)
+
+    def _reduce_options(self):
+        """
+        Return ImageMagick options for reduced resolution decoding.
+
+        Only images larger than _reduce_pixels are decoded in reduced
+        resolution. The highest resolution levels of JPEG 2000 codestream are
+        skipped, and JPEG is decoded using DCT scaling. Other formats do not
+        support reduced decoding.
+
+        :returns: Dict of ImageMagick options
+        """
+        if self._full_decode or \
+                self._wandresults.width * self._wandresults.height <= \
+                self._reduce_pixels:
+            return {}
+        if self._wandresults.mimetype == "image/jp2":
+            factor = min(_jp2_decomposition_levels(self.filename),
+                         self._jp2_reduce_factor)
+            if factor > 0:
+                return {"jp2:reduce-factor": six.text_type(factor)}
+        elif self._wandresults.mimetype == "image/jpeg":
+            return {"jpeg:size": "%sx%s" % (self._wandresults.width // 8,
+                                            self._wandresults.height // 8)}
+        return {}
+
     def __del__(self):
         """
         Close potential open image files using Python's File
         close() method.
+
+        The frames have already been destroyed in scraping.
         """
 
         if self._wandresults:
-            for frame in self._wandresults.sequence:
-                frame.destroy()
             self._wandresults.close()
+
+
+def _set_resource_limits():
+    """Set ImageMagick resource limits from the configuration."""
+    for resource, limit in WAND_RESOURCE_LIMITS.items():
+        wand.resource.limits[resource] = limit
+
+
+def _jp2_decomposition_levels(filename, limit=64*1024):
+    """
+    Return the number of wavelet decomposition levels of JPEG 2000 file.
+
+    The levels are read from the COD marker segment in the main header of
+    the codestream. The resolution can not be reduced more than this.
+
+    :filename: File path
+    :limit: Number of bytes to read from the beginning of the file
+    :returns: Number of decomposition levels, 0 if not found
+    """
+    with io_open(filename, "rb") as infile:
+        header = infile.read(limit)
+    position = header.find(b"\xff\x4f\xff\x51")  # SOC and SIZ markers
+    if position < 0:
+        return 0
+    position += 2
+    while position + 4 <= len(header):
+        marker, length = struct.unpack(
+            ">HH", header[position:position + 4])
+        if marker == 0xff52:  # COD
+            if position + 10 > len(header):
+                return 0
+            return six.indexbytes(header, position + 9)
+        if marker == 0xff90:  # SOT, end of the main header
+            return 0
+        position += 2 + length
+    return 0
@@ -1,31 +1,46 @@
 """Warc file scraper."""
 from __future__ import unicode_literals
 
-import gzip
+import base64
+import binascii
+import hashlib
 import os.path
-import tempfile
+import re
+import zlib
 from io import open as io_open
 
 import six
 
 from file_scraper.base import BaseScraper
-from file_scraper.shell import Shell
-from file_scraper.utils import sanitize_bytestring, encode_path
+from file_scraper.utils import map_in_processes
 from file_scraper.warctools.warctools_model import (ArcWarctoolsMeta,
                                                     GzipWarctoolsMeta,
                                                     WarcWarctoolsMeta)
 
+GZIP_MAGIC = b"\x1f\x8b"
+GZIP_MEMBER = GZIP_MAGIC + b"\x08"  # Magic and deflate compression method
+MAX_LINE = 65536  # Maximum length of a record header line
+WARC_VERSION_LINE = re.compile(br"^WARC/\d+\.\d+\r?\n$")
+WARC_REQUIRED_FIELDS = [b"warc-type", b"warc-record-id", b"warc-date",
+                        b"content-length"]
+ARC_FIELD_COUNTS = {1: 5, 2: 10}  # Number of header fields in ARC versions
+# Header fields of the records written to the record index
+INDEX_FIELDS = [b"warc-type", b"warc-record-id", b"warc-target-uri",
+                b"warc-date"]
+
 
 class WarcWarctoolsScraper(BaseScraper):
     """
     Implements WARC file format scraper for metadata collecting.
 
-    This scraper uses Internet Archives warctools scraper.
+    The checks follow Internet Archives warctools, but the archive is read
+    in-process.
 
     .. seealso:: https://github.com/internetarchive/warctools
     """
 
     _supported_metadata = [WarcWarctoolsMeta]
+    _chunksize = 1024**2  # Maximum size of data to read or decompress
 
     @classmethod
     def is_supported(cls, mimetype, version=None, check_wellformed=True,
@@ -48,14 +63,8 @@ class WarcWarctoolsScraper(BaseScraper):
     def scrape_file(self):
         """Scrape WARC file."""
         try:
-            # First assume archive is compressed
-            with gzip.open(self.filename) as warc_fd:
-                line = warc_fd.readline()
-        except IOError:
-            # Not compressed archive
-            with io_open(self.filename, "rb") as warc_fd:
-                line = warc_fd.readline()
-        except Exception as exception:  # pylint: disable=broad-except
+            line = _read_first_line(self.filename, self._chunksize)
+        except (EOFError, zlib.error) as exception:
             # Compressed but corrupted gzip file
             self._errors.append(six.text_type(exception))
             return
@@ -70,13 +79,17 @@ class WarcWarctoolsFullScraper(WarcWarctoolsScraper):
     """
     Implements WARC file format scraper for validation.
 
-    This scraper uses Internet Archives warctools scraper.
+    The checks follow Internet Archives warctools, but the archive is read
+    in-process.
 
     .. seealso:: https://github.com/internetarchive/warctools
     """
 
     _supported_metadata = [WarcWarctoolsMeta]
     _only_wellformed = True  # Only well-formed check
+    _parallel_size = 1024**3  # Validate larger gzip files in parallel
+    _rangesize = 256*1024**2  # Size of a byte range in parallel validation
+    _processes = None  # Number of processes, None = CPU count
 
     @classmethod
     def is_supported(cls, mimetype, version=None, check_wellformed=True,
@@ -98,24 +111,93 @@ class WarcWarctoolsFullScraper(WarcWarctoolsScraper):
                     cls._supported_metadata])
 
     def scrape_file(self):
-        """Scrape WARC file."""
+        """
+        Validate WARC file.
+
+        The records are read through once, and the record headers, lengths
+        and block digests are checked. The version is taken from the first
+        record in the same pass.
+
+        Large gzip compressed files are validated in parallel byte ranges,
+        each starting from a gzip member. If the ranges do not join or an
+        error is found, the file is validated again from the start, so that
+        the first error is reported.
+
+        If warc_index parameter is given, an index of the records is
+        written to that path, see _write_index(). Otherwise, the validation
+        is resumed from the checkpoint parameter, if given, and the new
+        checkpoint is set at the end of the last record.
+        """
         size = os.path.getsize(self.filename)
         if size == 0:
             self._errors.append("Empty file.")
             return
-        shell = Shell(["warcvalid", self.filename])
-
-        if shell.returncode != 0:
-            self._errors.append("Failed: returncode %s" % shell.returncode)
-            # Filter some trash printed by warcvalid.
-            filtered_errors = [line for line in shell.stderr.split("\n")
-                               if u"ignored line" not in line]
-            self._errors.append("\n".join(filtered_errors))
+
+        index_path = self._params.get("warc_index", None)
+        # The whole file is needed for the index
+        start = 0 if index_path is not None else self._checkpoint_offset()
+        result = None
+        if not start and size > self._parallel_size and \
+                _is_compressed(self.filename):
+            result = self._validate_parallel(size, index_path is not None)
+        if result is None:
+            (error, _, reached, line, entries) = validate_member_range(
+                self.filename, start, None, self._chunksize,
+                index_path is not None, search=False)
+            if error is not None:
+                self._errors.append("Error in validating WARC file.")
+                self._errors.append(error)
+                return
+        else:
+            (line, entries) = result
+            reached = size
+        if start:
+            line = _read_first_line(self.filename, self._chunksize)
+        if line is None:
+            self._errors.append("No WARC records found.")
             return
+        if index_path is not None:
+            _write_index(index_path, entries, reached)
 
-        self._messages.append(shell.stdout)
+        self._messages.append("File was analyzed successfully.")
+        self._update_checkpoint(reached)
+        self.streams = list(self.iterate_models(
+            well_formed=self.well_formed, line=line))
+        self._check_supported()
 
-        super(WarcWarctoolsFullScraper, self).scrape_file()
+    def _validate_parallel(self, size, index):
+        """
+        Validate gzip compressed file in byte ranges in parallel processes.
+
+        :size: File size
+        :index: True to collect the index entries of the records
+        :returns: Tuple (version line, index entries) if all the ranges
+                  were valid and joined, None otherwise
+        """
+        arguments = [(self.filename, start, start + self._rangesize,
+                      self._chunksize, index)
+                     for start in range(0, size, self._rangesize)]
+        results = map_in_processes(validate_member_range, arguments,
+                                   self._processes)
+
+        expected = 0
+        line = None
+        entries = []
+        for (error, first, reached, first_line, range_entries) in results:
+            if first is None:
+                # The range is inside a member started in earlier range
+                continue
+            if error is not None or first != expected:
+                return None
+            if line is None:
+                line = first_line
+            expected = reached
+            entries.extend(range_entries)
+        if expected != size:
+            return None
+        self._messages.append(
+            "Validated the records in %s parallel ranges." % len(arguments))
+        return (line, entries)
 
 
 class ArcWarctoolsScraper(BaseScraper):
@@ -123,29 +205,30 @@ class ArcWarctoolsScraper(BaseScraper):
 
     _supported_metadata = [ArcWarctoolsMeta]
     _only_wellformed = True  # Only well-formed check
+    _chunksize = 1024**2  # Maximum size of data to read or decompress
 
     def scrape_file(self):
         """
-        Scrape ARC file by converting to WARC.
+        Validate ARC file.
 
-        This is done using Warctools" arc2warc converter.
+        The records are read through once, and the record headers and
+        lengths are checked.
         """
         size = os.path.getsize(self.filename)
         if size == 0:
             self._errors.append("Empty file.")
             return
-        with tempfile.NamedTemporaryFile(prefix="scraper-warctools.") \
-                as warcfile:
-            shell = Shell(
-                command=["arc2warc", encode_path(self.filename)],
-                stdout=warcfile)
-            if shell.returncode != 0:
-                self._errors.append("Failed: returncode %s" % shell.returncode)
-                self._errors.append(sanitize_bytestring(shell.stderr_raw))
-                return
-            self._messages.append("File was analyzed successfully.")
-            if shell.stdout:
-                self._messages.append(shell.stdout)
+        try:
+            with io_open(self.filename, "rb") as infile:
+                reader = _ArchiveReader(infile, self._chunksize)
+                for _ in _iter_arc_records(reader):
+                    pass
+        except ValueError as exception:
+            self._errors.append("Error in validating ARC file.")
+            self._errors.append(six.text_type(exception))
+            return
+
+        self._messages.append("File was analyzed successfully.")
         self.streams = list(self.iterate_models(
             well_formed=self.well_formed))
         self._check_supported(allow_unav_version=True)
@@ -156,36 +239,66 @@ class GzipWarctoolsScraper(BaseScraper):
 
     _supported_metadata = [GzipWarctoolsMeta]
     _only_wellformed = True  # Only well-formed check
+    _chunksize = 1024**2  # Maximum size of data to read or decompress
     _scraper = None
 
     _supported_scrapers = [WarcWarctoolsFullScraper, ArcWarctoolsScraper]
 
     def scrape_file(self):
-        """Scrape file. If Warc fails, try Arc."""
-        original_messages = self._messages
-        for class_ in self._supported_scrapers:
-            if class_ == WarcWarctoolsFullScraper:
-                mime = "application/warc"
-            else:
-                mime = "application/x-internet-archive"
-            self._scraper = class_(filename=self.filename, mimetype=mime)
-            self._scraper.scrape_file()
-
-            # pylint: disable=protected-access
-            if self._messages and not self._scraper.well_formed:
-                self._messages = self._messages + self._scraper._messages
-            else:
-                self._messages = original_messages + self._scraper._messages
-            if self._errors and not self._scraper.well_formed:
-                self._errors = self._errors + self._scraper._errors
-            else:
-                self._errors = self._scraper._errors
-
-            if self._scraper.well_formed:
-                self.streams = list(self.iterate_models(
-                    metadata_model=self._scraper.streams))
-                self._check_supported()
-                break
+        """
+        Scrape file.
+
+        The first line of the decompressed data tells whether the file is
+        a WARC or an ARC, and only the matching scraper is used.
+        """
+        if os.path.getsize(self.filename) == 0:
+            self._errors.append("Empty file.")
+            return
+        try:
+            with io_open(self.filename, "rb") as infile:
+                class_ = self._sniff_scraper(
+                    _ArchiveReader(infile, self._chunksize))
+        except (ValueError, EOFError, zlib.error) as exception:
+            self._errors.append(six.text_type(exception))
+            return
+        if class_ is None:
+            self._errors.append("Compressed file is neither a WARC nor "
+                                "an ARC file.")
+            return
+
+        if class_ == WarcWarctoolsFullScraper:
+            mime = "application/warc"
+        else:
+            mime = "application/x-internet-archive"
+        self._scraper = class_(filename=self.filename, mimetype=mime,
+                               params=self._params)
+        self._scraper.scrape_file()
+
+        # pylint: disable=protected-access
+        self._messages = self._messages + self._scraper._messages
+        self._errors = self._errors + self._scraper._errors
+        if self._scraper.well_formed:
+            self.streams = list(self.iterate_models(
+                metadata_model=self._scraper.streams))
+            self._check_supported()
+
+    @staticmethod
+    def _sniff_scraper(reader):
+        """
+        Return the scraper class matching the first record of an archive.
+
+        :reader: _ArchiveReader of the archive
+        :returns: WarcWarctoolsFullScraper, ArcWarctoolsScraper, or None if
+                  the first record is neither WARC nor ARC record
+        """
+        line = b""
+        while not line.strip() and not reader.at_end():
+            line = reader.readline()
+        if line.startswith(b"WARC/"):
+            return WarcWarctoolsFullScraper
+        if line.startswith(b"filedesc://"):
+            return ArcWarctoolsScraper
+        return None
 
     def info(self):
         """
@@ -232,3 +345,482 @@ class GzipWarctoolsScraper(BaseScraper):
 
         self._errors.append("MIME type {} with version {} is not "
                             "supported.".format(mimetype, version))
+
+
+class _ArchiveReader(object):
+    """
+    Read a plain or gzip compressed web archive.
+
+    A gzip compressed archive may consist of several gzip members, usually
+    one for each record. The data is read and decompressed in chunks, so
+    that only about a chunk at a time is kept in memory. A new member is
+    started only when the data of the previous one has been read, so that
+    the offset of the member containing a record is known.
+    """
+
+    def __init__(self, infile, chunksize, end=None):
+        """
+        Initialize the reader.
+
+        The data is read from the current position of the file, which must
+        be at the start of a gzip member in a compressed archive.
+
+        :infile: File object opened in binary mode
+        :chunksize: Maximum size of data to read or decompress at a time
+        :end: File offset, at or after which no gzip member is started,
+              None to read to the end of the file
+        """
+        self._infile = infile
+        self._chunksize = chunksize
+        self._end = end
+        self._buffer = b""
+        self._start = 0  # Position of the unread data in the buffer
+        self._input = b""  # Compressed data not yet decompressed
+        self._read = infile.tell()  # File offset of the data read
+        self._position = self._read  # Uncompressed offset of the unread data
+        self._decompressor = None
+        self._member_offset = self._read
+        self.compressed = infile.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+        infile.seek(self._read)
+
+    @property
+    def offset(self):
+        """
+        Return the offset of the next data to be read.
+
+        For compressed archives, this is the file offset of the gzip member
+        containing the data. Call at_end() first, so that the next member
+        is started if needed.
+        """
+        if self.compressed:
+            return self._member_offset
+        return self._position
+
+    @property
+    def input_offset(self):
+        """
+        Return the file offset of the data not yet read or decompressed.
+
+        When an archive has been read to the end, this is the end of the
+        data read. For compressed archives, this is also the offset of the
+        gzip member following the members read.
+        """
+        return self._read - len(self._input)
+
+    def at_end(self):
+        """
+        Return True if all the data has been read.
+
+        :raises: EOFError if a gzip member is truncated,
+                 zlib.error if the compressed data is broken
+        """
+        while self._start == len(self._buffer):
+            if not self._fill():
+                return True
+        return False
+
+    def readline(self):
+        """
+        Read a line.
+
+        :returns: Line as byte string, empty at the end of the data
+        :raises: ValueError if the line is too long
+        """
+        while True:
+            end = self._buffer.find(b"\n", self._start)
+            if end > -1:
+                return self._take(end + 1 - self._start)
+            if len(self._buffer) - self._start > MAX_LINE:
+                raise ValueError("Line is longer than %s bytes." % MAX_LINE)
+            if not self._fill():
+                return self._take(len(self._buffer) - self._start)
+
+    def read(self, size):
+        """
+        Read data of given size, or less at the end of the data.
+
+        :size: Size of the data, at most a chunk
+        :returns: Data as byte string
+        """
+        while len(self._buffer) - self._start < size:
+            if not self._fill():
+                break
+        return self._take(size)
+
+    def iter_read(self, size):
+        """
+        Iterate data of given size in chunks.
+
+        :size: Size of the data
+        :returns: Generator of data chunks
+        :raises: EOFError if the data ends too early
+        """
+        while size > 0:
+            if self.at_end():
+                raise EOFError("Data is truncated.")
+            data = self._take(min(size, self._chunksize))
+            size -= len(data)
+            yield data
+
+    def _take(self, size):
+        """Return and consume data from the buffer."""
+        data = self._buffer[self._start:self._start + size]
+        self._start += len(data)
+        self._position += len(data)
+        return data
+
+    def _fill(self):
+        """
+        Read or decompress more data to the buffer.
+
+        :returns: False at the end of the file, True otherwise
+        :raises: EOFError if a gzip member is truncated,
+                 zlib.error if the compressed data is broken
+        """
+        if self.compressed:
+            data = self._decompress()
+            if data is None:
+                return False
+        else:
+            data = self._infile.read(self._chunksize)
+            self._read += len(data)
+            if not data:
+                return False
+        self._buffer = self._buffer[self._start:] + data
+        self._start = 0
+        return True
+
+    def _decompress(self):
+        """
+        Decompress a chunk of data, starting a new gzip member if needed.
+
+        :returns: Decompressed data, possibly empty, or None at the end of
+                  the file
+        :raises: EOFError if a gzip member is truncated,
+                 zlib.error if the compressed data is broken
+        """
+        if not self._input:
+            self._input = self._infile.read(self._chunksize)
+            self._read += len(self._input)
+        if self._decompressor is None:
+            if not self._input or (self._end is not None and
+                                   self.input_offset >= self._end):
+                return None
+            self._member_offset = self.input_offset
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if not self._input:
+            raise EOFError("Compressed file ended before the end of the gzip "
+                           "member at offset %s." % self._member_offset)
+        data = self._decompressor.decompress(self._input, self._chunksize)
+        self._input = self._decompressor.unconsumed_tail or \
+            self._decompressor.unused_data
+        # Python 2 has no eof attribute, but there the end of a member is
+        # known from the data following it
+        if getattr(self._decompressor, "eof",
+                   bool(self._decompressor.unused_data)):
+            self._decompressor = None
+        return data
+
+
+def _iter_warc_records(reader):
+    """
+    Validate WARC records.
+
+    :reader: _ArchiveReader of the archive
+    :returns: Generator of (offset, version line, header fields) tuples of
+              the records
+    :raises: ValueError if a record is invalid
+    """
+    offset = reader.offset
+    while True:
+        try:
+            if reader.at_end():
+                return
+            offset = reader.offset
+            line = reader.readline()
+            if not line.strip():
+                # Empty lines between records are ignored
+                continue
+            if not WARC_VERSION_LINE.match(line):
+                raise ValueError("WARC version line not found.")
+            headers = _read_headers(reader)
+            for field in WARC_REQUIRED_FIELDS:
+                if field not in headers:
+                    raise ValueError("Missing header field %s."
+                                     % field.decode("ascii"))
+            if not headers[b"content-length"].isdigit():
+                raise ValueError("Invalid Content-Length.")
+            _check_block(reader, int(headers[b"content-length"]),
+                         headers.get(b"warc-block-digest"))
+            if reader.read(4) != b"\r\n\r\n":
+                raise ValueError("Record block does not end with two "
+                                 "newlines, Content-Length may be wrong.")
+        except (ValueError, EOFError, zlib.error) as error:
+            raise ValueError("Record at offset %s: %s" % (offset, error))
+        yield (offset, line, headers)
+
+
+def _iter_arc_records(reader):
+    """
+    Validate ARC records.
+
+    The first record is the version block. Its header tells the number of
+    header fields in the records, which must match the version given in
+    the first line of the block. The version block is followed by the
+    records, each having a header line and a block of Archive-length
+    bytes.
+
+    :reader: _ArchiveReader of the archive
+    :returns: Generator of (offset, header line) tuples of the records
+    :raises: ValueError if a record is invalid
+    """
+    offset = reader.offset
+    field_count = None
+    while True:
+        try:
+            if reader.at_end():
+                return
+            offset = reader.offset
+            line = reader.readline()
+            if not line.strip():
+                # Empty lines between records are ignored
+                continue
+            fields = line.split()
+            if field_count is None:
+                if not line.startswith(b"filedesc://"):
+                    raise ValueError("Version block not found.")
+                if len(fields) not in ARC_FIELD_COUNTS.values():
+                    raise ValueError("Wrong number of header fields.")
+            elif len(fields) != field_count:
+                raise ValueError("Expected %s header fields, found %s."
+                                 % (field_count, len(fields)))
+            if not fields[-1].isdigit():
+                raise ValueError("Invalid Archive-length.")
+            length = int(fields[-1])
+            if field_count is None:
+                # The length of the version block is often wrong, so the
+                # version and field definition lines are read as lines
+                version_line = reader.readline()
+                version = (version_line.split() or [b""])[0]
+                if not version.isdigit() or \
+                        ARC_FIELD_COUNTS.get(int(version)) != len(fields):
+                    raise ValueError("Invalid version block.")
+                field_count = len(fields)
+                length = max(
+                    0, length - len(version_line) - len(reader.readline()))
+            if length:
+                # Archive-length of the last record may count the newline
+                # ending the file, so the last byte may be missing
+                try:
+                    _check_block(reader, length - 1, None)
+                except EOFError:
+                    raise EOFError("Record block is truncated, expected %s "
+                                   "bytes." % length)
+                reader.read(1)
+        except (ValueError, EOFError, zlib.error) as error:
+            raise ValueError("Record at offset %s: %s" % (offset, error))
+        yield (offset, line)
+
+
+def _read_headers(reader):
+    """
+    Read the header fields of a record.
+
+    :reader: _ArchiveReader of the archive
+    :returns: Dict of header fields, with lowercase names
+    :raises: ValueError if the header is invalid
+    """
+    headers = {}
+    name = None
+    while True:
+        line = reader.readline()
+        if not line.endswith(b"\n"):
+            raise EOFError("Record header is truncated.")
+        if line in (b"\r\n", b"\n"):
+            return headers
+        if line[:1] in (b" ", b"\t") and name is not None:
+            # Continuation of the previous field
+            headers[name] += b" " + line.strip()
+            continue
+        if b":" not in line:
+            raise ValueError("Invalid header line.")
+        name, value = line.split(b":", 1)
+        name = name.strip().lower()
+        headers[name] = value.strip()
+
+
+def _check_block(reader, length, block_digest):
+    """
+    Read a record block and check its digest.
+
+    Digests with an algorithm not known to hashlib are not checked.
+
+    :reader: _ArchiveReader of the archive
+    :length: Content-Length of the record
+    :block_digest: Value of WARC-Block-Digest header field, or None
+    :raises: ValueError if the digest does not match
+    """
+    hasher = None
+    if block_digest is not None:
+        algorithm, _, encoded = block_digest.partition(b":")
+        try:
+            hasher = hashlib.new(
+                algorithm.strip().decode("ascii").lower().replace("-", ""))
+        except (ValueError, UnicodeDecodeError):
+            hasher = None
+    try:
+        for data in reader.iter_read(length):
+            if hasher is not None:
+                hasher.update(data)
+    except EOFError:
+        raise EOFError("Record block is truncated, expected %s bytes."
+                       % length)
+    if hasher is None:
+        return
+    encoded = encoded.strip()
+    try:
+        if len(encoded) == 2 * hasher.digest_size:
+            expected = binascii.unhexlify(encoded)
+        else:
+            expected = base64.b32decode(encoded.upper())
+    except (TypeError, ValueError):
+        raise ValueError("Invalid WARC-Block-Digest.")
+    if hasher.digest() != expected:
+        raise ValueError("WARC-Block-Digest does not match the block.")
+
+
+def validate_member_range(filename, start, end, chunksize, index=False,
+                          search=True):
+    """
+    Validate the WARC records in the gzip members starting in a byte range.
+
+    The validation starts from the first gzip member starting in the range,
+    and continues until the next member starting at or after the end of
+    the range. A range starting from the beginning of the file, or from a
+    record boundary when search is False, is validated also if the file is
+    not compressed.
+
+    :filename: File name
+    :start: Start offset of the range
+    :end: End offset of the range, None for the end of the file
+    :chunksize: Maximum size of data to read or decompress at a time
+    :index: True to collect the index entries of the records
+    :search: True to search the first gzip member in the range, False if
+             the range starts at a record boundary
+    :returns: Tuple (error, first, reached, version line, entries), where
+              error is the error message or None, first is the offset of
+              the first gzip member or None if no member starts in the
+              range, reached is the offset of the member following the
+              range or the end of the last record, version line is the first line of
+              the first record and entries is a list of (offset, index
+              fields) tuples of the records if index is True, see
+              _index_fields()
+    """
+    line = None
+    entries = []
+    with io_open(filename, "rb") as infile:
+        first = start
+        if start > 0 and search:
+            first = _find_member(infile, start, end, chunksize)
+            if first is None:
+                return (None, None, None, None, entries)
+        infile.seek(first)
+        reader = _ArchiveReader(infile, chunksize, end)
+        try:
+            for (offset, version_line, headers) in \
+                    _iter_warc_records(reader):
+                if line is None:
+                    line = version_line
+                if index:
+                    entries.append((offset, _index_fields(headers)))
+        except ValueError as exception:
+            return (six.text_type(exception), first, None, line, entries)
+    return (None, first, reader.input_offset, line, entries)
+
+
+def _find_member(infile, start, end, chunksize):
+    """
+    Find the first gzip member starting in a byte range.
+
+    The gzip magic bytes may also occur in compressed data, so the
+    candidates are checked by decompressing the start of the member.
+
+    :infile: File object opened in binary mode
+    :start: Start offset of the range
+    :end: End offset of the range
+    :chunksize: Size of data to read at a time
+    :returns: Offset of the member, or None if not found
+    """
+    position = start
+    while position < end:
+        infile.seek(position)
+        data = infile.read(chunksize + len(GZIP_MEMBER) - 1)
+        if not data:
+            return None
+        index = data.find(GZIP_MEMBER)
+        while -1 < index < min(chunksize, end - position):
+            infile.seek(position + index)
+            try:
+                zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(
+                    infile.read(chunksize), 1)
+                return position + index
+            except zlib.error:
+                index = data.find(GZIP_MEMBER, index + 1)
+        position += chunksize
+    return None
+
+
+def _read_first_line(filename, chunksize):
+    """
+    Read the first line of a plain or gzip compressed web archive.
+
+    :filename: File name
+    :chunksize: Maximum size of data to read or decompress at a time
+    :returns: The first line as byte string
+    :raises: EOFError if the gzip member is truncated,
+             zlib.error if the compressed data is broken
+    """
+    with io_open(filename, "rb") as infile:
+        return _ArchiveReader(infile, chunksize).readline()
+
+
+def _is_compressed(filename):
+    """Return True if the file starts with gzip magic bytes."""
+    with io_open(filename, "rb") as infile:
+        return infile.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def _index_fields(headers):
+    """
+    Return the header fields of a record needed in the record index.
+
+    :headers: Dict of the header fields of a record
+    :returns: Tuple of INDEX_FIELDS values, with spaces escaped and missing
+              values marked with "-"
+    """
+    return tuple(headers.get(name, b"-").replace(b" ", b"%20") or b"-"
+                 for name in INDEX_FIELDS)
+
+
+def _write_index(path, entries, size):
+    """
+    Write an index of the records of a WARC file.
+
+    The index has a line for each record, with fields separated by spaces:
+    the offset of the record, or of the gzip member containing it, the
+    length of the record or member in the file, WARC-Type, WARC-Record-ID,
+    WARC-Target-URI and WARC-Date. Missing fields are marked with "-". A
+    compressed record can be read later by decompressing the given length
+    of data from the offset.
+
+    :path: Path of the index file
+    :entries: List of (offset, index fields) tuples of the records
+    :size: Size of the WARC file
+    """
+    offsets = sorted(set(offset for (offset, _) in entries)) + [size]
+    lengths = dict(zip(offsets, (next_offset - offset for (offset, next_offset)
+                                 in zip(offsets, offsets[1:]))))
+    with io_open(path, "wb") as outfile:
+        for (offset, fields) in entries:
+            outfile.write(b" ".join(
+                (b"%d" % offset, b"%d" % lengths[offset]) + fields) + b"\n")
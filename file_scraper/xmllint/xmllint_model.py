@@ -13,15 +13,15 @@ class XmllintMeta(BaseMeta):
     _supported = {"text/xml": ["1.0"]}  # Supported mimetype
     _allow_versions = True
 
-    def __init__(self, well_formed, tree):
+    def __init__(self, well_formed, docinfo):
         """
         Initialize the metadata model.
 
         :well_formed: Well-formed status from scraper
-        :tree: XML element tree for the scraped file
+        :docinfo: Document information of the scraped file
         """
         self._well_formed = well_formed
-        self._tree = tree
+        self._docinfo = docinfo
 
     @metadata()
     def mimetype(self):
@@ -37,8 +37,8 @@ class XmllintMeta(BaseMeta):
     def version(self):
         """Return version."""
         if self.mimetype() in self._supported and \
-                self._tree.docinfo.xml_version:
-            return self._tree.docinfo.xml_version
+                self._docinfo.xml_version:
+            return self._docinfo.xml_version
         return "(:unav)"
 
     # pylint: disable=no-self-use
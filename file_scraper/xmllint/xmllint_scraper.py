@@ -1,25 +1,46 @@
 """Class for XML file well-formed check with Xmllint."""
 from __future__ import unicode_literals
 
+import hashlib
 import os
 import tempfile
+from collections import OrderedDict
 from io import open as io_open
 
 import six
+from six.moves.urllib.parse import urljoin, urlparse
+from six.moves.urllib.request import url2pathname
 
 from file_scraper.base import BaseScraper
+from file_scraper.config import XML_CATALOG_PATH
 from file_scraper.shell import Shell
-from file_scraper.utils import ensure_text, decode_path, encode_path
+from file_scraper.utils import (ensure_text, decode_path, encode_path,
+                                iter_xml_events, scan_xml)
 from file_scraper.xmllint.xmllint_model import XmllintMeta
 
 try:
     from lxml import etree
+    # Base class of CatalogResolver, defined only if lxml is available
+    RESOLVER_BASE = etree.Resolver
 except ImportError:
-    pass
+    RESOLVER_BASE = object
 
 
-XSI = "http://www.w3.org/2001/XMLSchema-instance"
 XS = "{http://www.w3.org/2001/XMLSchema}"
+CATALOG = "{urn:oasis:names:tc:entity:xmlns:xml:catalog}"
+XML_BASE = "{http://www.w3.org/XML/1998/namespace}base"
+
+# Messages of libxml2 error domains, as given by xmllint
+ERROR_DOMAINS = {"SCHEMASV": "Schemas validity error",
+                 "SCHEMASP": "Schemas parser error",
+                 "VALID": "validity error",
+                 "PARSER": "parser error",
+                 "NAMESPACE": "namespace error",
+                 "IO": "I/O error"}
+
+VALIDATOR_CACHE_SIZE = 32  # Number of compiled validators kept in memory
+_VALIDATORS = OrderedDict()
+_RESOLVERS = {}
 
 SCHEMA_TEMPLATE = b"""<?xml version = "1.0" encoding = "UTF-8"?>
 <xs:schema xmlns="http://dummy"
@@ -37,12 +58,15 @@ class XmllintScraper(BaseScraper):
     Xmllint scraper class.
 
     This class implements a plugin interface for scraper module and
-    checks if XML files are well-formed using Xmllint tool.
+    checks if XML files are well-formed and valid using libxml2, the library
+    behind Xmllint tool, in-process through lxml.
     .. seealso:: http://xmlsoft.org/xmllint.html
     """
 
     _supported_metadata = [XmllintMeta]
     _only_wellformed = True  # Only well-formed check
+    _cache_size = 1024  # Number of constructed schemas kept in the cache
+    _stream_size = 64 * 1024**2  # Larger files are validated streaming
 
     def __init__(self, filename, mimetype, version=None, params=None):
         """
@@ -65,10 +89,10 @@ class XmllintScraper(BaseScraper):
         if params is None:
             params = {}
         self._schema = params.get("schema", None)
-        self._has_constructed_schema = False
         self._catalogs = params.get("catalogs", True)
         self._no_network = params.get("no_network", True)
         self._catalog_path = params.get("catalog_path", None)
+        self._cachepath = os.path.expanduser("~/.file-scraper/xsd-cache")
 
     @classmethod
     def is_supported(cls, mimetype, version=None,
@@ -96,7 +120,10 @@ class XmllintScraper(BaseScraper):
 
     def scrape_file(self):
         """
-        Check XML file with Xmllint and return a tuple of results.
+        Check XML file with libxml2 through lxml.
+
+        The document is parsed once and validated in-process with compiled
+        validators, which are cached for the following files.
 
         Strategy for XML file check is
             1) Try to check syntax by opening file.
@@ -106,144 +133,362 @@ class XmllintScraper(BaseScraper):
             4) If there's no external XSD read schemas used in file and do
                check againts them with schema catalog.
 
-        :returns: Tuple (status, report, errors) where
-            status -- 0 is success, anything else failure
-            report -- generated report
-            errors -- errors if encountered, else None
-
         .. seealso:: https://wiki.csc.fi/wiki/KDK/XMLTiedostomuotojenSkeemat
         """
-        # Try to check syntax by opening file in XML parser
+        # Try to check syntax by streaming the file through XML parser
         try:
-            file_ = io_open(self.filename, "rb")
-            parser = etree.XMLParser(dtd_validation=False, no_network=True)
-            tree = etree.parse(file_, parser=parser)
-            file_.close()
-        except etree.XMLSyntaxError as exception:
-            self._errors.append("Failed: document is not well-formed.")
-            self._errors.append(six.text_type(exception))
-            return
+            scan = scan_xml(self.filename)
         except IOError as exception:
             self._errors.append("Failed: missing file.")
             self._errors.append(six.text_type(exception))
             return
+        if scan.error is not None:
+            self._errors.append("Failed: document is not well-formed.")
+            self._errors.append(six.text_type(scan.error))
+            return
 
         # Try check against DTD
-        if tree.docinfo.doctype:
-            (exitcode, stdout, stderr) = self.exec_xmllint(dtd_check=True)
+        if scan.doctype:
+            errors = self.validate_dtd(scan)
 
         # Try check againts XSD
         else:
-            if not self._schema:
-                self._schema = self.construct_xsd(tree)
-                if not self._schema:
-                    # No given schema and didn't find included schemas but XML
-                    # was well formed.
-                    self._messages.append("Success: Document is well-formed "
-                                          "but does not contain schema.")
-                    self.streams = list(self.iterate_models(
-                        well_formed=self.well_formed, tree=tree))
-                    self._check_supported()
-                    return
-
-            (exitcode, stdout, stderr) = self.exec_xmllint(schema=self._schema)
-
-        if exitcode == 0:
+            if not self._schema and not self.schema_imports(scan):
+                # No given schema and didn't find included schemas but XML
+                # was well formed.
+                self._messages.append("Success: Document is well-formed "
+                                      "but does not contain schema.")
+                self.streams = list(self.iterate_models(
+                    well_formed=self.well_formed, docinfo=scan))
+                self._check_supported()
+                return
+
+            errors = self.validate_xsd(scan)
+
+        if not errors:
             self._messages.append(
-                "%s Success\n%s" % (decode_path(self.filename), stdout)
-            )
+                "%s Success" % decode_path(self.filename))
         else:
-            self._errors += stderr.splitlines()
+            self._errors += errors
             return
 
-        # Clean up constructed schemas
-        if self._has_constructed_schema:
-            os.remove(self._schema)
-
         self.streams = list(self.iterate_models(
-            well_formed=self.well_formed, tree=tree))
+            well_formed=self.well_formed, docinfo=scan))
         self._check_supported()
 
-    def construct_xsd(self, document_tree):
+    def validate_dtd(self, scan):
         """
-        Construct one schema file for the given document tree.
+        Validate the document against its DTD.
 
-        :returns: Path to the constructed XSD schema
+        An external DTD found from the local file system is compiled once
+        and kept in the validator cache. Documents with an internal DTD
+        subset or a DTD not found locally are parsed with a validating
+        parser. DTD validation is never done while streaming, since the
+        IDREF attributes are checked against all the IDs of the document
+        only after it has been parsed.
+
+        :scan: Streaming well-formed check of the document
+        :returns: List of validation errors
         """
+        dtd_path = self._local_file(scan.system_url)
+        if dtd_path is None or scan.internal_dtd:
+            return self._dtd_validate()
 
-        xsd_exists = False
+        def _compile():
+            """Compile the DTD."""
+            return etree.DTD(encode_path(dtd_path))
 
-        parser = etree.XMLParser(dtd_validation=False, no_network=True)
-        schema_tree = etree.XML(SCHEMA_TEMPLATE, parser)
+        return self._validate(("dtd", dtd_path), _compile, [dtd_path])
 
-        schema_locations = set(document_tree.xpath(
-            "//*/@xsi:schemaLocation", namespaces={"xsi": XSI}))
-        for schema_location in schema_locations:
-            xsd_exists = True
+    def validate_xsd(self, scan):
+        """
+        Validate the document against XML schema.
 
-            namespaces_locations = schema_location.strip().split()
-            # Import all found namspace/schema location pairs
-            for namespace, location in zip(*[iter(namespaces_locations)] * 2):
-                xs_import = etree.Element(XS + "import")
-                xs_import.attrib["namespace"] = namespace
-                xs_import.attrib["schemaLocation"] = location
-                schema_tree.append(xs_import)
+        The given schema or a schema constructed from the schema locations
+        in the document is compiled once and kept in the validator cache.
 
-        schema_locations = set(document_tree.xpath(
-            "//*/@xsi:noNamespaceSchemaLocation", namespaces={"xsi": XSI}))
-        for schema_location in schema_locations:
-            xsd_exists = True
+        :scan: Streaming well-formed check of the document
+        :returns: List of validation errors
+        """
+        if self._schema:
+            schema_path = os.path.abspath(self._schema)
+            key = ("schema", schema_path)
+            paths = [schema_path]
+
+            def _compile():
+                """Compile the given schema."""
+                return etree.XMLSchema(etree.parse(
+                    encode_path(schema_path), parser=self._parser()))
+        else:
+            key = ("imports", ) + tuple(self.schema_imports(scan))
+            paths = [self._local_file(location)
+                     for _, location in key[1:]]
 
-            # Check if XSD file is included in SIP
-            local_schema_location = os.path.join(
-                os.path.dirname(self.filename),
-                encode_path(schema_location)
-            )
-            if os.path.isfile(local_schema_location):
-                schema_location = local_schema_location
+            def _compile():
+                """Compile the schema constructed for the document."""
+                return etree.XMLSchema(etree.parse(
+                    self.construct_xsd(scan), parser=self._parser()))
 
-            xs_import = etree.Element(XS + "import")
-            xs_import.attrib["schemaLocation"] = decode_path(schema_location)
-            schema_tree.append(xs_import)
-        if xsd_exists:
-            # Contstruct the schema
-            _, schema = tempfile.mkstemp(
-                prefix="file-scraper-", suffix=".tmp")
-            elem_tree = etree.ElementTree(schema_tree)
-            elem_tree.write(schema)
-            self._has_constructed_schema = True
+        return self._validate(key, _compile, paths)
 
-            return schema
+    def _validate(self, key, compile_validator, paths):
+        """
+        Validate the document with a cached validator.
+
+        The cache key contains the schema set and the catalog, and the
+        modification times of the given local schema files. The warnings
+        from compiling the validator are kept in the cache and reported
+        with the validation errors every time the validator is used.
+        Files larger than _stream_size are validated against XML schema
+        while streaming them, other files are parsed to a tree, which gives
+        the line numbers of the schema validation errors. Large files with
+        a DTD are validated with xmllint, see _dtd_validate().
+
+        :key: Tuple of the schema set
+        :compile_validator: Function to compile the validator
+        :paths: Local paths of the schema files, None for the schemas not
+                found locally
+        :returns: List of validation errors
+        """
+        key = key + (self._catalogs, self._no_network, self._catalog_path)
+        key = key + tuple(_mtime(path) for path in paths)
+        try:
+            validator, compile_log = cached_validator(key, compile_validator)
+        except (etree.XMLSchemaParseError, etree.XMLSyntaxError,
+                etree.DTDParseError) as exception:
+            return format_error_log(exception.error_log) or \
+                [six.text_type(exception)]
+        if os.path.getsize(self.filename) > self._stream_size:
+            if isinstance(validator, etree.XMLSchema):
+                errors = self._stream_validate(schema=validator)
+            else:
+                errors = self._exec_xmllint()
+        else:
+            tree = etree.parse(encode_path(self.filename),
+                               parser=self._parser())
+            if validator.validate(tree):
+                errors = []
+            else:
+                errors = format_error_log(validator.error_log)
+        if not errors:
+            return []
+        return compile_log + errors
+
+    def _dtd_validate(self):
+        """
+        Validate the document against its DTD with a validating parser.
 
+        The document is parsed to a tree, so that the IDs are kept until
+        the IDREF attributes are checked at the end of the document. Files
+        larger than _stream_size are validated with xmllint instead, which
+        keeps the tree in its own process.
+
+        :returns: List of validation errors
+        """
+        if os.path.getsize(self.filename) > self._stream_size:
+            return self._exec_xmllint()
+        parser = self._parser(dtd_validation=True)
+        etree.clear_error_log()
+        try:
+            etree.parse(encode_path(self.filename), parser=parser)
+        except etree.XMLSyntaxError as exception:
+            return format_error_log(exception.error_log, self.filename) or \
+                [six.text_type(exception)]
         return []
 
-    def exec_xmllint(self, dtd_check=False, schema=None):
+    def _exec_xmllint(self):
         """
-        Execute xmllint.
+        Validate the document against its DTD with xmllint.
 
-        :dtd_check: True, if check against DTD, false otherwise
-        :schema: Schema file
-        :returns: tuple including: returncode, stdout, strderr
+        :returns: List of validation errors
         """
-        command = ["xmllint"]
-        command += ["--valid"] if dtd_check else []
-        command += ["--huge"]
-        command += ["--noout"]
+        command = ["xmllint", "--valid", "--huge", "--noout"]
         command += ["--nonet"] if self._no_network else []
         command += ["--catalogs"] if self._catalogs else []
-        command += ["--schema", schema] if schema else []
         command += [encode_path(self.filename)]
 
         if self._catalog_path is not None:
-            environment = {
-                "SGML_CATALOG_FILES": self._catalog_path
-            }
+            environment = {"SGML_CATALOG_FILES": self._catalog_path}
         else:
             environment = None
 
         shell = Shell(command, env=environment)
+        if shell.returncode == 0:
+            return []
+        return shell.stderr.splitlines() or \
+            ["xmllint failed with returncode %s." % shell.returncode]
+
+    def _stream_validate(self, **kwargs):
+        """
+        Validate the document while streaming it through a parser.
+
+        This must not be used for DTD validation, since the elements are
+        freed during the parsing, see _dtd_validate().
+
+        :kwargs: Validation arguments for the parser
+        :returns: List of validation errors
+        """
+        parser = self._parser(
+            parser_class=etree.XMLPullParser, events=("end", ),
+            base_url=decode_path(os.path.abspath(self.filename)), **kwargs)
+        etree.clear_error_log()
+        try:
+            for _ in iter_xml_events(parser, self.filename):
+                pass
+        except etree.XMLSyntaxError as exception:
+            return format_error_log(exception.error_log, self.filename) or \
+                [six.text_type(exception)]
+        return []
+
+    def _parser(self, parser_class=None, **kwargs):
+        """
+        Return XML parser for schemas and validation.
+
+        :parser_class: Parser class, XMLParser by default
+        :kwargs: Other arguments for the parser
+        :returns: XML parser
+        """
+        if parser_class is None:
+            parser_class = etree.XMLParser
+        parser = parser_class(no_network=self._no_network, huge_tree=True,
+                              **kwargs)
+        resolver = self._resolver()
+        if resolver is not None:
+            parser.resolvers.add(resolver)
+        return parser
+
+    def _resolver(self):
+        """
+        Return the catalog resolver, if catalogs are used.
+
+        :returns: CatalogResolver instance or None
+        """
+        if not self._catalogs:
+            return None
+        return catalog_resolver(self._catalog_path)
+
+    def _local_file(self, location):
+        """
+        Return local path of the DTD or schema location.
+
+        :location: System identifier or URL of the file
+        :returns: Absolute path of the file, None if not found
+        """
+        if not location:
+            return None
+        resolver = self._resolver()
+        if resolver is not None:
+            resolved = resolver.resolve_url(location)
+            if resolved is not None:
+                location = resolved
+        path = _url_to_path(urljoin(
+            _path_to_url(os.path.abspath(self.filename)), location))
+        if path is not None and os.path.isfile(path):
+            return path
+        return None
+
+    def schema_imports(self, scan):
+        """
+        Return the schemas to import for the given document.
+
+        :scan: Streaming well-formed check of the document
+        :returns: Sorted list of (namespace, location) tuples, where
+                  namespace is empty for schemas without namespace
+        """
+        imports = set()
+        for schema_location in scan.schema_locations:
+            namespaces_locations = schema_location.strip().split()
+            for namespace, location in zip(*[iter(namespaces_locations)] * 2):
+                imports.add((namespace, location))
+
+        for schema_location in scan.no_namespace_schema_locations:
+            # Check if XSD file is included in SIP
+            local_schema_location = os.path.join(
+                os.path.dirname(os.path.abspath(self.filename)),
+                encode_path(schema_location)
+            )
+            if os.path.isfile(local_schema_location):
+                schema_location = decode_path(local_schema_location)
+            imports.add(("", schema_location))
 
-        return (shell.returncode, shell.stdout, shell.stderr)
+        return sorted(imports)
+
+    def construct_xsd(self, scan):
+        """
+        Construct one schema file for the given document.
+
+        The constructed schema is kept in the cache directory under a name
+        derived from the imported namespaces and schema locations, so that
+        it is reused by other documents with the same schemas, also in
+        other processes. The least recently used schemas are removed when
+        there are more than _cache_size schemas in the cache.
+
+        :scan: Streaming well-formed check of the document
+        :returns: Path to the constructed XSD schema
+        """
+        imports = self.schema_imports(scan)
+        if not imports:
+            return []
+
+        digest = hashlib.sha1()
+        for namespace, location in imports:
+            digest.update(("%s %s\n" % (namespace, location)).encode("utf-8"))
+        schema = os.path.join(self._cachepath,
+                              "%s.xsd" % digest.hexdigest())
+        try:
+            os.utime(schema, None)
+            return schema
+        except OSError:
+            pass
+
+        parser = etree.XMLParser(dtd_validation=False, no_network=True)
+        schema_tree = etree.XML(SCHEMA_TEMPLATE, parser)
+
+        # Import all found namspace/schema location pairs
+        for namespace, location in imports:
+            xs_import = etree.Element(XS + "import")
+            if namespace:
+                xs_import.attrib["namespace"] = namespace
+            xs_import.attrib["schemaLocation"] = location
+            schema_tree.append(xs_import)
+
+        # Contstruct the schema to a temporary file and move it to the cache
+        # in one step, so that it is never read partially written
+        try:
+            os.makedirs(self._cachepath)
+        except OSError:
+            if not os.path.isdir(self._cachepath):
+                raise
+        handle, tmp_schema = tempfile.mkstemp(
+            prefix="file-scraper-", suffix=".tmp", dir=self._cachepath)
+        os.close(handle)
+        elem_tree = etree.ElementTree(schema_tree)
+        elem_tree.write(tmp_schema)
+        os.rename(tmp_schema, schema)
+        self._evict_schemas(keep=schema)
+
+        return schema
+
+    def _evict_schemas(self, keep):
+        """
+        Remove the least recently used schemas from the cache.
+
+        :keep: Path of the schema which is never removed
+        """
+        schemas = []
+        for name in os.listdir(self._cachepath):
+            path = os.path.join(self._cachepath, name)
+            if name.endswith(".xsd") and path != keep:
+                try:
+                    schemas.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        schemas.sort()
+        for _, path in schemas[:max(len(schemas) + 1 - self._cache_size, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
     def errors(self):
         """
@@ -259,7 +504,8 @@ class XmllintScraper(BaseScraper):
             line = ensure_text(error)
             if "this namespace was already imported" in line:
                 errors_to_remove.append(error)
-            if "I/O error : Attempt to load network entity" in line:
+            if "I/O error : Attempt to load network entity" in line or \
+                    "I/O error : failed to load \"http" in line:
                 errors_to_add.append(
                     "Schema definition probably missing from XML catalog")
                 errors_to_remove.append(error)
@@ -269,3 +515,208 @@ class XmllintScraper(BaseScraper):
             self._errors.append(error)
 
         return super(XmllintScraper, self).errors()
+
+
+class CatalogResolver(RESOLVER_BASE):
+    """
+    Resolver for schema and DTD locations using XML catalog.
+
+    The system, uri, public, rewriteSystem and rewriteURI entries of the
+    catalog are supported, and the catalogs given with nextCatalog and
+    delegate entries are read as well. The catalogs are read once, and the
+    locations are resolved with dictionary lookups.
+    """
+
+    def __init__(self, catalog_paths):
+        """
+        Read the catalogs.
+
+        :catalog_paths: Paths to the XML catalogs
+        """
+        super(CatalogResolver, self).__init__()
+        self._entries = {}
+        self._rewrites = {}
+        self._public = {}
+        read = set()
+        for catalog_path in catalog_paths:
+            self._read_catalog(os.path.abspath(catalog_path), read)
+        # Rewrite prefix lengths from the longest, for the longest match
+        self._rewrite_lengths = sorted(
+            set(len(start) for start in self._rewrites), reverse=True)
+
+    def _read_catalog(self, catalog_path, read):
+        """
+        Read the entries of the catalog file.
+
+        :catalog_path: Absolute path to the XML catalog
+        :read: Set of already read catalog paths
+        """
+        if catalog_path in read or not os.path.isfile(catalog_path):
+            return
+        read.add(catalog_path)
+        parser = etree.XMLParser(no_network=True, resolve_entities=False)
+        root = etree.parse(encode_path(catalog_path), parser=parser).getroot()
+        self._read_entries(root, _path_to_url(catalog_path), read)
+
+    def _read_entries(self, element, base, read):
+        """
+        Read the catalog entries in the element and its children.
+
+        :element: Catalog element
+        :base: Base URL of the element
+        :read: Set of already read catalog paths
+        """
+        if element.get(XML_BASE):
+            base = urljoin(base, element.get(XML_BASE))
+        tag = element.tag
+        if tag in [CATALOG + "system", CATALOG + "uri"]:
+            name = element.get("systemId", element.get("name"))
+            self._entries.setdefault(name, urljoin(base, element.get("uri")))
+        elif tag == CATALOG + "public":
+            self._public.setdefault(element.get("publicId"),
+                                    urljoin(base, element.get("uri")))
+        elif tag in [CATALOG + "rewriteSystem", CATALOG + "rewriteURI"]:
+            self._rewrites.setdefault(
+                element.get("systemIdStartString",
+                            element.get("uriStartString")),
+                urljoin(base, element.get("rewritePrefix")))
+        elif tag in [CATALOG + "nextCatalog", CATALOG + "delegateSystem",
+                     CATALOG + "delegateURI", CATALOG + "delegatePublic"]:
+            path = _url_to_path(urljoin(base, element.get("catalog")))
+            if path is not None:
+                self._read_catalog(path, read)
+        for child in element.iterchildren(tag=etree.Element):
+            self._read_entries(child, base, read)
+
+    def resolve_url(self, url, pubid=None):
+        """
+        Return the location mapped to the given URL in the catalog.
+
+        The longest matching rewrite prefix is used, if there is no exact
+        match.
+
+        :url: System identifier or URL
+        :pubid: Public identifier
+        :returns: Mapped URL, None if not found from the catalog
+        """
+        if url in self._entries:
+            return self._entries[url]
+        for length in self._rewrite_lengths:
+            if url and url[:length] in self._rewrites:
+                return self._rewrites[url[:length]] + url[length:]
+        return self._public.get(pubid)
+
+    def resolve(self, url, pubid, context):
+        """
+        Resolve the URL for lxml.
+
+        :url: System identifier or URL
+        :pubid: Public identifier
+        :context: Resolver context
+        :returns: Resolved input for lxml, None if not found from the catalog
+        """
+        resolved = self.resolve_url(url, pubid)
+        if resolved is None:
+            return None
+        path = _url_to_path(resolved)
+        if path is not None:
+            return self.resolve_filename(path, context)
+        return self.resolve_filename(resolved, context)
+
+
+def catalog_resolver(catalog_path=None):
+    """
+    Return the catalog resolver of the process for the given catalog.
+
+    The catalog chain is read only once in a process, and read again only
+    if the catalog file is modified.
+
+    :catalog_path: Path to XML catalog, if None, the catalogs in
+                   XML_CATALOG_FILES environment variable or the default
+                   catalog are used
+    :returns: CatalogResolver instance, None if the catalogs do not exist
+    """
+    if catalog_path is None:
+        locations = os.environ.get("XML_CATALOG_FILES",
+                                   XML_CATALOG_PATH).split()
+    else:
+        locations = [catalog_path]
+    paths = tuple(os.path.abspath(path) for path in
+                  (_url_to_path(location) for location in locations)
+                  if path is not None and os.path.isfile(path))
+    if not paths:
+        return None
+    key = paths + tuple(_mtime(path) for path in paths)
+    if key not in _RESOLVERS:
+        _RESOLVERS[key] = CatalogResolver(paths)
+    return _RESOLVERS[key]
+
+
+def cached_validator(key, compile_validator):
+    """
+    Return a compiled validator from the cache or compile a new one.
+
+    At most VALIDATOR_CACHE_SIZE validators are kept, and the least
+    recently used one is removed when the cache is full. The error log of
+    the compilation is kept with the validator, since validating a
+    document replaces the error log of the validator.
+
+    :key: Cache key
+    :compile_validator: Function to compile the validator
+    :returns: Tuple of the compiled validator and the formatted error log
+              of the compilation
+    """
+    if key in _VALIDATORS:
+        entry = _VALIDATORS.pop(key)
+    else:
+        validator = compile_validator()
+        entry = (validator, format_error_log(validator.error_log))
+        while len(_VALIDATORS) >= VALIDATOR_CACHE_SIZE:
+            _VALIDATORS.popitem(last=False)
+    _VALIDATORS[key] = entry
+    return entry
+
+
+def format_error_log(error_log, filename=None):
+    """
+    Format lxml error log entries like xmllint does.
+
+    :error_log: lxml error log
+    :filename: File path for the entries without one
+    :returns: List of error messages
+    """
+    return ["%s:%s: %s : %s" % (
+        decode_path(filename) if entry.filename == "<string>" and filename
+        else entry.filename, entry.line,
+        ERROR_DOMAINS.get(entry.domain_name, entry.domain_name),
+        entry.message) for entry in error_log]
+
+
+def _mtime(item):
+    """
+    Return the modification time of a local file.
+
+    :item: Possible path to a file
+    :returns: Modification time, None if item is not a local file
+    """
+    if isinstance(item, six.string_types) and os.path.isfile(item):
+        return os.path.getmtime(item)
+    return None
+
+
+def _path_to_url(path):
+    """Return file URL for an absolute path."""
+    return "file://" + six.moves.urllib.request.pathname2url(path)
+
+
+def _url_to_path(url):
+    """
+    Return local path for a file URL or path.
+
+    :url: URL or path
+    :returns: Path, None if URL is not a local file
+    """
+    parsed = urlparse(url)
+    if parsed.scheme in ["", "file"]:
+        return url2pathname(parsed.path)
+    return None
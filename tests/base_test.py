@@ -10,12 +10,16 @@ This module tests:
       correctly
     - That _check_supported() method gives error messages properly
     - That initialization of detector works properly
+    - That identical consecutive frames are collapsed to runs in frame
+      streams and expanded when the frames are accessed
 """
 from __future__ import unicode_literals
 
 import pytest
 
-from file_scraper.base import BaseScraper, BaseMeta, BaseDetector
+from file_scraper.base import (BaseScraper, BaseMeta, BaseDetector,
+                               FrameStreams)
+from file_scraper.exceptions import SkipElementException
 from file_scraper.utils import metadata
 from tests.common import partial_message_included
 
@@ -229,3 +233,67 @@ def test_tools(tools_given, tools_expected):
         for tool in tools_given:
             scraper._tools.append(tool)
     assert scraper.tools() == tools_expected
+
+
+class BaseMetaFrame(BaseMeta):
+    """Metadata model for a frame of an image."""
+
+    def __init__(self, index, width):
+        """
+        Initialize the metadata model.
+
+        :index: Frame index
+        :width: Frame width
+        """
+        self._index = index
+        self._width = width
+
+    @metadata()
+    def index(self):
+        """Return frame index."""
+        return self._index
+
+    @metadata()
+    def width(self):
+        """Return frame width."""
+        return self._width
+
+    @metadata(important=True)
+    def height(self):
+        """Return frame height."""
+        return "10"
+
+    # pylint: disable=no-self-use
+    @metadata()
+    def colorspace(self):
+        """Skip this element."""
+        raise SkipElementException()
+
+
+def test_frame_streams():
+    """Test collapsing identical frames to runs and expanding them."""
+    streams = FrameStreams()
+    assert not streams
+    for index, width in enumerate(["1", "1", "1", "2", "1"]):
+        streams.append(BaseMetaFrame(index, width))
+    streams.append(BaseMetaFrame(5, "1"), frame_count=3)
+
+    runs = streams.runs()
+    assert [(run.index(), run.frame_count()) for run in runs] == \
+        [(0, 3), (3, 1), (4, 4)]
+    assert runs[0].height.is_important
+    assert not hasattr(runs[0], "colorspace")
+
+    assert streams
+    assert len(streams) == 8
+    assert [frame.index() for frame in streams] == list(range(8))
+    assert [frame.width() for frame in streams] == \
+        ["1", "1", "1", "2", "1", "1", "1", "1"]
+    assert streams[6].index() == 6
+    assert streams[-1].index() == 7
+    assert streams[6].frame_count() == 1
+    assert [method.__name__ for method in
+            streams[2].iterate_metadata_methods()] == \
+        ["index", "height", "mimetype", "stream_type", "version", "width"]
+    with pytest.raises(IndexError):
+        streams[8]  # pylint: disable=pointless-statement
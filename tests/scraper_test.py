@@ -17,12 +17,17 @@ This module tests that:
       file type if provided.
     - Character encoding detection works and respects the predefined file type
       if provided.
+    - Scraping several files in a batch gives the same results as scraping
+      them one by one.
+    - A checkpoint is given for well-formed append-only files, and it is
+      used in the next scraping of the file.
 """
 from __future__ import unicode_literals
 
 import pytest
+import six
 
-from file_scraper.scraper import Scraper
+from file_scraper.scraper import Scraper, scrape_batch
 
 
 def test_is_textfile():
@@ -142,3 +147,43 @@ def test_charset_parameter(charset):
     scraper.detect_filetype()
     # pylint: disable=protected-access
     assert scraper._params["charset"] == charset or "UTF-8"
+
+
+def test_scrape_batch():
+    """Test that batch scraping gives the same results as single files."""
+    filenames = ["tests/data/text_plain/valid__ascii.txt",
+                 "tests/data/image_png/valid_1.2.png",
+                 "tests/data/image_png/invalid_1.2_wrong_CRC.png",
+                 "tests/data/application_pdf/valid_1.2.pdf",
+                 "nonexistent_file"]
+    scrapers = scrape_batch(filenames)
+    assert [scraper.filename for scraper in scrapers] == \
+        [Scraper(filename).filename for filename in filenames]
+    for filename, batch_scraper in zip(filenames, scrapers):
+        scraper = Scraper(filename)
+        scraper.scrape()
+        assert batch_scraper.well_formed == scraper.well_formed
+        assert batch_scraper.streams == scraper.streams
+        assert batch_scraper.mimetype == scraper.mimetype
+
+
+def test_checkpoint(tmpdir):
+    """Test that the checkpoint is returned and used for appended files."""
+    path = tmpdir.join("appended.txt")
+    path.write_binary(b"first line\n")
+    scraper = Scraper(six.text_type(path), mimetype="text/plain",
+                      charset="ISO-8859-15")
+    scraper.scrape()
+    assert scraper.well_formed
+    assert scraper.checkpoint["offset"] == path.size()
+
+    with path.open("ab") as outfile:
+        outfile.write(b"second line\n")
+    scraper = Scraper(six.text_type(path), mimetype="text/plain",
+                      charset="ISO-8859-15", checkpoint=scraper.checkpoint)
+    scraper.scrape()
+    assert scraper.well_formed
+    assert scraper.checkpoint["offset"] == path.size()
+    assert any("resumed from the checkpoint" in message
+               for info in scraper.info.values()
+               for message in info["messages"])
@@ -26,6 +26,14 @@ This module tests that:
       parameter.
     - Non-existent files are not well-formed and the inability to read the
       file is logged as an error.
+    - Large files are split to ranges at record boundaries outside quoted
+      fields, and validated in parallel with the global line number of the
+      first error reported. Only the data of the range is streamed to the
+      reader.
+    - Without well-formed check, only the first record is read, so errors
+      later in the file and mismatching field counts are not reported.
+    - Validation is resumed from a matching checkpoint, and only the
+      appended records are validated.
 """
 from __future__ import unicode_literals
 
@@ -34,7 +42,8 @@ import pytest
 import six
 
 from file_scraper.csv.csv_model import CsvMeta
-from file_scraper.csv.csv_scraper import CsvScraper
+from file_scraper.csv.csv_scraper import (CsvScraper, find_record_ranges,
+                                          validate_range)
 from tests.common import parse_results, partial_message_included
 
 MIMETYPE = "text/csv"
@@ -287,3 +296,173 @@ def test_is_supported():
     assert CsvScraper.is_supported(mime, ver, False)
     assert CsvScraper.is_supported(mime, "foo", True)
     assert not CsvScraper.is_supported("foo", ver, True)
+
+
+def _quoted_csv(broken_line=None):
+    """
+    Return CSV content with line feeds in quoted fields.
+
+    :broken_line: Index of a record to break, None for valid content
+    :returns: CSV content
+    """
+    records = []
+    for index in range(300):
+        if index == broken_line:
+            records.append('%s;"broken"x;y\n' % index)
+        elif index % 3 == 0:
+            records.append('%s;"quoted\n""field";z\n' % index)
+        else:
+            records.append("%s;x;y\n" % index)
+    return "".join(records)
+
+
+def test_find_record_ranges(tmpdir):
+    """
+    Test that ranges end at record boundaries outside quoted fields.
+    """
+    content = _quoted_csv().encode("UTF-8")
+    path = tmpdir.join("ranges.csv")
+    path.write_binary(content)
+    ranges = find_record_ranges(six.text_type(path), 100, blocksize=37)
+
+    assert len(ranges) > 1
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(content)
+    for (start, end, lines_before) in ranges:
+        assert content[:start].count(b"\n") == lines_before
+        assert content[start:end].count(b'"') % 2 == 0
+        assert content[start:end].endswith(b"\n")
+
+
+@pytest.mark.parametrize(
+    ["start", "end", "error", "line_num"],
+    [
+        (0, 14, None, 3),
+        (4, 14, None, 2),
+        (0, 26, "unexpected end of data", 5),
+    ]
+)
+def test_validate_range(tmpdir, start, end, error, line_num):
+    """
+    Test that only the given byte range is streamed to the reader.
+
+    :start: Start of the range
+    :end: End of the range
+    :error: Part of the expected error, None for valid range
+    :line_num: Expected line number in the range
+    """
+    path = tmpdir.join("range.csv")
+    path.write_binary("a,b\n1,2\n\u00e4,\u00f6\n\"3,4\nbroken\n".encode(
+        "UTF-8"))
+    (range_error, range_line) = validate_range(
+        six.text_type(path), start, end, "UTF-8", ",", "\n")
+    if error is None:
+        assert range_error is None
+    else:
+        assert error in range_error
+    assert range_line == line_num
+
+
+@pytest.mark.parametrize(
+    ["broken_line", "stderr_part"],
+    [
+        (None, None),
+        (250, "CSV error on line 335"),
+    ]
+)
+def test_parallel(tmpdir, monkeypatch, broken_line, stderr_part):
+    """
+    Test parallel validation of large files.
+
+    :broken_line: Index of a broken record, None for valid file
+    :stderr_part: Part of the expected errors, None for valid file
+    """
+    monkeypatch.setattr(CsvScraper, "_parallel_size", 0)
+    monkeypatch.setattr(CsvScraper, "_chunksize", 500)
+    monkeypatch.setattr(CsvScraper, "_processes", 2)
+    path = tmpdir.join("parallel.csv")
+    path.write_binary(_quoted_csv(broken_line).encode("UTF-8"))
+    scraper = CsvScraper(filename=six.text_type(path), mimetype=MIMETYPE,
+                         params={"delimiter": ";", "separator": "\n",
+                                 "charset": "UTF-8"})
+    scraper.scrape_file()
+
+    if stderr_part is None:
+        assert scraper.well_formed
+    else:
+        assert not scraper.well_formed
+        assert partial_message_included(stderr_part, scraper.errors())
+
+
+@pytest.mark.parametrize(
+    ["check_wellformed", "well_formed"],
+    [
+        (True, False),
+        (False, True),
+    ]
+)
+def test_first_record_only(check_wellformed, well_formed):
+    """
+    Test that only the first record is read without well-formed check.
+
+    :check_wellformed: True for well-formed check
+    :well_formed: Expected well-formedness
+    """
+    scraper = CsvScraper(
+        filename=os.path.join(TEST_DATA_PATH,
+                              "invalid__missing_end_quote.csv"),
+        mimetype=MIMETYPE,
+        params={"delimiter": ",", "separator": "\n", "fields": ["year"],
+                "check_wellformed": check_wellformed})
+    scraper.scrape_file()
+
+    assert scraper.well_formed == well_formed
+    assert scraper.streams[0].first_line() == \
+        ["1997", "Ford", "E350", "ac, abs, moon", "3000.00"]
+
+
+@pytest.mark.parametrize(
+    ["appended", "resumed", "stderr_part"],
+    [
+        ('4;"d"\n5;"e"\n', True, None),
+        ('4;"d"\n5;"e\n', True, "line number counted from the checkpoint"),
+        (None, False, None),
+    ]
+)
+def test_checkpoint(tmpdir, appended, resumed, stderr_part):
+    """
+    Test validation of appended records from a checkpoint.
+
+    :appended: Records appended after the checkpoint, None to rewrite the
+               file
+    :resumed: True if the validation should be resumed from the checkpoint
+    :stderr_part: Part of the expected errors, None for valid file
+    """
+    params = {"delimiter": ";", "separator": "\n", "charset": "UTF-8"}
+    path = tmpdir.join("appended.csv")
+    path.write_binary(b'1;"a"\n2;"b"\n3;"c"\n')
+    scraper = CsvScraper(filename=six.text_type(path), mimetype=MIMETYPE,
+                         params=params)
+    scraper.scrape_file()
+    checkpoint = scraper.checkpoint
+    assert checkpoint["offset"] == path.size()
+
+    if appended is None:
+        path.write_binary(b'1;"x"\n2;"b"\n3;"c"\n4;"d"\n')
+    else:
+        with path.open("ab") as outfile:
+            outfile.write(appended.encode("UTF-8"))
+    params["checkpoint"] = checkpoint
+    scraper = CsvScraper(filename=six.text_type(path), mimetype=MIMETYPE,
+                         params=params)
+    scraper.scrape_file()
+
+    assert partial_message_included("resumed from the checkpoint",
+                                    scraper.messages()) == resumed
+    if stderr_part is None:
+        assert scraper.well_formed
+        assert scraper.checkpoint["offset"] == path.size()
+    else:
+        assert not scraper.well_formed
+        assert partial_message_included(stderr_part, scraper.errors())
+        assert scraper.checkpoint is None
@@ -14,6 +14,11 @@ This module tests that:
       text/xml files but not for text/html files.
     - A made up MIME type with correct version is reported as not supported.
     - Scraper works as designed with charset parameter.
+    - The encoding is read from the beginning of the file, and the whole
+      file is scanned only if the root element does not start there. Both
+      recover from a malformed prolog.
+    - The encoding of HTML files is read from the meta element, also if the
+      element is in XHTML namespace or the whole file is scanned.
 """
 from __future__ import unicode_literals
 
@@ -112,3 +117,93 @@ def test_charset(filename, mimetype, charset, well_formed):
     else:
         assert partial_message_included("encoding not defined",
                                         scraper.errors())
+
+
+@pytest.mark.parametrize(
+    ["prefix", "prolog_size"],
+    [("", 128), ("<!-- %s -->" % ("x" * 200), 128), ("", 4096)]
+)
+def test_prolog(testpath, prefix, prolog_size):
+    """
+    Test that the encoding is found from the prolog of the file.
+
+    :prefix: Content before the root element
+    :prolog_size: Size of the beginning of the file to parse
+    """
+    # pylint: disable=protected-access
+    xml = """<?xml version="1.0" encoding="ISO-8859-15" ?>%s
+              <a>%s</a>""" % (prefix, "<b>åäö</b>" * 1000)
+    tmppath = os.path.join(testpath, "valid__.xml")
+    with io.open(tmppath, "wb") as file_:
+        file_.write(xml.encode("latin_1"))
+
+    scraper = LxmlScraper(filename=tmppath, mimetype="text/xml",
+                          params={"charset": "ISO-8859-15"})
+    scraper._prolog_size = prolog_size
+    assert (scraper._prolog_docinfo() is None) == bool(prefix)
+    scraper.scrape_file()
+    assert scraper.well_formed
+    assert scraper.streams[0].charset() == "ISO-8859-15"
+
+
+@pytest.mark.parametrize("prolog_size", [128, 4096])
+def test_malformed_prolog(testpath, prolog_size):
+    """
+    Test that the encoding is found also from a malformed prolog.
+
+    The comment before the root element contains a double hyphen, and it
+    does not fit to the beginning of the file with the smaller size.
+
+    :prolog_size: Size of the beginning of the file to parse
+    """
+    # pylint: disable=protected-access
+    xml = """<?xml version="1.0" encoding="ISO-8859-15" ?>
+              <!-- %s -- -->
+              <a>%s</a>""" % ("x" * 200, "<b>åäö</b>" * 1000)
+    tmppath = os.path.join(testpath, "valid__.xml")
+    with io.open(tmppath, "wb") as file_:
+        file_.write(xml.encode("latin_1"))
+
+    scraper = LxmlScraper(filename=tmppath, mimetype="text/xml",
+                          params={"charset": "ISO-8859-15"})
+    scraper._prolog_size = prolog_size
+    scraper.scrape_file()
+    assert scraper.well_formed
+    assert scraper.streams[0].charset() == "ISO-8859-15"
+
+
+@pytest.mark.parametrize("prolog_size", [16, 4096])
+@pytest.mark.parametrize(
+    ["meta", "charset"],
+    [('<meta charset="ISO-8859-15">', "ISO-8859-15"),
+     ('<META http-equiv="Content-Type" '
+      'content="text/html; charset=ISO-8859-15">', "ISO-8859-15"),
+     ('<meta xmlns="http://www.w3.org/1999/xhtml" charset="ISO-8859-15">',
+      "ISO-8859-15"),
+     ("", "UTF-8")]
+)
+def test_html_meta_charset(testpath, meta, charset, prolog_size):
+    """
+    Test that the encoding of HTML file is read from the meta element.
+
+    The root element does not start in the beginning of the file with the
+    smaller size, and the whole file is scanned.
+
+    :meta: Meta element in the HTML header
+    :charset: Expected character encoding
+    :prolog_size: Size of the beginning of the file to parse
+    """
+    # pylint: disable=protected-access
+    html = """<!DOCTYPE html>
+              <html><head>%s<title>Title</title></head>
+              <body><p>Text<br></p></body></html>""" % meta
+    tmppath = os.path.join(testpath, "valid__.html")
+    with io.open(tmppath, "wb") as file_:
+        file_.write(html.encode("ascii"))
+
+    scraper = LxmlScraper(filename=tmppath, mimetype="text/html",
+                          params={"charset": charset})
+    scraper._prolog_size = prolog_size
+    scraper.scrape_file()
+    assert scraper.well_formed
+    assert scraper.streams[0].charset() == charset
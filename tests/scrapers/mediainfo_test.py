@@ -22,11 +22,14 @@ This module tests that:
         - video/MP2T, ''
     - These MIME types are also supported with a made up version.
     - Made up MIME types are not supported.
+    - Track information is resolved once and shared by all metadata models
+      of a file.
 """
 from __future__ import unicode_literals
 
 import pytest
 
+from file_scraper.mediainfo.mediainfo_model import MediainfoTracks
 from file_scraper.mediainfo.mediainfo_scraper import MediainfoScraper
 from tests.common import (parse_results, partial_message_included)
 from tests.scrapers.stream_dicts import (AVI_CONTAINER,
@@ -455,3 +458,26 @@ def test_is_supported(mime, ver):
     assert MediainfoScraper.is_supported(mime, ver, False)
     assert MediainfoScraper.is_supported(mime, "foo", True)
     assert not MediainfoScraper.is_supported("foo", ver, True)
+
+
+def test_shared_track_info():
+    """
+    Test that all metadata models of a file share the same track information.
+
+    The container status is resolved once per set of container formats.
+    """
+    scraper = MediainfoScraper(
+        filename="tests/data/video_x-matroska/valid_4_ffv1_flac.mkv",
+        mimetype="video/x-matroska")
+    scraper.scrape_file()
+
+    # pylint: disable=protected-access
+    tracks = scraper.streams[0]._tracks
+    assert isinstance(tracks, MediainfoTracks)
+    assert all(stream._tracks is tracks for stream in scraper.streams)
+    assert tracks.hascontainer(["Matroska"])
+    assert list(tracks._containers) == [("Matroska",)]
+    assert tracks.track_types["General"] == [0]
+    assert len(tracks.tracks_of_type("Video")) == 1
+    assert len(tracks.tracks_of_type("Audio")) == 1
+    assert tracks.codec_names[:2] == ["Matroska", "FFV1"]
@@ -17,12 +17,32 @@ This module tests that:
         - image/gif, 1987a
     - These MIME types are also supported with None or a made up version.
     - A made up MIME type with any of these versions is not supported.
+    - With decode check, the image data of tif and png files is decoded
+      strip by strip or row by row, and truncated or broken image data is
+      reported with the failing row or strip. LZW and PackBits compressed
+      tif image data is decoded only in full decode check, and other
+      compressions are told in the messages. Png image data must end after
+      the last row.
+    - The decompression bomb limit of PIL does not prevent reading the
+      headers of large images, and the limit is restored afterwards.
+    - Decode check is supported only for tif and png files with
+      well-formedness check and decode_check parameter.
 """
 from __future__ import unicode_literals
 
+import io
+import struct
+import zlib
+
 import pytest
+import six
+
+try:
+    import PIL.Image
+except ImportError:
+    pass
 
-from file_scraper.pil.pil_scraper import PilScraper
+from file_scraper.pil.pil_scraper import PilDecodeScraper, PilScraper
 from tests.common import (parse_results, partial_message_included)
 
 VALID_MSG = "successfully"
@@ -352,3 +372,229 @@ def test_is_supported(mime, ver):
     assert PilScraper.is_supported(mime, ver, False)
     assert PilScraper.is_supported(mime, "foo", True)
     assert not PilScraper.is_supported("foo", ver, True)
+
+
+@pytest.mark.parametrize(
+    ["filename", "mimetype", "stderr_part"],
+    [
+        ("tests/data/image_tiff/valid_6.0.tif", "image/tiff", None),
+        ("tests/data/image_tiff/valid_6.0_multiple_tiffs.tif", "image/tiff",
+         None),
+        ("tests/data/image_png/valid_1.2.png", "image/png", None),
+        ("tests/data/image_png/valid_1.2_LA.png", "image/png", None),
+        ("tests/data/image_png/invalid_1.2_no_IEND.png", "image/png",
+         "IEND chunk not found"),
+        ("tests/data/image_png/invalid__empty.png", "image/png",
+         "Error in decoding image data."),
+    ]
+)
+def test_decode_scraper(filename, mimetype, stderr_part):
+    """
+    Test decode check of the image data.
+
+    :filename: Test file name
+    :mimetype: File MIME type
+    :stderr_part: Part of the expected errors, None for valid file
+    """
+    scraper = PilDecodeScraper(filename=filename, mimetype=mimetype)
+    scraper.scrape_file()
+
+    if stderr_part is None:
+        assert scraper.well_formed
+        assert partial_message_included("decoded successfully",
+                                        scraper.messages())
+    else:
+        assert not scraper.well_formed
+        assert partial_message_included(stderr_part, scraper.errors())
+
+
+@pytest.mark.parametrize(
+    ["image_format", "options", "mimetype", "broken", "stderr_part"],
+    [
+        ("PNG", {}, "image/png", "truncate", "Image data ends in row 149"),
+        ("TIFF", {"compression": "tiff_adobe_deflate"}, "image/tiff",
+         "alter", "Decoding failed in strip or tile 0 of frame 0"),
+    ]
+)
+def test_decode_scraper_broken(tmpdir, image_format, options, mimetype,
+                               broken, stderr_part):
+    """
+    Test that broken image data is found with decode check.
+
+    The image data is truncated from the middle or altered.
+
+    :image_format: PIL format of the test image
+    :options: PIL options for saving the test image
+    :mimetype: MIME type of the test image
+    :broken: "truncate" to truncate the file or "alter" to alter image data
+    :stderr_part: Part of the expected errors
+    """
+    output = io.BytesIO()
+    PIL.Image.effect_noise((200, 300), 50).save(output, image_format,
+                                                **options)
+    data = bytearray(output.getvalue())
+    if broken == "truncate":
+        data = data[:len(data) // 2]
+    else:
+        data[40] ^= 0xff
+    path = tmpdir.join("broken_image")
+    path.write_binary(bytes(data))
+
+    scraper = PilDecodeScraper(filename=six.text_type(path),
+                               mimetype=mimetype)
+    scraper.scrape_file()
+
+    assert not scraper.well_formed
+    assert partial_message_included(stderr_part, scraper.errors())
+
+
+@pytest.mark.parametrize(
+    ["compression", "mode", "broken", "decode_check", "stderr_part"],
+    [
+        ("tiff_lzw", "L", None, "full", None),
+        ("tiff_lzw", "L", b"\xff", "full", "Invalid LZW code"),
+        ("tiff_lzw", "L", b"\xff", True, None),
+        ("packbits", "RGB", None, "full", None),
+        ("packbits", "RGB", b"\x80" * 1000, "full", "Expected 65400 bytes"),
+        ("packbits", "RGB", b"\x80" * 1000, True, None),
+    ],
+    ids=["lzw", "lzw_broken", "lzw_not_full", "packbits",
+         "packbits_broken", "packbits_not_full"]
+)
+def test_decode_tiff_compression(tmpdir, compression, mode, broken,
+                                 decode_check, stderr_part):
+    """
+    Test decode check of LZW and PackBits compressed tiff image data.
+
+    The image data is decoded only in full decode check, otherwise it is
+    told in the messages that only the presence of the data was checked.
+
+    :compression: PIL compression of the test image
+    :mode: PIL mode of the test image
+    :broken: Bytes to replace the start of the first strip with, None for
+             a valid image
+    :decode_check: Value of the decode_check parameter
+    :stderr_part: Part of the expected errors, None for valid image
+    """
+    output = io.BytesIO()
+    PIL.Image.effect_noise((200, 300), 50).convert(mode).save(
+        output, "TIFF", compression=compression)
+    data = bytearray(output.getvalue())
+    if broken is not None:
+        output.seek(0)
+        offset = PIL.Image.open(output).tag_v2[273][0]
+        data[offset:offset + len(broken)] = broken
+    path = tmpdir.join("image.tif")
+    path.write_binary(bytes(data))
+
+    scraper = PilDecodeScraper(filename=six.text_type(path),
+                               mimetype="image/tiff",
+                               params={"decode_check": decode_check})
+    scraper.scrape_file()
+
+    if stderr_part is None:
+        assert scraper.well_formed
+        assert partial_message_included("decoded successfully",
+                                        scraper.messages())
+        assert partial_message_included(
+            "decoded only in full decode check",
+            scraper.messages()) == (decode_check != "full")
+    else:
+        assert not scraper.well_formed
+        assert partial_message_included(stderr_part, scraper.errors())
+
+
+def test_decode_tiff_unsupported(tmpdir):
+    """Test that unsupported tiff compression is told in the messages."""
+    path = tmpdir.join("image.tif")
+    PIL.Image.effect_noise((200, 300), 50).convert("1").save(
+        six.text_type(path), "TIFF", compression="group4")
+
+    scraper = PilDecodeScraper(filename=six.text_type(path),
+                               mimetype="image/tiff")
+    scraper.scrape_file()
+
+    assert scraper.well_formed
+    assert partial_message_included(
+        "Decode check is not supported for compression 4",
+        scraper.messages())
+
+
+def test_decode_png_stream_end(tmpdir):
+    """Test that png image data without the end of the stream is found."""
+    rows = b"".join(b"\x00" + b"\x80" * 10 for _ in range(10))
+    compressor = zlib.compressobj()
+    image_data = compressor.compress(rows) + \
+        compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def _chunk(chunk_type, data):
+        """Return png chunk."""
+        return struct.pack(">I", len(data)) + chunk_type + data + \
+            struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff)
+
+    path = tmpdir.join("image.png")
+    path.write_binary(
+        b"\x89PNG\r\n\x1a\n" +
+        _chunk(b"IHDR", struct.pack(">IIBBBBB", 10, 10, 8, 0, 0, 0, 0)) +
+        _chunk(b"IDAT", image_data) + _chunk(b"IEND", b""))
+
+    scraper = PilDecodeScraper(filename=six.text_type(path),
+                               mimetype="image/png")
+    scraper.scrape_file()
+
+    assert not scraper.well_formed
+    assert partial_message_included(
+        "Compressed image data does not end after the last row",
+        scraper.errors())
+
+
+@pytest.mark.parametrize(
+    ["scraper_class", "filename", "mimetype"],
+    [
+        (PilScraper, "tests/data/image_png/valid_1.2.png", "image/png"),
+        (PilScraper, "tests/data/image_tiff/valid_6.0_multiple_tiffs.tif",
+         "image/tiff"),
+        (PilDecodeScraper, "tests/data/image_png/valid_1.2.png",
+         "image/png"),
+        (PilDecodeScraper,
+         "tests/data/image_tiff/valid_6.0_multiple_tiffs.tif", "image/tiff"),
+    ]
+)
+def test_decompression_bomb_limit(monkeypatch, scraper_class, filename,
+                                  mimetype):
+    """
+    Test that the decompression bomb limit of PIL is lifted only while
+    the scraper reads the headers.
+
+    :scraper_class: Scraper class
+    :filename: Test file name
+    :mimetype: File MIME type
+    """
+    monkeypatch.setattr(PIL.Image, "MAX_IMAGE_PIXELS", 10)
+    scraper = scraper_class(filename=filename, mimetype=mimetype)
+    scraper.scrape_file()
+    assert scraper.well_formed
+    assert PIL.Image.MAX_IMAGE_PIXELS == 10
+
+
+@pytest.mark.parametrize(
+    ["mime", "check_wellformed", "params", "supported"],
+    [
+        ("image/tiff", True, {"decode_check": True}, True),
+        ("image/png", True, {"decode_check": True}, True),
+        ("image/png", False, {"decode_check": True}, False),
+        ("image/png", True, {}, False),
+        ("image/jpeg", True, {"decode_check": True}, False),
+    ]
+)
+def test_decode_is_supported(mime, check_wellformed, params, supported):
+    """
+    Test is_supported method of decode scraper.
+
+    :mime: MIME type
+    :check_wellformed: True for well-formedness check
+    :params: Scraper parameters
+    :supported: Expected result
+    """
+    assert PilDecodeScraper.is_supported(
+        mime, None, check_wellformed, params) == supported
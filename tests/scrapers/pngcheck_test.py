@@ -11,11 +11,16 @@ This module tests that:
       version when well-formedness is checked.
     - When well-formedness is not checked, image/png 1.2 is not supported.
     - A made up MIME type is not supported.
+    - Several files are checked in one pngcheck run, and the output of each
+      file is preloaded for its scraper. Files whose output can not be
+      split from the run are not preloaded, so that they are run
+      separately.
 """
 from __future__ import unicode_literals
 
 import pytest
 
+from file_scraper.pngcheck import pngcheck_scraper
 from file_scraper.pngcheck.pngcheck_scraper import PngcheckScraper
 from tests.common import parse_results
 
@@ -73,3 +78,49 @@ def test_is_supported():
     assert not PngcheckScraper.is_supported(mime, ver, False)
     assert PngcheckScraper.is_supported(mime, "foo", True)
     assert not PngcheckScraper.is_supported("foo", ver, True)
+
+
+@pytest.mark.parametrize(
+    ["returncode", "stdout", "stderr", "preloaded"],
+    [
+        (0, b"OK: a.png (1x1, 8-bit)\nOK: b.png (1x1, 8-bit)\n", b"",
+         {b"a.png": 0, b"b.png": 0}),
+        (2, b"CRC error\nERROR: a.png\nOK: b.png (1x1, 8-bit)\n", b"",
+         {b"a.png": 2}),
+        (0, b"OK: a.png (1x1, 8-bit)\nOK: b.png (1x1, 8-bit)\n",
+         b"warning\n", {}),
+        (0, b"OK: b.png (1x1, 8-bit)\n", b"", {}),
+        (0, b"OK: a.png (1x1, 8-bit)\n", b"", {b"a.png": 0}),
+    ]
+)
+def test_preload_batch(monkeypatch, returncode, stdout, stderr, preloaded):
+    """
+    Test that only the outputs which can be split from a pngcheck run of
+    several files are preloaded.
+
+    :returncode: Return code of the pngcheck run
+    :stdout: Output of the pngcheck run
+    :stderr: Error output of the pngcheck run
+    :preloaded: Dict of the preloaded file names and return codes
+    """
+    class _Shell(object):
+        """Pngcheck run with the given output."""
+
+        def __init__(self, command):
+            assert command == ["pngcheck", b"a.png", b"b.png"]
+            self.returncode = returncode
+            self.stdout_raw = stdout
+            self.stderr_raw = stderr
+
+    results = {}
+
+    def _preload(command, returncode, stdout, stderr):
+        """Collect the preloaded results."""
+        assert command[1] in stdout.splitlines()[-1]
+        assert stderr == b""
+        results[command[1]] = returncode
+
+    monkeypatch.setattr(pngcheck_scraper, "Shell", _Shell)
+    monkeypatch.setattr(pngcheck_scraper, "preload", _preload)
+    PngcheckScraper.preload_batch(["a.png", "b.png"])
+    assert results == preloaded
@@ -30,12 +30,26 @@ This module tests that:
 
     - Schematron removes extra copies of identical elements, but not if their
       attributes differ.
+
+    - Schematron files are compiled to the given cache directory once, no
+      temporary files are left, and the least recently used compiled files
+      are removed when the cache is full.
+    - Duplicate filtering handles large reports, and keeps fired rules with
+      a different context.
+    - SVRL report can be written to a file instead of the messages.
+    - Several schematron files are applied to the document, and their
+      reports are merged, also when the first report is empty.
+    - The compiled validator is run in-process and kept in memory for the
+      following files, unless cache is disabled.
+    - The messages of the transform are reported as errors, also when the
+      message terminates the transform.
 """
 from __future__ import unicode_literals
 
 import os
 import pytest
 
+from file_scraper.schematron import schematron_scraper
 from file_scraper.schematron.schematron_scraper import SchematronScraper
 from tests.common import (parse_results, partial_message_included)
 
@@ -168,3 +182,186 @@ def test_filter_duplicate_elements():
     assert result.count(b"<svrl:active-pattern") == 1
     assert result.count(b"<svrl:fired-rule") == 1
     assert result.count(b"<svrl:failed-assert") == 2
+
+
+def test_filter_large_report():
+    """Test duplicate element filtering of a large report."""
+    # pylint: disable=protected-access
+    rules = "".join('<svrl:fired-rule context="%s"/>' % (index // 2)
+                    for index in range(40000))
+    schtest = ('<svrl:schematron-output '
+               'xmlns:svrl="http://purl.oclc.org/dsdl/svrl">%s'
+               '</svrl:schematron-output>' % rules).encode("utf-8")
+    scraper = SchematronScraper("filename", "text/xml")
+    result = scraper._filter_duplicate_elements(schtest)
+    assert result.count(b"<svrl:fired-rule") == 20000
+
+
+@pytest.mark.parametrize("verbose", [True, False])
+def test_svrl_path(tmpdir, monkeypatch, verbose):
+    """Test writing the SVRL report to a file."""
+    xslt = tmpdir.join("local.sch.abc.validator.xsl")
+    xslt.write(
+        '<xsl:stylesheet version="1.0" '
+        'xmlns:xsl="http://www.w3.org/1999/XSL/Transform" '
+        'xmlns:svrl="http://purl.oclc.org/dsdl/svrl">'
+        '<xsl:template match="/"><svrl:schematron-output>'
+        '<svrl:fired-rule context="/"/><svrl:fired-rule context="/"/>'
+        '<svrl:failed-assert test="false()"/>'
+        '</svrl:schematron-output></xsl:template></xsl:stylesheet>')
+    monkeypatch.setattr(SchematronScraper, "_compile_schematron",
+                        lambda self, schematron_file=None: str(xslt))
+    svrl_path = str(tmpdir.join("report.svrl"))
+
+    scraper = SchematronScraper(
+        filename="tests/data/text_xml/valid_1.0_well_formed.xml",
+        mimetype="text/xml",
+        params={"schematron": "local.sch", "verbose": verbose,
+                "svrl_path": svrl_path})
+    scraper.scrape_file()
+    assert not scraper.well_formed
+    assert partial_message_included("report written", scraper.messages())
+    with open(svrl_path, "rb") as report:
+        result = report.read()
+    assert result.count(b"<svrl:fired-rule") == (2 if verbose else 1)
+    assert b"<svrl:failed-assert" in result
+
+
+@pytest.mark.parametrize("cache", [True, False])
+def test_transform_cache(tmpdir, monkeypatch, cache):
+    """Test that the compiled validator is run from the memory cache."""
+    # pylint: disable=protected-access
+    xslt = tmpdir.join("local.sch.abc.validator.xsl")
+    xslt.write(
+        '<xsl:stylesheet version="1.0" '
+        'xmlns:xsl="http://www.w3.org/1999/XSL/Transform" '
+        'xmlns:svrl="http://purl.oclc.org/dsdl/svrl">'
+        '<xsl:template match="/"><svrl:schematron-output>'
+        '<svrl:fired-rule context="/"/><svrl:fired-rule context="/"/>'
+        '</svrl:schematron-output></xsl:template></xsl:stylesheet>')
+    monkeypatch.setattr(schematron_scraper, "_TRANSFORMS",
+                        schematron_scraper.OrderedDict())
+    monkeypatch.setattr(SchematronScraper, "_compile_schematron",
+                        lambda self, schematron_file=None: str(xslt))
+
+    transforms = []
+    for _ in range(2):
+        scraper = SchematronScraper(
+            filename="tests/data/text_xml/valid_1.0_well_formed.xml",
+            mimetype="text/xml",
+            params={"schematron": "local.sch", "cache": cache})
+        scraper.scrape_file()
+        assert scraper.well_formed
+        assert scraper.messages()[0].count("<svrl:fired-rule") == 1
+        transforms.append(scraper._transform(str(xslt)))
+
+    assert (transforms[0] is transforms[1]) == cache
+    assert len(schematron_scraper._TRANSFORMS) == int(cache)
+
+
+def test_compile_cache(tmpdir, monkeypatch):
+    """Test compilation to the cache and eviction from the cache."""
+    # pylint: disable=protected-access
+    compiled = []
+
+    def _compile_phase(self, stylesheet, inputfile, allowed_codes,
+                       outputfile=None, outputfilter=False):
+        """Write a dummy compilation result."""
+        # pylint: disable=unused-argument
+        compiled.append(stylesheet)
+        with open(outputfile, "w") as outfile:
+            outfile.write("x" * 100)
+
+    monkeypatch.setattr(SchematronScraper, "_compile_phase", _compile_phase)
+    monkeypatch.setattr(SchematronScraper, "_cache_bytes", 150)
+    cache_path = str(tmpdir.join("cache"))
+    schematrons = []
+    for name in ["a.sch", "b.sch"]:
+        schematrons.append(str(tmpdir.join(name)))
+        tmpdir.join(name).write(name)
+
+    xslt_a = schematron_scraper.warm_cache(schematrons[:1],
+                                           cache_path=cache_path)[0]
+    assert len(compiled) == 4
+    assert schematron_scraper.warm_cache(
+        schematrons[:1], cache_path=cache_path) == [xslt_a]
+    assert len(compiled) == 4
+    assert sorted(os.listdir(cache_path)) == [
+        ".lock", os.path.basename(xslt_a)]
+
+    xslt_b = schematron_scraper.warm_cache(schematrons[1:],
+                                           cache_path=cache_path)[0]
+    assert len(compiled) == 8
+    assert sorted(os.listdir(cache_path)) == [
+        ".lock", os.path.basename(xslt_b)]
+
+
+@pytest.mark.parametrize("empty_first", [False, True])
+def test_several_schematrons(tmpdir, monkeypatch, empty_first):
+    """
+    Test that the reports of several rule sets are merged.
+
+    :empty_first: True to apply first a rule set giving an empty report
+    """
+    xslt_files = {}
+    for name, content in [
+            ("empty.sch", None),
+            ("a.sch", '<svrl:fired-rule context="a"/>'
+                      '<svrl:fired-rule context="a"/>'),
+            ("b.sch", '<svrl:fired-rule context="a"/>'
+                      '<svrl:failed-assert test="b"/>')]:
+        if content is not None:
+            content = '<svrl:schematron-output>%s' \
+                '</svrl:schematron-output>' % content
+        xslt = tmpdir.join("%s.abc.validator.xsl" % name)
+        xslt.write(
+            '<xsl:stylesheet version="1.0" '
+            'xmlns:xsl="http://www.w3.org/1999/XSL/Transform" '
+            'xmlns:svrl="http://purl.oclc.org/dsdl/svrl">'
+            '<xsl:template match="/">%s</xsl:template></xsl:stylesheet>'
+            % (content or ""))
+        xslt_files[name] = str(xslt)
+    monkeypatch.setattr(
+        SchematronScraper, "_compile_schematron",
+        lambda self, schematron_file=None: xslt_files[schematron_file])
+    schematrons = ["a.sch", "b.sch"]
+    if empty_first:
+        schematrons.insert(0, "empty.sch")
+
+    scraper = SchematronScraper(
+        filename="tests/data/text_xml/valid_1.0_well_formed.xml",
+        mimetype="text/xml", params={"schematron": schematrons})
+    scraper.scrape_file()
+    assert not scraper.well_formed
+    assert len(scraper.messages()) == 1
+    report = scraper.messages()[0]
+    assert report.count("<svrl:schematron-output") == 1
+    assert report.count("<svrl:fired-rule") == 2
+    assert report.index("Rule set: a.sch") < report.index("Rule set: b.sch")
+    assert report.index("Rule set: b.sch") < report.index(
+        "<svrl:failed-assert")
+
+
+@pytest.mark.parametrize("terminate", ["no", "yes"])
+def test_transform_messages(tmpdir, monkeypatch, terminate):
+    """Test that the messages of the transform are added to the errors."""
+    xslt = tmpdir.join("message.sch.abc.validator.xsl")
+    xslt.write(
+        '<xsl:stylesheet version="1.0" '
+        'xmlns:xsl="http://www.w3.org/1999/XSL/Transform" '
+        'xmlns:svrl="http://purl.oclc.org/dsdl/svrl">'
+        '<xsl:template match="/">'
+        '<xsl:message terminate="%s">Rule set message</xsl:message>'
+        '<svrl:schematron-output/></xsl:template></xsl:stylesheet>'
+        % terminate)
+    monkeypatch.setattr(schematron_scraper, "_TRANSFORMS",
+                        schematron_scraper.OrderedDict())
+    monkeypatch.setattr(SchematronScraper, "_compile_schematron",
+                        lambda self, schematron_file=None: str(xslt))
+
+    scraper = SchematronScraper(
+        filename="tests/data/text_xml/valid_1.0_well_formed.xml",
+        mimetype="text/xml", params={"schematron": "message.sch"})
+    scraper.scrape_file()
+    assert not scraper.well_formed
+    assert scraper.errors() == ["Rule set message"]
@@ -11,12 +11,25 @@ This module tests that:
     - Character encoding validation works as designed with all combinations of
       supported encodings.
     - Error message is given with missing character encoding
-    - Limiting the decoding works as designed by reading the first 8 bytes
-      and skipping the remainder
+    - Limiting the decoding works as designed by reading head, tail and
+      evenly spaced windows and skipping the remainder
+    - Windows are aligned to character boundaries, forbidden character in
+      the end of a large file is found, and the whole file is validated in
+      parallel chunks in full mode
+    - The first forbidden character and its byte offset are reported, also
+      when the file is decoded in small chunks with characters split
+      between the chunks, or in a window in the middle of the file.
+    - UTF-8 file given as ISO-8859-15 or UTF-16 file is reported to be
+      most likely UTF-8 file, also when the UTF-8 characters are split
+      between the chunks or windows or appear only after ASCII chunks.
+    - Validation is resumed from a matching checkpoint, and only the
+      appended lines are validated. A sampled file gets no checkpoint, but
+      the appended lines are validated in whole.
 """
 from __future__ import unicode_literals
 
 import pytest
+import six
 
 from file_scraper.textfile.textfile_scraper import (TextfileScraper,
                                                     TextEncodingScraper)
@@ -194,10 +207,261 @@ def test_decoding_limit(monkeypatch):
     Test limiting the decoding.
     """
     monkeypatch.setattr(TextEncodingScraper, "_chunksize", 4)
-    monkeypatch.setattr(TextEncodingScraper, "_limit", 8)
+    monkeypatch.setattr(TextEncodingScraper, "_limit", 10)
+    monkeypatch.setattr(TextEncodingScraper, "_sample_windows", 3)
     scraper = TextEncodingScraper(
         filename="tests/data/text_plain/valid__utf8_bom.txt",
         mimetype="text/plain", params={"charset": "UTF-8"})
     scraper.scrape_file()
+    assert scraper.well_formed
     assert partial_message_included(
-        "First 8 bytes read, we skip the remainder", scraper.messages())
+        "of 15 bytes", scraper.messages())
+    assert partial_message_included(
+        "in head window, 3 evenly spaced windows and tail window, we skip "
+        "the remainder", scraper.messages())
+
+
+@pytest.mark.parametrize(
+    ["content", "charset", "sampling", "well_formed"],
+    [
+        ("\u20ac" * 1000, "UTF-8", "sample", True),
+        ("\u20ac" * 1000, "UTF-8", "full", True),
+        ("\U0001f600" * 1000, "UTF-16", "sample", True),
+        ("\U0001f600" * 1000, "UTF-16", "full", True),
+        ("\xe4" * 1000, "ISO-8859-15", "full", True),
+        ("\u20ac" * 1000 + "\x00", "UTF-8", "sample", False),
+        ("\u20ac" * 1000 + "\x00", "UTF-8", "full", False),
+        ("\u20ac" * 500 + "\x00" + "\u20ac" * 500, "UTF-8", "full", False),
+    ]
+)
+def test_sampling(tmpdir, monkeypatch, content, charset, sampling,
+                  well_formed):
+    """
+    Test validating windows of files larger than the limit.
+
+    The windows split the multibyte characters of the test files, so they
+    must be aligned to the character boundaries. Forbidden character in the
+    end of the file is found from the tail window, and in full mode, the
+    whole file is validated.
+
+    :content: Text content of the test file
+    :charset: Character encoding
+    :sampling: Sampling mode
+    :well_formed: Expected result
+    """
+    monkeypatch.setattr(TextEncodingScraper, "_chunksize", 101)
+    monkeypatch.setattr(TextEncodingScraper, "_limit", 502)
+    monkeypatch.setattr(TextEncodingScraper, "_processes", 2)
+    path = tmpdir.join("text.txt")
+    path.write_binary(content.encode(charset))
+    scraper = TextEncodingScraper(
+        filename=six.text_type(path), mimetype="text/plain",
+        params={"charset": charset, "sampling": sampling})
+    scraper.scrape_file()
+    assert scraper.well_formed == well_formed
+    if well_formed and sampling == "full":
+        assert partial_message_included("parallel chunks",
+                                        scraper.messages())
+    elif well_formed:
+        assert partial_message_included("we skip the remainder",
+                                        scraper.messages())
+    else:
+        assert partial_message_included("Illegal character",
+                                        scraper.errors())
+
+
+@pytest.mark.parametrize(
+    ["content", "charset", "chunksize", "stderr_part"],
+    [
+        ("abc\x1fd\x00e", "UTF-8", 1024,
+         "Illegal character '\x1f' in position 3"),
+        ("\xe4\xe4\xe4\x08", "UTF-8", 3,
+         "Illegal character '\x08' in position 6"),
+        ("\u20ac\u20ac\x7f", "UTF-16", 3,
+         "Illegal character '\x7f' in position 6"),
+        ("\xe4\xe4\xe4", "UTF-8", 3, None),
+    ]
+)
+def test_forbidden_characters(tmpdir, monkeypatch, content, charset,
+                              chunksize, stderr_part):
+    """
+    Test that the first forbidden character is found.
+
+    :content: Text content of the test file
+    :charset: Character encoding
+    :chunksize: Size of the chunk to decode at once
+    :stderr_part: Part of the expected errors, None for valid file
+    """
+    monkeypatch.setattr(TextEncodingScraper, "_chunksize", chunksize)
+    path = tmpdir.join("text.txt")
+    path.write_binary(content.encode(charset))
+    scraper = TextEncodingScraper(
+        filename=six.text_type(path), mimetype="text/plain",
+        params={"charset": charset})
+    scraper.scrape_file()
+    if stderr_part is None:
+        assert scraper.well_formed
+    else:
+        assert partial_message_included(stderr_part, scraper.errors())
+
+
+@pytest.mark.parametrize("sampling", ["sample", "full"])
+def test_forbidden_character_in_window(tmpdir, monkeypatch, sampling):
+    """
+    Test the position of a forbidden character in a middle window.
+
+    The windows start in the middle of the multibyte characters, and the
+    reported position must still be the byte offset of the character in
+    the file.
+
+    :sampling: Sampling mode
+    """
+    monkeypatch.setattr(TextEncodingScraper, "_chunksize", 101)
+    monkeypatch.setattr(TextEncodingScraper, "_limit", 502)
+    monkeypatch.setattr(TextEncodingScraper, "_processes", 2)
+    path = tmpdir.join("text.txt")
+    path.write_binary(
+        ("\u20ac" * 500 + "\x00" + "\u20ac" * 500).encode("UTF-8"))
+    scraper = TextEncodingScraper(
+        filename=six.text_type(path), mimetype="text/plain",
+        params={"charset": "UTF-8", "sampling": sampling})
+    scraper.scrape_file()
+    assert not scraper.well_formed
+    assert partial_message_included(
+        "Illegal character '\x00' in position 1500", scraper.errors())
+
+
+@pytest.mark.parametrize(
+    ["content", "charset", "chunksize", "probably_utf8"],
+    [
+        ("abc\xe4\u20ac", "ISO-8859-15", 4, True),
+        ("abcdefgh\xe4", "ISO-8859-15", 4, True),
+        ("abcdefgh", "ISO-8859-15", 4, False),
+        ("abcd\xe4", "UTF-16", 3, True),
+    ]
+)
+def test_utf8_contradiction(tmpdir, monkeypatch, content, charset, chunksize,
+                            probably_utf8):
+    """
+    Test that UTF-8 file is noticed when validated with other charset.
+
+    The content of the test file is encoded in UTF-8.
+
+    :content: Text content of the test file
+    :charset: Character encoding given to the scraper
+    :chunksize: Size of the chunk to decode at once
+    :probably_utf8: True if the file should be reported as UTF-8 file
+    """
+    monkeypatch.setattr(TextEncodingScraper, "_chunksize", chunksize)
+    path = tmpdir.join("text.txt")
+    path.write_binary(content.encode("UTF-8"))
+    scraper = TextEncodingScraper(
+        filename=six.text_type(path), mimetype="text/plain",
+        params={"charset": charset})
+    scraper.scrape_file()
+    assert partial_message_included(
+        "Most likely the file is UTF-8 file", scraper.errors()) == \
+        probably_utf8
+
+
+@pytest.mark.parametrize("sampling", ["sample", "full"])
+def test_utf8_contradiction_in_windows(tmpdir, monkeypatch, sampling):
+    """
+    Test that UTF-8 file is noticed in windows not starting at characters.
+
+    The windows start in the middle of UTF-8 characters, so the UTF-8
+    candidate must start from its own character boundary.
+
+    :sampling: Sampling mode
+    """
+    monkeypatch.setattr(TextEncodingScraper, "_chunksize", 4096)
+    monkeypatch.setattr(TextEncodingScraper, "_limit", 100000)
+    monkeypatch.setattr(TextEncodingScraper, "_processes", 2)
+    path = tmpdir.join("text.txt")
+    path.write_binary(("\u20ac" * 133333).encode("UTF-8"))
+    scraper = TextEncodingScraper(
+        filename=six.text_type(path), mimetype="text/plain",
+        params={"charset": "ISO-8859-15", "sampling": sampling})
+    scraper.scrape_file()
+    assert not scraper.well_formed
+    assert partial_message_included(
+        "Most likely the file is UTF-8 file", scraper.errors())
+
+
+@pytest.mark.parametrize(
+    ["charset", "appended", "resumed", "well_formed"],
+    [
+        ("UTF-8", "more lines\n", True, True),
+        ("UTF-16", "more lines\n", True, True),
+        ("UTF-8", "more\x1f lines\n", True, False),
+        ("UTF-8", None, False, True),
+    ]
+)
+def test_checkpoint(tmpdir, charset, appended, resumed, well_formed):
+    """
+    Test validation of appended lines from a checkpoint.
+
+    :charset: Character encoding
+    :appended: Text appended after the checkpoint, None to rewrite the file
+    :resumed: True if the validation should be resumed from the checkpoint
+    :well_formed: Expected result
+    """
+    path = tmpdir.join("text.txt")
+    path.write_binary("first lines\n".encode(charset))
+    scraper = TextEncodingScraper(
+        filename=six.text_type(path), mimetype="text/plain",
+        params={"charset": charset})
+    scraper.scrape_file()
+    checkpoint = scraper.checkpoint
+    assert checkpoint["offset"] == path.size()
+
+    if appended is None:
+        path.write_binary("other lines\n".encode(charset))
+    else:
+        with path.open("ab") as outfile:
+            outfile.write(appended.encode(charset)[
+                2 if charset == "UTF-16" else 0:])
+    scraper = TextEncodingScraper(
+        filename=six.text_type(path), mimetype="text/plain",
+        params={"charset": charset, "checkpoint": checkpoint})
+    scraper.scrape_file()
+
+    assert scraper.well_formed == well_formed
+    assert partial_message_included("resumed from the checkpoint",
+                                    scraper.messages()) == resumed
+    if well_formed:
+        assert scraper.checkpoint["offset"] == path.size()
+    else:
+        assert scraper.checkpoint is None
+
+
+def test_checkpoint_sampling(tmpdir, monkeypatch):
+    """
+    Test that a checkpoint is given only if the whole file was validated.
+    """
+    monkeypatch.setattr(TextEncodingScraper, "_limit", 1000)
+    path = tmpdir.join("text.txt")
+    path.write_binary(b"abcdefghi\n" * 400)
+    checkpoints = []
+    for sampling in ["sample", "full"]:
+        scraper = TextEncodingScraper(
+            filename=six.text_type(path), mimetype="text/plain",
+            params={"charset": "UTF-8", "sampling": sampling})
+        scraper.scrape_file()
+        assert scraper.well_formed
+        checkpoints.append(scraper.checkpoint)
+    assert checkpoints[0] is None
+    assert checkpoints[1]["offset"] == 4000
+
+    with path.open("ab") as outfile:
+        outfile.write(b"abcdefghi\n" * 400)
+    scraper = TextEncodingScraper(
+        filename=six.text_type(path), mimetype="text/plain",
+        params={"charset": "UTF-8", "checkpoint": checkpoints[1]})
+    scraper.scrape_file()
+    assert scraper.well_formed
+    assert partial_message_included("resumed from the checkpoint",
+                                    scraper.messages())
+    assert not partial_message_included("we skip the remainder",
+                                        scraper.messages())
+    assert scraper.checkpoint["offset"] == 8000
@@ -58,6 +58,11 @@ This module tests that:
     - All these MIME types are also supported when None or a made up version
       is given as the version.
     - A made up MIME type is not supported.
+    - Metadata scraped from image headers without decoding the pixel data is
+      the same as the metadata scraped from fully decoded images.
+    - Large JPEG and JPEG 2000 images are decoded in reduced resolution
+      unless full decoding is requested, and the number of JPEG 2000
+      decomposition levels is read from the codestream.
 """
 from __future__ import unicode_literals
 
@@ -66,7 +71,8 @@ import pytest
 
 from file_scraper.wand.wand_model import (WandImageMeta, WandTiffMeta,
                                           WandExifMeta)
-from file_scraper.wand.wand_scraper import WandScraper
+from file_scraper.wand.wand_scraper import (WandScraper,
+                                            _jp2_decomposition_levels)
 from tests.common import (parse_results, partial_message_included)
 
 STREAM_VALID = {
@@ -339,6 +345,90 @@ def test_scraper_invalid(filename, mimetype, stderr_part):
     assert not scraper.well_formed
 
 
+@pytest.mark.parametrize(
+    ["filename", "mimetype"],
+    [
+        ("valid_6.0_multiple_tiffs.tif", "image/tiff"),
+        ("valid_2.2.1_exif_metadata.jpg", "image/jpeg"),
+        ("valid__srgb.jp2", "image/jp2"),
+        ("valid_1.2.png", "image/png"),
+        ("valid_1989a.gif", "image/gif"),
+    ]
+)
+def test_scraper_ping(filename, mimetype):
+    """
+    Test that metadata is scraped without decoding the image.
+
+    :filename: Test file name
+    :mimetype: File MIME type
+    """
+    path = os.path.join("tests/data", mimetype.replace("/", "_"), filename)
+    decoded = WandScraper(filename=path, mimetype=mimetype)
+    decoded.scrape_file()
+    pinged = WandScraper(filename=path, mimetype=mimetype,
+                         params={"check_wellformed": False})
+    pinged.scrape_file()
+
+    assert pinged.well_formed
+    assert len(pinged.streams) == len(decoded.streams)
+    for pinged_stream, decoded_stream in zip(pinged.streams,
+                                             decoded.streams):
+        for method in decoded_stream.iterate_metadata_methods():
+            assert getattr(pinged_stream, method.__name__)() == method()
+
+
+@pytest.mark.parametrize(
+    ["filename", "mimetype", "full_decode", "options"],
+    [
+        ("valid_2.2.1_exif_metadata.jpg", "image/jpeg", False,
+         ["jpeg:size"]),
+        ("valid_2.2.1_exif_metadata.jpg", "image/jpeg", True, []),
+        ("valid__srgb.jp2", "image/jp2", False, ["jp2:reduce-factor"]),
+        ("valid__srgb.jp2", "image/jp2", True, []),
+        ("valid_1.2.png", "image/png", False, []),
+    ]
+)
+def test_scraper_reduced_decode(filename, mimetype, full_decode, options):
+    """
+    Test that large images are decoded in reduced resolution.
+
+    The size limit is lowered so that the test images are considered large.
+
+    :filename: Test file name
+    :mimetype: File MIME type
+    :full_decode: Whether full decoding is requested
+    :options: Expected ImageMagick options
+    """
+    path = os.path.join("tests/data", mimetype.replace("/", "_"), filename)
+    scraper = WandScraper(filename=path, mimetype=mimetype,
+                          params={"full_decode": full_decode})
+    scraper._reduce_pixels = 0
+    scraper.scrape_file()
+
+    assert scraper.well_formed
+    # pylint: disable=protected-access
+    assert sorted(scraper._reduce_options()) == options
+
+
+@pytest.mark.parametrize(
+    ["filename", "levels"],
+    [
+        ("valid__srgb.jp2", 5),
+        ("invalid__data_missing.jp2", 5),
+        ("invalid__empty.jp2", 0),
+    ]
+)
+def test_jp2_decomposition_levels(filename, levels):
+    """
+    Test reading the number of decomposition levels from JPEG 2000 file.
+
+    :filename: Test file name
+    :levels: Expected number of decomposition levels
+    """
+    path = os.path.join("tests/data/image_jp2", filename)
+    assert _jp2_decomposition_levels(path) == levels
+
+
 @pytest.mark.parametrize(
     ["mime", "ver", "class_"],
     [
@@ -7,16 +7,29 @@ This module tests that:
         - For all well-formed files, scraper messages contain "successfully".
     - When using GzipWarctoolsScraper:
         - For empty files, scraper errors contains "Empty file."
-        - For files with missing data, scraper errors contains "unpack
-          requires a string argument of length 4".
+        - Only the WARC or ARC scraper matching the first record is used, and
+          other compressed files are not well-formed.
+        - For files with missing data, scraper errors contains "Compressed
+          file ended".
     - When using WarcWarctoolsFullScraper:
         - For whiles where the reported content length is shorter than the
-          actual content, scraper errors contains "warc errors at".
+          actual content, scraper errors contains "Content-Length may be
+          wrong".
+        - Records in plain and gzip compressed files are validated, and the
+          errors tell the offset of the invalid record or gzip member.
+        - Block digests are checked.
+        - Large gzip compressed files are validated in parallel ranges,
+          with the same results as in serial validation, and an index of
+          the records can be written.
+        - Validation is resumed from a matching checkpoint, and only the
+          appended records are validated.
     - When using ArcWarctoolsScraper:
         - For files where a header field is missing, scraper errors contains
-          "Exception: missing headers".
-        - For files with missing data, scraper errors contains "unpack
-          requires a string argument of length 4".
+          "Wrong number of header fields".
+        - For files with missing data, scraper errors contains "Compressed
+          file ended".
+        - Records of ARC versions 1 and 2 are validated, and the number of
+          header fields must match the version.
 
     - With well-formedness check, the following MIME types and versions are
       supported:
@@ -32,7 +45,12 @@ This module tests that:
 """
 from __future__ import unicode_literals
 
+import gzip
+import hashlib
+import io
+
 import pytest
+import six
 
 from file_scraper.warctools.warctools_scraper import (
     ArcWarctoolsScraper, GzipWarctoolsScraper, WarcWarctoolsFullScraper,
@@ -58,11 +76,11 @@ from tests.common import (parse_results, partial_message_included)
         ("invalid__missing_data.warc.gz", {
             "purpose": "Test invalid warc gzip.",
             "stdout_part": "",
-            "stderr_part": "unpack requires a string argument of length 4"}),
+            "stderr_part": "Compressed file ended"}),
         ("invalid__missing_data.arc.gz", {
             "purpose": "Test invalid arc gzip.",
             "stdout_part": "",
-            "stderr_part": "unpack requires a string argument of length 4"}),
+            "stderr_part": "Compressed file ended"}),
         ("invalid__empty.arc.gz", {
             "purpose": "Test empty arc file.",
             "stdout_part": "",
@@ -123,11 +141,11 @@ def test_gzip_scraper(filename, result_dict, evaluate_scraper):
         ("invalid_0.17_too_short_content_length.warc", {
             "purpose": "Test short content length.",
             "stdout_part": "",
-            "stderr_part": "warc errors at"}),
+            "stderr_part": "Content-Length may be wrong"}),
         ("invalid_0.18_too_short_content_length.warc", {
             "purpose": "Test short content length.",
             "stdout_part": "",
-            "stderr_part": "warc errors at"}),
+            "stderr_part": "Content-Length may be wrong"}),
         ("invalid__empty.warc", {
             "purpose": "Test empty warc file.",
             "stdout_part": "",
@@ -162,6 +180,79 @@ def test_warc_scraper(filename, result_dict, evaluate_scraper):
         evaluate_scraper(scraper, correct)
 
 
+def _gzip_member(data):
+    """Return the data compressed as a gzip member."""
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode="wb", mtime=0) as gzip_file:
+        gzip_file.write(data)
+    return output.getvalue()
+
+
+def _warc_record(block, block_digest=None):
+    """Return a WARC record with the given block."""
+    headers = [b"WARC/1.0",
+               b"WARC-Type: resource",
+               b"WARC-Record-ID: <urn:uuid:152a2684-4068-11e9-8166-"
+               b"52540075dc3d>",
+               b"WARC-Date: 2019-03-06T23:32:18Z",
+               b"Content-Type: text/plain",
+               b"Content-Length: %d" % len(block)]
+    if block_digest is not None:
+        headers.append(b"WARC-Block-Digest: " + block_digest)
+    return b"\r\n".join(headers) + b"\r\n\r\n" + block + b"\r\n\r\n"
+
+
+@pytest.mark.parametrize(
+    ["compressed", "records", "errors"],
+    [
+        (False, [_warc_record(b"hello world")] * 3, []),
+        (True, [_warc_record(b"hello world")] * 3, []),
+        (False, [_warc_record(b"x" * 100000)], []),
+        (False, [_warc_record(b"hello world"), b"WARC/1.0\r\n\r\n"],
+         ["Record at offset 192: Missing header field warc-type."]),
+        (True, [_warc_record(b"hello world"), b"WARC/1.0\r\n\r\n"],
+         ["Record at offset 175: Missing header field warc-type."]),
+        (False, [_warc_record(b"hello world")[:-10]],
+         ["Record at offset 0: Record block is truncated, expected 11 "
+          "bytes."]),
+        (False, [_warc_record(
+            b"hello world",
+            b"sha1:" + hashlib.sha1(b"hello world").hexdigest().encode())],
+         []),
+        (False, [_warc_record(
+            b"hello world", b"sha1:FKXGYNOJJ7H3IFO35FPUBC445EPOQRXN")], []),
+        (False, [_warc_record(
+            b"hello world", b"sha1:FKXGYNOJJ7H3IFO35FPUBC445EPOQRXM")],
+         ["Record at offset 0: WARC-Block-Digest does not match the "
+          "block."]),
+        (False, [_warc_record(b"hello world", b"unknown:1234")], [])
+    ]
+)
+def test_warc_records(tmpdir, compressed, records, errors):
+    """
+    Test validation of WARC records.
+
+    Compressed records are written as separate gzip members, so that the
+    offsets in the errors refer to the members.
+    """
+    warc_path = tmpdir.join("test.warc")
+    if compressed:
+        warc_path.write_binary(b"".join(
+            _gzip_member(record) for record in records))
+    else:
+        warc_path.write_binary(b"".join(records))
+
+    scraper = WarcWarctoolsFullScraper(filename=six.text_type(warc_path),
+                                       mimetype="application/warc")
+    scraper._chunksize = 64  # pylint: disable=protected-access
+    scraper.scrape_file()
+
+    assert scraper.errors()[1:] == errors
+    assert scraper.well_formed == (not errors)
+    if not errors:
+        assert scraper.streams[0].version() == "1.0"
+
+
 @pytest.mark.parametrize(
     ["filename", "result_dict"],
     [
@@ -184,11 +275,11 @@ def test_warc_scraper(filename, result_dict, evaluate_scraper):
         ("invalid_1.0_missing_field.arc", {
             "purpose": "Test missing header",
             "stdout_part": "",
-            "stderr_part": "Exception: missing headers"}),
+            "stderr_part": "Wrong number of header fields"}),
         ("invalid__missing_data.arc.gz", {
             "purpose": "Test missing data.",
             "stdout_part": "",
-            "stderr_part": "unpack requires a string argument of length 4"})
+            "stderr_part": "Compressed file ended"})
     ]
 )
 def test_arc_scraper(filename, result_dict, evaluate_scraper):
@@ -233,3 +324,202 @@ def test_is_supported(scraper_class, mimetype, version, only_wellformed):
                                           not only_wellformed)
     assert scraper_class.is_supported(mimetype, "foo", only_wellformed)
     assert not scraper_class.is_supported("foo", version, only_wellformed)
+
+
+@pytest.mark.parametrize(
+    ["content", "scraper_class"],
+    [
+        (_warc_record(b"hello world"), "WarcWarctoolsFullScraper"),
+        (b"filedesc://test.arc 0 19960923142103 text/plain 0\n",
+         "ArcWarctoolsScraper"),
+        (b"\r\n" + _warc_record(b"hello world"), "WarcWarctoolsFullScraper"),
+        (b"hello world\n", None)
+    ]
+)
+def test_gzip_sniffing(tmpdir, monkeypatch, content, scraper_class):
+    """Test that only the scraper matching the first record is used."""
+    used = []
+
+    def _scrape_file(self):
+        """Record the scraper used."""
+        used.append(self.__class__.__name__)
+
+    monkeypatch.setattr(WarcWarctoolsFullScraper, "scrape_file", _scrape_file)
+    monkeypatch.setattr(ArcWarctoolsScraper, "scrape_file", _scrape_file)
+    gzip_path = tmpdir.join("test.gz")
+    gzip_path.write_binary(_gzip_member(content))
+
+    scraper = GzipWarctoolsScraper(filename=six.text_type(gzip_path),
+                                   mimetype="application/gzip")
+    scraper.scrape_file()
+
+    if scraper_class is None:
+        assert not used
+        assert not scraper.well_formed
+        assert partial_message_included("neither a WARC nor an ARC",
+                                        scraper.errors())
+    else:
+        assert used == [scraper_class]
+
+
+@pytest.mark.parametrize(
+    ["member_per_record", "broken_record", "parallel"],
+    [
+        (True, None, True),
+        (False, None, True),
+        (True, 13, False),
+    ]
+)
+def test_parallel(tmpdir, monkeypatch, member_per_record, broken_record,
+                  parallel):
+    """
+    Test parallel validation of gzip compressed WARC files.
+
+    Each record is a separate gzip member, or the whole file is a single
+    member. Errors are reported with the offset of the member, as found in
+    serial validation.
+    """
+    monkeypatch.setattr(WarcWarctoolsFullScraper, "_parallel_size", 0)
+    monkeypatch.setattr(WarcWarctoolsFullScraper, "_rangesize", 500)
+    monkeypatch.setattr(WarcWarctoolsFullScraper, "_processes", 2)
+    records = [_warc_record(b"record %d" % number) for number in range(20)]
+    if broken_record is not None:
+        records[broken_record] = records[broken_record][:-1] + b"x"
+    if member_per_record:
+        members = [_gzip_member(record) for record in records]
+    else:
+        members = [_gzip_member(b"".join(records))]
+    warc_path = tmpdir.join("test.warc.gz")
+    warc_path.write_binary(b"".join(members))
+    index_path = tmpdir.join("test.idx")
+
+    scraper = WarcWarctoolsFullScraper(
+        filename=six.text_type(warc_path), mimetype="application/warc",
+        params={"warc_index": six.text_type(index_path)})
+    scraper.scrape_file()
+
+    assert partial_message_included("parallel ranges",
+                                    scraper.messages()) == parallel
+    if broken_record is not None:
+        offset = sum(len(member) for member in members[:broken_record])
+        assert not scraper.well_formed
+        assert partial_message_included("Record at offset %s:" % offset,
+                                        scraper.errors())
+        assert not index_path.check()
+        return
+
+    assert scraper.well_formed
+    lines = index_path.read_binary().splitlines()
+    assert len(lines) == 20
+    offset = 0
+    for line, member in zip(lines, members * 20):
+        fields = line.split(b" ")
+        assert fields[2:] == [b"resource", b"<urn:uuid:152a2684-4068-11e9-"
+                              b"8166-52540075dc3d>", b"-",
+                              b"2019-03-06T23:32:18Z"]
+        if member_per_record:
+            assert fields[:2] == [b"%d" % offset, b"%d" % len(member)]
+            offset += len(member)
+        else:
+            assert fields[:2] == [b"0", b"%d" % len(member)]
+
+
+@pytest.mark.parametrize(
+    ["compressed", "appended", "resumed", "errors"],
+    [
+        (False, [_warc_record(b"appended")], True, []),
+        (True, [_warc_record(b"appended")], True, []),
+        (False, [_warc_record(b"appended")[:-2]], True,
+         ["Record at offset 371: Record block does not end with two "
+          "newlines, Content-Length may be wrong."]),
+        (False, None, False, []),
+    ]
+)
+def test_warc_checkpoint(tmpdir, compressed, appended, resumed, errors):
+    """
+    Test validation of appended WARC records from a checkpoint.
+
+    :compressed: True for gzip members, False for plain records
+    :appended: Records appended after the checkpoint, None to rewrite the
+               file
+    :resumed: True if the validation should be resumed from the checkpoint
+    :errors: Expected errors after the first one
+    """
+    def _write(records, mode="wb"):
+        """Write the records to the file."""
+        with warc_path.open(mode) as outfile:
+            for record in records:
+                outfile.write(_gzip_member(record) if compressed
+                              else record)
+
+    warc_path = tmpdir.join("test.warc")
+    _write([_warc_record(b"first"), _warc_record(b"second")])
+    scraper = WarcWarctoolsFullScraper(filename=six.text_type(warc_path),
+                                       mimetype="application/warc")
+    scraper.scrape_file()
+    checkpoint = scraper.checkpoint
+    assert checkpoint["offset"] == warc_path.size()
+
+    if appended is None:
+        _write([_warc_record(b"other"), _warc_record(b"second")])
+    else:
+        _write(appended, "ab")
+    scraper = WarcWarctoolsFullScraper(filename=six.text_type(warc_path),
+                                       mimetype="application/warc",
+                                       params={"checkpoint": checkpoint})
+    scraper.scrape_file()
+
+    assert scraper.errors()[1:] == errors
+    assert partial_message_included("resumed from the checkpoint",
+                                    scraper.messages()) == resumed
+    if not errors:
+        assert scraper.checkpoint["offset"] == warc_path.size()
+        assert scraper.streams[0].version() == "1.0"
+
+
+ARC_V1_HEADER = (b"filedesc://test.arc 0 19960923142103 text/plain 68\n"
+                 b"1 0 Unknown\n"
+                 b"URL IP-address Archive-date Content-type "
+                 b"Archive-length\n")
+ARC_V2_HEADER = (b"filedesc://test.arc 0.0.0.0 20050614070159 text/plain "
+                 b"200 - - 0 test.arc 114\n"
+                 b"2 0 Unknown\n"
+                 b"URL IP-address Archive-date Content-type Result-code "
+                 b"Checksum Location Offset Filename Archive-length\n")
+
+
+@pytest.mark.parametrize(
+    ["content", "errors"],
+    [
+        (ARC_V1_HEADER + b"\nhttp://localhost/ 127.0.0.1 19961104142103 "
+         b"text/plain 11\nhello world\n", []),
+        (ARC_V2_HEADER + b"\nhttp://localhost/ 127.0.0.1 19961104142103 "
+         b"text/plain 200 - - 0 test.arc 11\nhello world\n", []),
+        (ARC_V2_HEADER + b"\nhttp://localhost/ 127.0.0.1 19961104142103 "
+         b"text/plain 11\nhello world\n",
+         ["Record at offset 192: Expected 10 header fields, found 5."]),
+        (ARC_V1_HEADER.replace(b"1 0", b"2 0"),
+         ["Record at offset 0: Invalid version block."]),
+        (ARC_V1_HEADER + b"\nhttp://localhost/ 127.0.0.1 19961104142103 "
+         b"text/plain 11\nhello\n",
+         ["Record at offset 120: Record block is truncated, expected 11 "
+          "bytes."]),
+        (ARC_V1_HEADER + b"\nhttp://localhost/ 127.0.0.1 19961104142103 "
+         b"text/plain 12\nhello world\n", []),
+        (b"http://localhost/ 127.0.0.1 19961104142103 text/plain 11\n"
+         b"hello world\n",
+         ["Record at offset 0: Version block not found."])
+    ]
+)
+def test_arc_records(tmpdir, content, errors):
+    """Test validation of ARC records."""
+    arc_path = tmpdir.join("test.arc")
+    arc_path.write_binary(content)
+
+    scraper = ArcWarctoolsScraper(filename=six.text_type(arc_path),
+                                  mimetype="application/x-internet-archive")
+    scraper._chunksize = 64  # pylint: disable=protected-access
+    scraper.scrape_file()
+
+    assert scraper.errors()[1:] == errors
+    assert scraper.well_formed == (not errors)
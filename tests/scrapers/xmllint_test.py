@@ -19,6 +19,19 @@ This module tests that:
       DTD".
     - For empty file, scraper errors contains "Document is empty".
     - XML files without the header can be reported as well-formed.
+    - A compiled schema is cached and reused for the following files with
+      the same schema. The warnings from compiling the schema are reported
+      also when the cached schema is used, and an edited local schema is
+      compiled again.
+    - Large files are validated while streaming them, and the errors are
+      reported as for the smaller files. Large files with a DTD are
+      validated with xmllint.
+    - IDREF attributes are checked against all the IDs of the document,
+      also in large files.
+    - XML catalog is read once per process, and the locations are resolved
+      with the longest matching rewrite prefix.
+    - A constructed schema is reused for documents with the same schema
+      locations, and the least recently used ones are removed from the cache.
 
     - MIME type text/xml with version 1.0 or None is supported when well-
       formedness is checked.
@@ -31,8 +44,12 @@ from __future__ import unicode_literals
 
 import os
 import pytest
+from lxml import etree
 
-from file_scraper.xmllint.xmllint_scraper import XmllintScraper
+from file_scraper.xmllint import xmllint_scraper
+from file_scraper.utils import scan_xml
+from file_scraper.xmllint.xmllint_scraper import (XmllintScraper,
+                                                  catalog_resolver)
 from tests.common import (parse_results, partial_message_included)
 
 ROOTPATH = os.path.abspath(os.path.join(
@@ -167,6 +184,197 @@ def test_scraper_invalid(filename, result_dict, params, evaluate_scraper):
     assert not partial_message_included("<note>", scraper.messages())
 
 
+def test_validator_cache(monkeypatch):
+    """Test that the compiled schema is reused for the following files."""
+    monkeypatch.setattr(xmllint_scraper, "_VALIDATORS",
+                        xmllint_scraper.OrderedDict())
+    params = {"catalogs": False,
+              "schema": os.path.join(ROOTPATH,
+                                     "tests/data/text_xml/local.xsd")}
+    for _ in range(2):
+        scraper = XmllintScraper(
+            filename="tests/data/text_xml/valid_1.0_local_xsd.xml",
+            mimetype="text/xml", params=params)
+        scraper.scrape_file()
+        assert scraper.well_formed
+        assert len(xmllint_scraper._VALIDATORS) == 1
+
+    monkeypatch.setattr(xmllint_scraper, "VALIDATOR_CACHE_SIZE", 1)
+    scraper = XmllintScraper(
+        filename="tests/data/text_xml/valid_1.0_dtd.xml",
+        mimetype="text/xml", params={"catalogs": False})
+    scraper.scrape_file()
+    assert scraper.well_formed
+    assert len(xmllint_scraper._VALIDATORS) == 1
+
+
+def test_validator_cache_compile_log(tmpdir, monkeypatch):
+    """Test that the schema compile warnings are reported on cache hits."""
+    monkeypatch.setattr(xmllint_scraper, "_VALIDATORS",
+                        xmllint_scraper.OrderedDict())
+    document = tmpdir.join("network.xml")
+    document.write(
+        '<a xmlns="http://example.com/foo" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://example.com/foo '
+        'http://example.com/foo.xsd"/>')
+    for _ in range(2):
+        scraper = XmllintScraper(filename=str(document), mimetype="text/xml",
+                                 params={"catalogs": False})
+        scraper._cachepath = str(tmpdir.join("xsd-cache"))
+        scraper.scrape_file()
+        assert not scraper.well_formed
+        assert partial_message_included(
+            "Failed to locate a schema at location", scraper.errors())
+        assert partial_message_included(
+            "Schema definition probably missing from XML catalog",
+            scraper.errors())
+        assert len(xmllint_scraper._VALIDATORS) == 1
+
+
+def test_validator_cache_schema_mtime(tmpdir, monkeypatch):
+    """Test that an edited local schema is compiled again."""
+    monkeypatch.setattr(xmllint_scraper, "_VALIDATORS",
+                        xmllint_scraper.OrderedDict())
+    schema = tmpdir.join("local.xsd")
+    document = tmpdir.join("local.xml")
+    document.write(
+        '<a xmlns="http://a" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://a %s"/>' % str(schema))
+    results = []
+    for element in ["a", "b"]:
+        schema.write(
+            '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" '
+            'targetNamespace="http://a">'
+            '<xs:element name="%s"/></xs:schema>' % element)
+        os.utime(str(schema), (0, 0 if element == "a" else 1))
+        scraper = XmllintScraper(filename=str(document), mimetype="text/xml",
+                                 params={"catalogs": False})
+        scraper._cachepath = str(tmpdir.join("xsd-cache"))
+        scraper.scrape_file()
+        results.append(scraper.well_formed)
+    assert results == [True, False]
+    assert len(xmllint_scraper._VALIDATORS) == 2
+
+
+@pytest.mark.parametrize(
+    ["filename", "params", "error"],
+    [
+        ("valid_1.0_local_xsd.xml",
+         {"catalogs": False,
+          "schema": os.path.join(ROOTPATH, "tests/data/text_xml/local.xsd")},
+         None),
+        ("invalid_1.0_local_xsd.xml",
+         {"catalogs": False,
+          "schema": os.path.join(ROOTPATH, "tests/data/text_xml/local.xsd")},
+         "Schemas validity error : Element '{http://localhost/}note': "
+         "Missing child element(s)."),
+        ("valid_1.0_dtd.xml", {"catalogs": False}, None),
+        ("invalid_1.0_dtd.xml", {"catalogs": False},
+         "validity error : Element note content does not follow the DTD"),
+        ("invalid_1.0_catalog.xml",
+         {"catalog_path": "tests/data/text_xml/test-catalog.xml"},
+         "Missing child element(s)."),
+    ]
+)
+def test_stream_validation(filename, params, error):
+    """Test validation of files larger than the streaming limit."""
+    # pylint: disable=protected-access
+    scraper = XmllintScraper(
+        filename=os.path.join("tests/data/text_xml", filename),
+        mimetype="text/xml", params=params)
+    scraper._stream_size = 0
+    scraper.scrape_file()
+    if error is None:
+        assert scraper.well_formed
+        assert partial_message_included("Success", scraper.messages())
+    else:
+        assert not scraper.well_formed
+        assert partial_message_included(error, scraper.errors())
+        assert partial_message_included(filename, scraper.errors())
+
+
+@pytest.mark.parametrize("stream_size", [64 * 1024**2, 0])
+@pytest.mark.parametrize(
+    ["ref", "error"],
+    [("x1", None),
+     ("x2", 'IDREF attribute ref references an unknown ID "x2"')]
+)
+def test_dtd_idref(tmpdir, stream_size, ref, error):
+    """Test that IDREF attributes are checked against all the IDs."""
+    # pylint: disable=protected-access
+    document = tmpdir.join("idref.xml")
+    document.write(
+        '<?xml version="1.0"?>\n'
+        '<!DOCTYPE a [\n'
+        '<!ELEMENT a (b*)>\n'
+        '<!ELEMENT b EMPTY>\n'
+        '<!ATTLIST b id ID #IMPLIED ref IDREF #IMPLIED>\n'
+        ']>\n'
+        '<a><b id="x1"/><b/><b ref="%s"/></a>\n' % ref)
+    scraper = XmllintScraper(filename=str(document), mimetype="text/xml",
+                             params={"catalogs": False})
+    scraper._stream_size = stream_size
+    scraper.scrape_file()
+    if error is None:
+        assert scraper.well_formed
+        assert partial_message_included("Success", scraper.messages())
+    else:
+        assert not scraper.well_formed
+        assert partial_message_included(error, scraper.errors())
+        assert partial_message_included("idref.xml:7", scraper.errors())
+
+
+def test_catalog_resolver(tmpdir):
+    """Test that the catalog is read once and resolves the locations."""
+    catalog = tmpdir.join("catalog.xml")
+    next_catalog = tmpdir.join("next.xml")
+    catalog.write(
+        '<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">'
+        '<rewriteURI uriStartString="http://a/" rewritePrefix="a/"/>'
+        '<rewriteURI uriStartString="http://a/b/" rewritePrefix="b/"/>'
+        '<nextCatalog catalog="next.xml"/>'
+        '</catalog>')
+    next_catalog.write(
+        '<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">'
+        '<system systemId="http://c/c.dtd" uri="c.dtd"/>'
+        '</catalog>')
+    resolver = catalog_resolver(str(catalog))
+    assert catalog_resolver(str(catalog)) is resolver
+
+    base = "file://%s/" % str(tmpdir)
+    assert resolver.resolve_url("http://a/x.xsd") == base + "a/x.xsd"
+    assert resolver.resolve_url("http://a/b/x.xsd") == base + "b/x.xsd"
+    assert resolver.resolve_url("http://c/c.dtd") == base + "c.dtd"
+    assert resolver.resolve_url("http://d/d.xsd") is None
+
+
+def test_schema_cache(tmpdir):
+    """Test that constructed schemas are reused and evicted from cache."""
+    # pylint: disable=protected-access
+    scans = []
+    for name in ["a", "b"]:
+        document = tmpdir.join("%s.xml" % name)
+        document.write(
+            '<a xmlns="http://a" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            'xsi:schemaLocation="http://a %s.xsd"/>' % name)
+        scans.append(scan_xml(str(document)))
+    scraper = XmllintScraper("testsfile", "text/xml")
+    scraper._cachepath = os.path.join(str(tmpdir), "xsd-cache")
+    scraper._cache_size = 1
+
+    schema = scraper.construct_xsd(scans[0])
+    assert scraper.construct_xsd(scans[0]) == schema
+    assert b"a.xsd" in etree.tostring(etree.parse(schema))
+    assert os.listdir(scraper._cachepath) == [os.path.basename(schema)]
+
+    other = scraper.construct_xsd(scans[1])
+    assert other != schema
+    assert os.listdir(scraper._cachepath) == [os.path.basename(other)]
+
+
 def test_is_supported():
     """Test is_supported method."""
     mime = "text/xml"
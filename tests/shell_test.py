@@ -10,6 +10,8 @@ The module tests that:
       in that file.
     - If custom environment variables are supplied, they are used when running
       the command.
+    - A preloaded result is used once instead of running the command, and
+      only when the output is piped.
 """
 
 import os
@@ -19,7 +21,7 @@ import six
 
 import pytest
 
-from file_scraper.shell import Shell
+from file_scraper.shell import Shell, clear_preloaded, preload
 
 
 @pytest.mark.parametrize(
@@ -81,3 +83,23 @@ def test_shell_with_env():
     assert shell.returncode == 0
     assert shell.stdout == "testing\n"
     assert not shell.stderr
+
+
+def test_preloaded_result():
+    """Test that a preloaded result is used once instead of the command."""
+    preload(["echo", "testing"], 3, b"preloaded\n", b"error\n")
+    try:
+        with TemporaryFile("w+") as outfile:
+            shell = Shell(["echo", "testing"], stdout=outfile)
+            assert shell.returncode == 0
+
+        shell = Shell(["echo", "testing"])
+        assert shell.returncode == 3
+        assert shell.stdout == "preloaded\n"
+        assert shell.stderr == "error\n"
+
+        shell = Shell(["echo", "testing"])
+        assert shell.returncode == 0
+        assert shell.stdout == "testing\n"
+    finally:
+        clear_preloaded()
@@ -84,6 +84,9 @@ requirements:
           in the outer dict.
         - If the lose list contains a value some method marks as important, an
           OverlappingLoseAndImportantException is raised.
+    - generate_metadata_dict_frames
+        - Runs of identical frames from different scrapers are merged in
+          segments and expanded to one stream for each frame.
     - concat
         - Concatenation of empty list with or without a prefix produces an
           empty string.
@@ -100,20 +103,28 @@ requirements:
     - iter_utf_bytes_trivial
         - UTF iterator works as designed if there is only UTF control
           character (c3) in a file
+    - iter_chunk_views
+        - The file is iterated in chunks of at most the given size, which
+          together contain the whole file.
+    - map_in_processes
+        - The function is called with each argument tuple in worker
+          processes and the results are returned in the order of the
+          arguments.
 """
 from __future__ import unicode_literals
 
 import six
 import pytest
 
-from file_scraper.base import BaseMeta
+from file_scraper.base import BaseMeta, FrameStreams
 from file_scraper.scraper import LOSE
 from file_scraper.utils import (_fill_importants,
                                 _merge_to_stream, concat,
                                 generate_metadata_dict, hexdigest,
                                 iso8601_duration, metadata,
                                 sanitize_string, strip_zeros,
-                                iter_utf_bytes)
+                                iter_utf_bytes, iter_chunk_views,
+                                map_in_processes)
 
 
 @pytest.mark.parametrize(
@@ -569,6 +580,59 @@ def test_generate_metadata_dict():
                                  "version": 2, "stream_type": "audio"}}
 
 
+class FrameMetaTest(BaseMeta):
+    """Metadata class for testing generate_metadata_dict() with frames."""
+
+    def __init__(self, index, key, value):
+        """
+        Initialize the metadata class.
+
+        :index: Frame index
+        :key: Name of the metadata method returning the value
+        :value: Metadata value
+        """
+        self._index = index
+        self._key = key
+        self._value = value
+
+    @metadata()
+    def index(self):
+        """Return frame index."""
+        return self._index
+
+    @metadata()
+    def width(self):
+        """Return width, if given."""
+        return self._value if self._key == "width" else "(:unav)"
+
+    @metadata()
+    def colorspace(self):
+        """Return colorspace, if given."""
+        return self._value if self._key == "colorspace" else "(:unav)"
+
+
+def test_generate_metadata_dict_frames():
+    """Test generating metadata dict from runs of identical frames."""
+    widths = FrameStreams()
+    for index, width in enumerate(["1", "1", "2", "2", "2"]):
+        widths.append(FrameMetaTest(index, "width", width))
+    colorspaces = FrameStreams()
+    colorspaces.append(FrameMetaTest(0, "colorspace", "srgb"), 3)
+    colorspaces.append(FrameMetaTest(3, "colorspace", "gray"), 2)
+
+    metadata_dict = generate_metadata_dict(
+        [widths, colorspaces, [Meta3()]], LOSE)
+    assert sorted(metadata_dict) == [0, 1, 2, 3, 4]
+    assert [metadata_dict[index]["index"] for index in range(5)] == \
+        [0, 1, 2, 3, 4]
+    assert [metadata_dict[index]["width"] for index in range(5)] == \
+        ["1", "1", "2", "2", "2"]
+    assert [metadata_dict[index]["colorspace"] for index in range(5)] == \
+        ["srgb", "srgb", "srgb", "gray", "gray"]
+    assert metadata_dict[1]["mimetype"] == "anothermime"
+    assert metadata_dict[2]["mimetype"] == "(:unav)"
+
+
 def test_concat():
     """Test concat function."""
     assert concat([]) == ""
@@ -626,3 +690,27 @@ def test_iter_utf_bytes_trivial():
     for chunk in iter_utf_bytes(infile, 4, "UTF-8"):
         chunks += chunk
     assert original_bytes == chunks
+
+
+def test_iter_chunk_views():
+    """
+    Test that the file is iterated in chunks read into a reused buffer.
+    """
+    with open("tests/data/text_plain/valid__utf8_multibyte.txt",
+              "rb") as infile:
+        original_bytes = infile.read()
+        for chunksize in [1, 5, len(original_bytes), 1024]:
+            infile.seek(0)
+            chunks = b""
+            for chunk in iter_chunk_views(infile, chunksize):
+                assert 0 < len(chunk) <= chunksize
+                chunks += bytes(chunk)
+            assert chunks == original_bytes
+
+
+def test_map_in_processes():
+    """
+    Test that the function is called with the argument tuples in processes.
+    """
+    assert map_in_processes(divmod, [(7, 2), (9, 4), (1, 1)], 2) == \
+        [(3, 1), (2, 1), (1, 0)]